@@ -149,6 +149,17 @@ if [ $SYMLINK_FIX_FILES = "TRUE" ]; then
   --symlink"
 fi
 
+if [ -n "${EXTRN_MDL_MAX_WORKERS:-}" ] ; then
+  additional_flags="$additional_flags \
+  --max_workers ${EXTRN_MDL_MAX_WORKERS}"
+fi
+
+if [ -n "${EXTRN_MDL_CACHE_DIR:-}" ] ; then
+  additional_flags="$additional_flags \
+  --cache_dir ${EXTRN_MDL_CACHE_DIR} \
+  --cache_max_size ${EXTRN_MDL_CACHE_MAX_SIZE}"
+fi
+
 if [ $DO_ENSEMBLE == "TRUE" ] ; then
   mem_dir="/mem{mem:03d}"
   member_list=(1 ${NUM_ENS_MEMBERS})
@@ -44,28 +44,59 @@
 ################################################################################
 
 # -------------Import modules --------------------------#
-import pygrib
 import cartopy.crs as ccrs
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-import cartopy.feature as cfeature
 import matplotlib
 
 matplotlib.use("Agg")
-import io
 import matplotlib.pyplot as plt
 import dateutil.relativedelta, dateutil.parser
-from PIL import Image
 from matplotlib.gridspec import GridSpec
 import numpy as np
 import time, os, sys, multiprocessing
-import multiprocessing.pool
-from scipy import ndimage
-import pyproj
+import functools
+import math
 import argparse
-import cartopy
 import logging
 import warnings
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ush")
+)
+from plot_utils import (
+    DerivedFields,
+    GribReader,
+    ImageWriter,
+    IMAGE_FORMATS,
+    add_basemap,
+    barb_skip,
+    native_crs,
+    set_fft_workers,
+)
+
+# Plots made by this script, named as in their output files
+PLOTS = ["slp", "2mt", "2mdew", "10mwind", "sfcape", "500", "250wind", "qpf", "refc", "uh25"]
+
+# Fields of each plot (see plot_utils.derived.FIELDS), and the wind
+# components drawn as barbs
+PLOT_FIELDS = {
+    "slp": ["slp", "slpsmooth"],
+    "2mt": ["tmp2m"],
+    "2mdew": ["dew2m"],
+    "10mwind": ["uwind", "vwind", "wspd10m"],
+    "sfcape": ["cape", "cin"],
+    "500": ["z500", "vort500", "u500", "v500"],
+    "250wind": ["u250", "v250", "wspd250"],
+    "qpf": ["qpf"],
+    "refc": ["refc"],
+    "uh25": ["uh25"],
+}
+PLOT_BARBS = {
+    "10mwind": [("uwind", "vwind")],
+    "500": [("u500", "v500")],
+    "250wind": [("u250", "v250")],
+}
+
 # --------------Define some functions ------------------#
 
 
@@ -113,14 +144,27 @@ def clear_plotables(ax, keep_ax_lst, fig):
                 a.remove()
 
 
+# Writer of the images made by this process (see setup_image_writer)
+_image_writer = None
+
+
+def setup_image_writer(image_format="png", palette_colors=0, encode_threads=1):
+    """Set up the writer of the images made by this process"""
+
+    global _image_writer
+    _image_writer = ImageWriter(
+        image_format=image_format,
+        palette_colors=palette_colors,
+        dpi=150,
+        threads=encode_threads,
+    )
+
+
 def compress_and_save(filename):
     #### - compress and save the image - ####
-    ram = io.BytesIO()
-    plt.savefig(ram, format="png", bbox_inches="tight", dpi=150)
-    ram.seek(0)
-    im = Image.open(ram)
-    im2 = im.convert("RGB")  # .convert('P', palette=Image.ADAPTIVE)
-    im2.save(filename, format="PNG")
+    if _image_writer is None:
+        setup_image_writer()
+    _image_writer.save(plt.gcf(), filename)
 
 
 def cmap_t2m():
@@ -186,70 +230,6 @@ def cmap_q2m():
     return cmap_q2m_coltbl
 
 
-def rotate_wind(true_lat, lov_lon, earth_lons, uin, vin, proj, inverse=False):
-    #  Rotate winds from LCC relative to earth relative (or vice-versa if inverse==true)
-    #   This routine is vectorized and *should* work on any size 2D vg and ug arrays.
-    #   Program will quit if dimensions are too large.
-    #
-    # Input args:
-    #  true_lat = True latitidue for LCC projection (single value in degrees)
-    #  lov_lon  = The LOV value from grib (e.g. - -95.0) (single value in degrees)
-    #              Grib doc says: "Lov = orientation of the grid; i.e. the east longitude value of
-    #                              the meridian which is parallel to the Y-axis (or columns of the grid)
-    #                              along which latitude increases as the Y-coordinate increases (the
-    #                              orientation longitude may or may not appear on a particular grid).
-    #
-    #  earth_lons = Earth relative longitudes (can be an array, in degrees)
-    #  uin, vin     = Input winds to rotate
-    #
-    # Returns:
-    #  uout, vout = Output, rotated winds
-    # -----------------------------------------------------------------------------------------------------
-
-    # Get size and length of input u winds, if not 2d, raise an error
-    q = np.shape(uin)
-    ndims = len(q)
-    if ndims > 2:
-        # Raise error and quit!
-        raise SystemExit("Input winds for rotation have greater than 2 dimensions!")
-    if lov_lon > 0.0:
-        lov_lon = lov_lon - 360.0
-    dtr = np.pi / 180.0  # Degrees to radians
-
-    if not isinstance(inverse, bool):
-        raise TypeError("**kwarg inverse must be of type bool.")
-
-    # Compute rotation constant which is also
-    # known as the Lambert cone constant.  In the case
-    # of a polar stereographic projection, this is one.
-    # See the following pdf for excellent documentation
-    # http://www.dtcenter.org/met/users/docs/write_ups/velocity.pdf
-    if proj.lower() == "lcc":
-        rotcon_p = np.sin(true_lat * dtr)
-    elif proj.lower() in ["stere", "spstere", "npstere"]:
-        rotcon_p = 1.0
-    else:
-        raise SystemExit(
-            "Unsupported map projection: " + proj.lower() + " for wind rotation."
-        )
-
-    angles = rotcon_p * (earth_lons - lov_lon) * dtr
-    sinx2 = np.sin(angles)
-    cosx2 = np.cos(angles)
-
-    # Steps below are elementwise products, not matrix mutliplies
-    if inverse == False:
-        # Return the earth relative winds
-        uout = cosx2 * uin + sinx2 * vin
-        vout = -sinx2 * uin + cosx2 * vin
-    elif inverse == True:
-        # Return the grid relative winds
-        uout = cosx2 * uin - sinx2 * vin
-        vout = sinx2 * uin + cosx2 * vin
-
-    return uout, vout
-
-
 def setup_logging(debug=False):
 
     """Calls initialization functions for logging package, and sets the
@@ -263,6 +243,1175 @@ def setup_logging(debug=False):
     if debug:
         logging.info("Logging level set to DEBUG")
 
+def read_fields(grib_file, fhr, plots, earth_relative=True, cache_dir=None):
+    """Read the fields needed for the given plots from a post output file.
+
+    Args:
+        grib_file: path of the GRIB2 file for this forecast hour
+        fhr: forecast hour
+        plots: names of the plots to read fields for (see PLOTS)
+        earth_relative: rotate wind components from grid relative to Earth
+            relative; not needed when plotting in the native projection
+        cache_dir: directory in which to cache the derived fields, or None
+    Returns:
+        Dictionary of fields, including the grid, the spacing of the wind
+        barbs ("barb_skip") and the wind components at the barbs (the
+        wind's name followed by "_barbs")
+    """
+
+    t1a = time.perf_counter()
+
+    data1 = GribReader(grib_file)
+    derived = DerivedFields(data1, fhr, earth_relative, cache_dir)
+
+    # The grid is the same for every forecast hour, so it is only computed
+    # for the first one.
+    grid = derived.grid
+    fields = {"grid": grid, "barb_skip": barb_skip(grid.dx)}
+
+    for plot in plots:
+        if plot in ["qpf", "uh25"] and fhr == 0:
+            continue
+        try:
+            for name in PLOT_FIELDS[plot]:
+                fields[name] = derived[name]
+        except ValueError:
+            if plot != "500":
+                raise
+            fields["u500"] = None
+            fields["v500"] = None
+            continue
+        for u, v in PLOT_BARBS.get(plot, []):
+            fields[u + "_barbs"], fields[v + "_barbs"] = derived.barbs(u, v)
+
+    data1.close()
+
+    t2a = time.perf_counter()
+    t3a = round(t2a - t1a, 3)
+    logging.info(("%.3f seconds to read all messages") % t3a)
+
+    return fields
+
+
+class MapFigure:
+    """Figure and cartopy axes with the map background for one domain.
+
+    Setting up the map is expensive, so each process does it once per
+    domain and reuses the figure for every plot, clearing off the old
+    plottables in between.
+
+    With native=True, the map is drawn in the projection of the post grid
+    (when it is supported by native_crs()), so fields can be plotted in
+    their projected coordinates without being reprojected.
+    """
+
+    def __init__(self, dom, grid, cartopy_dir, basemap_cache_dir=None, native=False):
+
+        # Map corners for each domain
+        if dom == "conus":
+            llcrnrlon = -120.5
+            llcrnrlat = 21.0
+            urcrnrlon = -64.5
+            urcrnrlat = 49.0
+            lat_0 = 35.4
+            lon_0 = -97.6
+            extent = [llcrnrlon - 3, urcrnrlon - 6, llcrnrlat - 1, urcrnrlat + 2]
+        elif dom == "regional":
+            llcrnrlon = np.min(grid.lon)
+            llcrnrlat = np.min(grid.lat)
+            urcrnrlon = np.max(grid.lon)
+            urcrnrlat = np.max(grid.lat)
+            lat_0 = grid.lat_0
+            lon_0 = grid.lon_0
+            extent = [llcrnrlon, urcrnrlon, llcrnrlat - 1, urcrnrlat]
+
+        # create figure and axes instances
+        fig = plt.figure(figsize=(10, 10))
+        ax1 = fig.add_axes([0.1, 0.1, 0.8, 0.8])
+
+        # set up the map background with cartopy
+        myproj = native_crs(grid.projparams) if native else None
+        if native and myproj is None:
+            logging.warning(
+                "Projection of the post grid is not supported; plotting in lat/lon"
+            )
+        self.native = myproj is not None
+        if myproj is None:
+            myproj = ccrs.LambertConformal(
+                central_longitude=lon_0,
+                central_latitude=lat_0,
+                false_easting=0.0,
+                false_northing=0.0,
+                secant_latitudes=None,
+                standard_parallels=None,
+                globe=None,
+            )
+        ax = plt.axes(projection=myproj)
+        ax.set_extent(extent)
+        add_basemap(ax, cartopy_dir, basemap_cache_dir)
+
+        # Map/figure has been set up here, save axes instances for use again later
+        self.fig = fig
+        self.ax = ax
+        self.keep_ax_lst = ax.get_children()[:]
+        self.cbar = None
+
+    def clear(self):
+        """Clear off old plottables but keep all the map info, and make this
+        the current figure and axes"""
+
+        plt.figure(self.fig.number)
+        plt.sca(self.ax)
+        if self.cbar is not None:
+            self.cbar.remove()
+            self.cbar = None
+        clear_plotables(self.ax, self.keep_ax_lst, self.fig)
+
+    def colorbar(self, mappable, **kwargs):
+        """Add a colorbar, which is removed by the next clear()"""
+
+        self.cbar = plt.colorbar(mappable, **kwargs)
+        return self.cbar
+
+
+# Map figures set up by this process, keyed by domain and rendering mode
+_map_figures = {}
+
+
+def get_map_figure(dom, grid, cartopy_dir, basemap_cache_dir=None, native=False):
+    """Return the map figure for a domain, setting it up the first time"""
+
+    if (dom, native) not in _map_figures:
+        _map_figures[(dom, native)] = MapFigure(
+            dom, grid, cartopy_dir, basemap_cache_dir, native
+        )
+    return _map_figures[(dom, native)]
+
+
+# Coordinates of the wind barbs computed by this process, keyed by the
+# grid point coordinates and spacing
+_barb_points = {}
+
+
+def barb_points(x, y, skip):
+    """Return the coordinates of every skip-th grid point in each direction,
+    given 1-d (projected) or 2-d (lat/lon) coordinates of the grid points.
+    The coordinates are those of a cached grid, so the barb coordinates are
+    only computed once."""
+
+    key = (id(x), id(y), skip)
+    if key not in _barb_points:
+        if np.ndim(x) == 1:
+            points = np.meshgrid(x[::skip], y[::skip])
+        else:
+            points = (
+                np.ascontiguousarray(x[::skip, ::skip]),
+                np.ascontiguousarray(y[::skip, ::skip]),
+            )
+        # The coordinates are kept so that their ids are not reused
+        _barb_points[key] = (x, y, points)
+    return _barb_points[key][2]
+
+
+def plot_all(dom, fhr, fields, plots, args):
+    """Make the given plots for one domain and forecast hour.
+
+    Args:
+        dom: domain to plot, 'conus' or 'regional'
+        fhr: forecast hour
+        fields: fields read by read_fields()
+        plots: names of the plots to make (see PLOTS)
+        args: command line arguments
+    """
+
+    t1dom = time.perf_counter()
+
+    COMOUT = str(args.comout)
+    fhour = str(fhr).zfill(3)
+    itime = str(args.cycle)
+    vtime = ndate(itime, int(fhr))
+
+    grid = fields["grid"]
+
+    slp = fields.get("slp")
+    slpsmooth = fields.get("slpsmooth")
+    tmp2m = fields.get("tmp2m")
+    dew2m = fields.get("dew2m")
+    wspd10m = fields.get("wspd10m")
+    cape = fields.get("cape")
+    cin = fields.get("cin")
+    z500 = fields.get("z500")
+    vort500 = fields.get("vort500")
+    u500 = fields.get("u500")
+    wspd250 = fields.get("wspd250")
+    qpf = fields.get("qpf")
+    refc = fields.get("refc")
+    uh25 = fields.get("uh25")
+
+    m = get_map_figure(
+        dom, grid, str(args.cartopy_dir), args.basemap_cache_dir, args.native
+    )
+    ax = m.ax
+
+    if m.native:
+        # The map is in the projection of the post grid, so fields are drawn
+        # in projected coordinates (cell edges for pcolormesh, grid points
+        # for contours and barbs) and need no reprojection. Winds are grid
+        # relative (see read_fields).
+        transform = ax.projection
+        mesh_x, mesh_y = grid.x_edges, grid.y_edges
+        pts_x, pts_y = grid.x, grid.y
+    else:
+        # All lat lons are earth relative, so setup the associated projection correct for that data
+        transform = ccrs.PlateCarree()
+        mesh_x, mesh_y = grid.lon_shift, grid.lat_shift
+        pts_x, pts_y = grid.lon_shift, grid.lat_shift
+
+    ################################
+    # Plot SLP
+    ################################
+    if "slp" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on slp for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "mb"
+        clevs = [
+            976,
+            980,
+            984,
+            988,
+            992,
+            996,
+            1000,
+            1004,
+            1008,
+            1012,
+            1016,
+            1020,
+            1024,
+            1028,
+            1032,
+            1036,
+            1040,
+            1044,
+            1048,
+            1052,
+        ]
+        clevsdif = [-12, -10, -8, -6, -4, -2, 0, 2, 4, 6, 8, 10, 12]
+        cm = plt.cm.Spectral_r
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs1_a = plt.pcolormesh(
+            mesh_x, mesh_y, slp, transform=transform, cmap=cm, norm=norm
+        )
+        cbar1 = m.colorbar(
+            cs1_a, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        cs1_b = plt.contour(
+            pts_x,
+            pts_y,
+            slpsmooth,
+            np.arange(940, 1060, 4),
+            colors="black",
+            linewidths=1.25,
+            transform=transform,
+        )
+        plt.clabel(cs1_b, np.arange(940, 1060, 4), inline=1, fmt="%d", fontsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM SLP ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/slp_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot slp for: " + dom) % t3)
+
+    #################################
+    # Plot 2-m T
+    #################################
+    if "2mt" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on t2m for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "\xb0" "F"
+        clevs = np.linspace(-16, 134, 51)
+        cm = plt.cm.Spectral_r  # cmap_t2m()
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x, mesh_y, tmp2m, transform=transform, cmap=cm, norm=norm
+        )
+        cs_1.cmap.set_under("white")
+        cs_1.cmap.set_over("white")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=[-16, -4, 8, 20, 32, 44, 56, 68, 80, 92, 104, 116, 128],
+            extend="both",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 2-m Temperature ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/2mt_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot 2mt for: " + dom) % t3)
+
+    #################################
+    # Plot 2-m Dew Point
+    #################################
+    if "2mdew" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on 2mdew for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "\xb0" "F"
+        clevs = np.linspace(-5, 80, 35)
+        cm = cmap_q2m()
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x, mesh_y, dew2m, transform=transform, cmap=cm, norm=norm
+        )
+        cbar1 = m.colorbar(
+            cs_1, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 2-m Dew Point Temperature ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/2mdew_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot 2mdew for: " + dom) % t3)
+
+    #################################
+    # Plot 10-m WSPD
+    #################################
+    if "10mwind" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on 10mwspd for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "kts"
+        # Places a wind barb every ~180 km, optimized for CONUS domain
+        skip = fields["barb_skip"]
+        logging.info("skipping every " + str(skip) + " grid points to plot")
+        barblength = 4
+
+        clevs = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
+        colorlist = [
+            "turquoise",
+            "dodgerblue",
+            "blue",
+            "#FFF68F",
+            "#E3CF57",
+            "peru",
+            "brown",
+            "crimson",
+            "red",
+            "fuchsia",
+            "DarkViolet",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x,
+            mesh_y,
+            wspd10m,
+            transform=transform,
+            cmap=cm,
+            vmin=5,
+            norm=norm,
+        )
+        cs_1.cmap.set_under("white", alpha=0.0)
+        cs_1.cmap.set_over("black")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=clevs,
+            extend="max",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        plt.barbs(
+            *barb_points(pts_x, pts_y, skip),
+            fields["uwind_barbs"],
+            fields["vwind_barbs"],
+            length=barblength,
+            linewidth=0.5,
+            color="black",
+            transform=transform,
+        )
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 10-m Winds ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/10mwind_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot 10mwspd for: " + dom) % t3)
+
+    #################################
+    # Plot Surface-Based CAPE/CIN
+    #################################
+    if "sfcape" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on surface-based CAPE/CIN for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "J/kg"
+        clevs = [100, 250, 500, 1000, 1500, 2000, 2500, 3000, 3500, 4000, 4500, 5000]
+        clevs2 = [-2000, -500, -250, -100, -25]
+        colorlist = [
+            "blue",
+            "dodgerblue",
+            "cyan",
+            "mediumspringgreen",
+            "#FAFAD2",
+            "#EEEE00",
+            "#EEC900",
+            "darkorange",
+            "crimson",
+            "darkred",
+            "darkviolet",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x,
+            mesh_y,
+            cape,
+            transform=transform,
+            cmap=cm,
+            vmin=100,
+            norm=norm,
+        )
+        cs_1.cmap.set_under("white", alpha=0.0)
+        cs_1.cmap.set_over("black")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=clevs,
+            extend="max",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        cs_1b = plt.contourf(
+            pts_x,
+            pts_y,
+            cin,
+            clevs2,
+            colors="none",
+            hatches=["**", "++", "////", ".."],
+            transform=transform,
+        )
+        ax.text(
+            0.5,
+            1.05,
+            "FV3-LAM Surface-Based CAPE (shaded) and CIN (hatched) ("
+            + units
+            + ") \n <-500 (*), -500<-250 (+), -250<-100 (/), -100<-25 (.) \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/sfcape_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot surface-based CAPE/CIN for: " + dom) % t3)
+
+    #################################
+    # Plot 500 mb HGT/WIND/VORT
+    #################################
+    if "500" in plots and u500 is not None:
+        t1 = time.perf_counter()
+        logging.info(("Working on 500 mb Hgt/Wind/Vort for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "x10${^5}$ s${^{-1}}$"
+        skip = fields["barb_skip"]
+        barblength = 4
+
+        vortlevs = [16, 20, 24, 28, 32, 36, 40]
+        colorlist = ["yellow", "gold", "goldenrod", "orange", "orangered", "red"]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(vortlevs, cm.N)
+
+        cs1_a = plt.pcolormesh(
+            mesh_x, mesh_y, vort500, transform=transform, cmap=cm, norm=norm
+        )
+        cs1_a.cmap.set_under("white")
+        cs1_a.cmap.set_over("darkred")
+        cbar1 = m.colorbar(
+            cs1_a,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=vortlevs,
+            extend="both",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        plt.barbs(
+            *barb_points(pts_x, pts_y, skip),
+            fields["u500_barbs"],
+            fields["v500_barbs"],
+            length=barblength,
+            linewidth=0.5,
+            color="steelblue",
+            transform=transform,
+        )
+        cs1_b = plt.contour(
+            pts_x,
+            pts_y,
+            z500,
+            np.arange(486, 600, 6),
+            colors="black",
+            linewidths=1,
+            transform=transform,
+        )
+        plt.clabel(
+            cs1_b, np.arange(486, 600, 6), inline_spacing=1, fmt="%d", fontsize=8
+        )
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 500 mb Heights (dam), Winds (kts), and $\zeta$ ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/500_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot 500 mb Hgt/Wind/Vort for: " + dom) % t3)
+
+    #################################
+    # Plot 250 mb WIND
+    #################################
+    if "250wind" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on 250 mb WIND for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "kts"
+        skip = fields["barb_skip"]
+
+        barblength = 4
+
+        clevs = [50, 60, 70, 80, 90, 100, 110, 120, 130, 140, 150]
+        colorlist = [
+            "turquoise",
+            "deepskyblue",
+            "dodgerblue",
+            "#1874CD",
+            "blue",
+            "beige",
+            "khaki",
+            "peru",
+            "brown",
+            "crimson",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x,
+            mesh_y,
+            wspd250,
+            transform=transform,
+            cmap=cm,
+            vmin=50,
+            norm=norm,
+        )
+        cs_1.cmap.set_under("white", alpha=0.0)
+        cs_1.cmap.set_over("red")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=clevs,
+            extend="max",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        plt.barbs(
+            *barb_points(pts_x, pts_y, skip),
+            fields["u250_barbs"],
+            fields["v250_barbs"],
+            length=barblength,
+            linewidth=0.5,
+            color="black",
+            transform=transform,
+        )
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 250 mb Winds ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/250wind_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot 250 mb WIND for: " + dom) % t3)
+
+    #################################
+    # Plot Total QPF
+    #################################
+    if "qpf" in plots and fhr > 0:  # Do not make total QPF plot for forecast hour 0
+        t1 = time.perf_counter()
+        logging.info(("Working on total qpf for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "in"
+        clevs = [
+            0.01,
+            0.1,
+            0.25,
+            0.5,
+            0.75,
+            1,
+            1.25,
+            1.5,
+            1.75,
+            2,
+            2.5,
+            3,
+            4,
+            5,
+            7,
+            10,
+            15,
+            20,
+        ]
+        clevsdif = [-3, -2.5, -2, -1.5, -1, -0.5, 0, 0.5, 1, 1.5, 2, 2.5, 3]
+        colorlist = [
+            "chartreuse",
+            "limegreen",
+            "green",
+            "blue",
+            "dodgerblue",
+            "deepskyblue",
+            "cyan",
+            "mediumpurple",
+            "mediumorchid",
+            "darkmagenta",
+            "darkred",
+            "crimson",
+            "orangered",
+            "darkorange",
+            "goldenrod",
+            "gold",
+            "yellow",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x,
+            mesh_y,
+            qpf,
+            transform=transform,
+            cmap=cm,
+            vmin=0.01,
+            norm=norm,
+        )
+        cs_1.cmap.set_under("white", alpha=0.0)
+        cs_1.cmap.set_over("pink")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=clevs,
+            extend="max",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.set_xticklabels(clevs)
+        cbar1.ax.tick_params(labelsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM "
+            + fhour
+            + "-hr Accumulated Precipitation ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/qpf_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot total qpf for: " + dom) % t3)
+
+    #################################
+    # Plot composite reflectivity
+    #################################
+    if "refc" in plots:
+        t1 = time.perf_counter()
+        logging.info(("Working on composite reflectivity for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "dBZ"
+        clevs = np.linspace(5, 70, 14)
+        clevsdif = [20, 1000]
+        colorlist = [
+            "turquoise",
+            "dodgerblue",
+            "mediumblue",
+            "lime",
+            "limegreen",
+            "green",
+            "#EEEE00",
+            "#EEC900",
+            "darkorange",
+            "red",
+            "firebrick",
+            "darkred",
+            "fuchsia",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x, mesh_y, refc, transform=transform, cmap=cm, vmin=5, norm=norm
+        )
+        cs_1.cmap.set_under("white", alpha=0.0)
+        cs_1.cmap.set_over("black")
+        cbar1 = m.colorbar(
+            cs_1,
+            orientation="horizontal",
+            pad=0.05,
+            shrink=0.6,
+            ticks=clevs,
+            extend="max",
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM Composite Reflectivity ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/refc_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot composite reflectivity for: " + dom) % t3)
+
+    #################################
+    # Plot Max/Min Hourly 2-5 km UH
+    #################################
+    if "uh25" in plots and fhr > 0:  # Do not make max/min hourly 2-5 km UH plot for forecast hour 0
+        t1 = time.perf_counter()
+        logging.info(("Working on Max/Min Hourly 2-5 km UH for " + dom))
+
+        # Clear off old plottables but keep all the map info
+        m.clear()
+
+        units = "m${^2}$ s$^{-2}$"
+        clevs = [
+            -150,
+            -100,
+            -75,
+            -50,
+            -25,
+            -10,
+            0,
+            10,
+            25,
+            50,
+            75,
+            100,
+            150,
+            200,
+            250,
+            300,
+        ]
+        #   alternative colormap for just max UH if you don't want to plot the min UH too
+        #     colorlist = ['white','skyblue','mediumblue','green','orchid','firebrick','#EEC900','DarkViolet']
+        colorlist = [
+            "blue",
+            "#1874CD",
+            "dodgerblue",
+            "deepskyblue",
+            "turquoise",
+            "#E5E5E5",
+            "#E5E5E5",
+            "#EEEE00",
+            "#EEC900",
+            "darkorange",
+            "orangered",
+            "red",
+            "firebrick",
+            "mediumvioletred",
+            "darkviolet",
+        ]
+        cm = matplotlib.colors.ListedColormap(colorlist)
+        norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
+
+        cs_1 = plt.pcolormesh(
+            mesh_x, mesh_y, uh25, transform=transform, cmap=cm, norm=norm
+        )
+        cs_1.cmap.set_under("darkblue")
+        cs_1.cmap.set_over("black")
+        cbar1 = m.colorbar(
+            cs_1, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
+        )
+        cbar1.set_label(units, fontsize=8)
+        cbar1.ax.tick_params(labelsize=8)
+        ax.text(
+            0.5,
+            1.03,
+            "FV3-LAM 1-h Max/Min 2-5 km Updraft Helicity ("
+            + units
+            + ") \n initialized: "
+            + itime
+            + " valid: "
+            + vtime
+            + " (f"
+            + fhour
+            + ")",
+            horizontalalignment="center",
+            fontsize=8,
+            transform=ax.transAxes,
+            bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
+        )
+
+        compress_and_save(
+            COMOUT + "/uh25_" + dom + "_f" + fhour + ".png"
+        )
+        t2 = time.perf_counter()
+        t3 = round(t2 - t1, 3)
+        logging.info(("%.3f seconds to plot Max/Min Hourly 2-5 km UH for: " + dom) % t3)
+
+    ######################################################
+
+    t2 = time.perf_counter()
+    t3dom = round(t2 - t1dom, 3)
+    logging.info(("%.3f seconds to plot all variables for forecast hour " + fhour) % t3dom)
+
+
+def post_file(args, fhr):
+    """Return the path of the post file of a forecast hour"""
+
+    cyc = str(args.cycle)[8:10]
+    return (
+        str(args.comout)
+        + "/rrfs.t"
+        + cyc
+        + "z.prslev.f"
+        + str(fhr).zfill(3)
+        + "."
+        + str(args.domain).lower()
+        + ".grib2"
+    )
+
+
+def post_file_complete(path, sizes, settle_secs):
+    """Return whether a post file has been completely written: it ends
+    with the end section of a GRIB message, and its size has not changed
+    since the last check (sizes holds the size of each file at the last
+    check) or it has not been modified for settle_secs seconds"""
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    last_size = sizes.get(path)
+    sizes[path] = st.st_size
+    if st.st_size < 4:
+        return False
+    if last_size != st.st_size and time.time() - st.st_mtime < settle_secs:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return f.read(4) == b"7777"
+
+
+def follow_post_files(args, fhours, poll_secs=10, timeout_secs=3600):
+    """Wait for the post files of the given forecast hours, and yield each
+    forecast hour as soon as its file is complete. The timeout only starts
+    with the first complete file, so that the forecast can be queued and
+    spun up for as long as it takes.
+
+    Raises:
+        TimeoutError: if no new file is complete for timeout_secs seconds
+            after a first one
+    """
+
+    waiting = {fhr: post_file(args, fhr) for fhr in fhours}
+    sizes = {}
+    last_found = None
+    while waiting:
+        found = [
+            fhr
+            for fhr, path in waiting.items()
+            if post_file_complete(path, sizes, poll_secs)
+        ]
+        for fhr in found:
+            del waiting[fhr]
+            yield fhr
+        if found:
+            last_found = time.time()
+        elif last_found is not None and time.time() - last_found > timeout_secs:
+            raise TimeoutError(
+                f"No new post file in {timeout_secs} seconds; still waiting for "
+                f"forecast hours {list(waiting)} in {args.comout}"
+            )
+        if waiting:
+            time.sleep(poll_secs)
+
+
+def follow(args, fhours, nprocs):
+    """Make the plots of each forecast hour as soon as its post file is
+    written, until all forecast hours are plotted. The plotting processes
+    (or this process, if nprocs is 1) keep their map figures from one
+    forecast hour to the next."""
+
+    logging.info(f"Following post files in {args.comout}")
+    if nprocs == 1:
+        setup_image_writer(args.image_format, args.palette_colors, args.encode_threads)
+        set_fft_workers(os.cpu_count() or 1)
+        for fhr in follow_post_files(args, fhours, args.poll_secs, args.follow_timeout):
+            for task in plot_tasks([fhr], nprocs):
+                plot_fhr(args, task)
+        _image_writer.close()
+        return
+
+    results = []
+    with multiprocessing.Pool(
+        nprocs, initializer=setup_worker, initargs=(args, nprocs)
+    ) as pool:
+        for fhr in follow_post_files(args, fhours, args.poll_secs, args.follow_timeout):
+            for task in plot_tasks([fhr], nprocs):
+                results.append(pool.apply_async(plot_fhr, (args, task)))
+            # Stop on the first failed task
+            for result in [r for r in results if r.ready()]:
+                result.get()
+                results.remove(result)
+        for result in results:
+            result.get()
+
+
+def plot_fhr(args, task):
+    """Read the fields for, and make, a set of plots for one forecast hour
+    on all domains. This is the unit of work handed to each process.
+
+    Args:
+        args: command line arguments
+        task: tuple of (forecast hour, names of the plots to make)
+    """
+
+    fhr, plots = task
+    fhour = str(fhr).zfill(3)
+    logging.info("Working on forecast hour " + fhour + ": " + ", ".join(plots))
+
+    grib_file = post_file(args, fhr)
+    fields = read_fields(
+        grib_file,
+        fhr,
+        plots,
+        earth_relative=not args.native,
+        cache_dir=args.field_cache_dir,
+    )
+
+    # Specify plotting domains
+    # User can add domains here, just need to specify lat/lon information in
+    # MapFigure (if dom == 'conus' block)
+    for dom in args.plot_domains:
+        plot_all(dom, fhr, fields, plots, args)
+
+    # Make sure the images are written before the task is done
+    _image_writer.wait()
+
+
+def plot_tasks(fhours, nprocs):
+    """Split the plots to make into tasks for plot_fhr(). Each task covers
+    all plots for one forecast hour, unless there are more processes than
+    forecast hours; then the plots of each hour are split into just enough
+    groups to keep every process busy, since each task reads its post
+    file again."""
+
+    ngroups = min(len(PLOTS), math.ceil(nprocs / len(fhours)))
+    if ngroups <= 1:
+        return [(fhr, PLOTS) for fhr in fhours]
+    return [(fhr, PLOTS[i::ngroups]) for fhr in fhours for i in range(ngroups)]
+
+
+def setup_worker(args, nprocs):
+    """Initialize one of nprocs plotting processes"""
+
+    setup_logging(args.debug)
+    warnings.simplefilter("ignore")
+    setup_image_writer(args.image_format, args.palette_colors, args.encode_threads)
+    # Share the cores between the processes' FFTs
+    set_fft_workers((os.cpu_count() or 1) // nprocs)
+
+
 # -------------Start of script -------------------------#
 if __name__ == "__main__":
 
@@ -301,6 +1450,16 @@ if __name__ == "__main__":
         help="Path to base directory of cartopy shapefiles.",
         required=True,
     )
+    parser.add_argument(
+        "--basemap-cache-dir",
+        help="Directory in which to cache rendered map backgrounds.",
+        required=False,
+    )
+    parser.add_argument(
+        "--field-cache-dir",
+        help="Directory in which to cache the fields derived from the post files.",
+        required=False,
+    )
     parser.add_argument(
         "--domain",
         "-d",
@@ -315,6 +1474,58 @@ if __name__ == "__main__":
         help="Name of domain to plot (either 'conus' or 'regional' or both).",
         required=False,
     )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="Draw the maps in the projection of the post grid, so that fields "
+        "are plotted without being reprojected.",
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=list(IMAGE_FORMATS),
+        default="png",
+        help="Format of the images.",
+    )
+    parser.add_argument(
+        "--palette-colors",
+        type=int,
+        default=0,
+        help="Number of colors (up to 256) of palette PNG images; 0 writes RGB PNG images.",
+    )
+    parser.add_argument(
+        "--encode-threads",
+        type=int,
+        default=1,
+        help="Number of threads per process encoding images while the next "
+        "plots are drawn; 0 encodes each image before drawing the next.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Wait for the post files of the forecast hours to be written, and "
+        "plot each forecast hour as soon as its file is complete.",
+    )
+    parser.add_argument(
+        "--poll-secs",
+        type=int,
+        default=10,
+        help="With --follow, seconds between checks for new post files.",
+    )
+    parser.add_argument(
+        "--follow-timeout",
+        type=int,
+        default=3600,
+        help="With --follow, seconds to wait for the next post file before giving up, "
+        "counted from the first post file found.",
+    )
+    parser.add_argument(
+        "--nprocs",
+        "-n",
+        type=int,
+        default=1,
+        help="Number of processes to make the plots with.",
+        required=False,
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -348,1072 +1559,23 @@ if __name__ == "__main__":
         fhours = np.linspace(start_fhr, end_fhr, num, dtype="int")
     logging.info(fhours)
     
-    COMOUT = str(args.comout)
-    CARTOPY_DIR = str(args.cartopy_dir)
-    POST_OUTPUT_DOMAIN_NAME = str(args.domain).lower()
-    
-    # Loop over forecast hours
-    for fhr in fhours:
-        fhour = str(fhr).zfill(3)
-        logging.info("Working on forecast hour " + fhour)
-        itime = ymdh
-        vtime = ndate(itime, int(fhr))
-    
-        # Define the location of the input file
-        data1 = pygrib.open(
-            COMOUT
-            + "/rrfs.t"
-            + cyc
-            + "z.prslev.f"
-            + fhour
-            + "."
-            + POST_OUTPUT_DOMAIN_NAME
-            + ".grib2"
-        )
-    
-        # Get the lats and lons
-        grids = [data1]
-        lats = []
-        lons = []
-        lats_shift = []
-        lons_shift = []
-    
-        for data in grids:
-            # Unshifted grid for contours and wind barbs
-            lat, lon = data[1].latlons()
-            lats.append(lat)
-            lons.append(lon)
-    
-            # Shift grid for pcolormesh
-            lat1 = data[1]["latitudeOfFirstGridPointInDegrees"]
-            lon1 = data[1]["longitudeOfFirstGridPointInDegrees"]
-            try:
-                nx = data[1]["Nx"]
-                ny = data[1]["Ny"]
-            except:
-                nx = data[1]["Ni"]
-                ny = data[1]["Nj"]
-            dx = data[1]["DxInMetres"]
-            dy = data[1]["DyInMetres"]
-            pj = pyproj.Proj(data[1].projparams)
-            llcrnrx, llcrnry = pj(lon1, lat1)
-            llcrnrx = llcrnrx - (dx / 2.0)
-            llcrnry = llcrnry - (dy / 2.0)
-            x = llcrnrx + dx * np.arange(nx)
-            y = llcrnry + dy * np.arange(ny)
-            x, y = np.meshgrid(x, y)
-            lon, lat = pj(x, y, inverse=True)
-            lats_shift.append(lat)
-            lons_shift.append(lon)
-    
-        # Unshifted lat/lon arrays grabbed directly using latlons() method
-        lat = lats[0]
-        lon = lons[0]
-    
-        # Shifted lat/lon arrays for pcolormesh
-        lat_shift = lats_shift[0]
-        lon_shift = lons_shift[0]
-    
-        Lat0 = data1[1]["LaDInDegrees"]
-        Lon0 = data1[1]["LoVInDegrees"]
-        logging.info(Lat0)
-        logging.info(Lon0)
-    
-        # Specify plotting domains
-        # User can add domains here, just need to specify lat/lon information below
-        # (if dom == 'conus' block)
-        domains = args.plot_domains  # Other option is 'regional'
-    
-        ###################################################
-        # Read in all variables and calculate differences #
-        ###################################################
-        t1a = time.perf_counter()
-    
-        # Sea level pressure
-        slp = data1.select(name="Pressure reduced to MSL")[0].values * 0.01
-        slpsmooth = ndimage.gaussian_filter(slp, 13.78)
-    
-        # 2-m temperature
-        tmp2m = data1.select(name="2 metre temperature")[0].values
-        tmp2m = (tmp2m - 273.15) * 1.8 + 32.0
-    
-        # 2-m dew point temperature
-        dew2m = data1.select(name="2 metre dewpoint temperature")[0].values
-        dew2m = (dew2m - 273.15) * 1.8 + 32.0
-    
-        # 10-m wind speed
-        uwind = data1.select(name="10 metre U wind component")[0].values * 1.94384
-        vwind = data1.select(name="10 metre V wind component")[0].values * 1.94384
-        # Rotate winds from grid relative to Earth relative
-        uwind, vwind = rotate_wind(Lat0, Lon0, lon, uwind, vwind, "lcc", inverse=False)
-        wspd10m = np.sqrt(uwind**2 + vwind**2)
-    
-        # Surface-based CAPE
-        cape = data1.select(
-            name="Convective available potential energy", typeOfLevel="surface"
-        )[0].values
-    
-        # Surface-based CIN
-        cin = data1.select(name="Convective inhibition", typeOfLevel="surface")[0].values
-    
-        # 500 mb height, wind, vorticity
-        try:
-            z500 = data1.select(name="Geopotential Height", level=500)[0].values * 0.1
-            z500 = ndimage.gaussian_filter(z500, 6.89)
-            vort500 = data1.select(name="Absolute vorticity", level=500)[0].values * 100000
-            vort500 = ndimage.gaussian_filter(vort500, 1.7225)
-            vort500[vort500 > 1000] = 0  # Mask out undefined values on domain edge
-            u500 = data1.select(name="U component of wind", level=500)[0].values * 1.94384
-            v500 = data1.select(name="V component of wind", level=500)[0].values * 1.94384
-            # Rotate winds from grid relative to Earth relative
-            u500, v500 = rotate_wind(Lat0, Lon0, lon, u500, v500, "lcc", inverse=False)
-        except:
-            u500 = None
-            v500 = None
-    
-        # 250 mb winds
-        u250 = data1.select(name="U component of wind", level=250)[0].values * 1.94384
-        v250 = data1.select(name="V component of wind", level=250)[0].values * 1.94384
-        # Rotate winds from grid relative to Earth relative
-        u250, v250 = rotate_wind(Lat0, Lon0, lon, u250, v250, "lcc", inverse=False)
-        wspd250 = np.sqrt(u250**2 + v250**2)
-    
-        # Total precipitation
-        qpf = (
-            data1.select(name="Total Precipitation", lengthOfTimeRange=fhr)[0].values
-            * 0.0393701
-        )
-    
-        # Composite reflectivity
-        refc = data1.select(name="Maximum/Composite radar reflectivity")[0].values
-    
-        if fhr > 0:
-            # Max/Min Hourly 2-5 km Updraft Helicity
-            maxuh25 = data1.select(
-                stepType="max", parameterName="199", topLevel=5000, bottomLevel=2000
-            )[0].values
-            minuh25 = data1.select(
-                stepType="min", parameterName="200", topLevel=5000, bottomLevel=2000
-            )[0].values
-            maxuh25[maxuh25 < 10] = 0
-            minuh25[minuh25 > -10] = 0
-            uh25 = maxuh25 + minuh25
-    
-        t2a = time.perf_counter()
-        t3a = round(t2a - t1a, 3)
-        logging.info(("%.3f seconds to read all messages") % t3a)
-    
-        ########################################
-        #    START PLOTTING FOR EACH DOMAIN    #
-        ########################################
-    
-        def main():
-    
-            # Number of processes must coincide with the number of domains to plot
-            # pool = multiprocessing.Pool(len(domains))
-            # pool.map(plot_all,domains)
-    
-            # To avoid import multiprocessing recursively on MacOS etc.
-            # Anyway since we only have one domain for SRW application
-            for dom in domains:
-                plot_all(dom)
-    
-        def plot_all(dom):
-    
-            t1dom = time.perf_counter()
-    
-            # Map corners for each domain
-            if dom == "conus":
-                llcrnrlon = -120.5
-                llcrnrlat = 21.0
-                urcrnrlon = -64.5
-                urcrnrlat = 49.0
-                lat_0 = 35.4
-                lon_0 = -97.6
-                extent = [llcrnrlon - 3, urcrnrlon - 6, llcrnrlat - 1, urcrnrlat + 2]
-            elif dom == "regional":
-                llcrnrlon = np.min(lon)
-                llcrnrlat = np.min(lat)
-                urcrnrlon = np.max(lon)
-                urcrnrlat = np.max(lat)
-                lat_0 = Lat0
-                lon_0 = Lon0
-                extent = [llcrnrlon, urcrnrlon, llcrnrlat - 1, urcrnrlat]
-    
-            # create figure and axes instances
-            fig = plt.figure(figsize=(10, 10))
-            ax1 = fig.add_axes([0.1, 0.1, 0.8, 0.8])
-    
-            # Define where Cartopy Maps are located
-            cartopy.config["data_dir"] = CARTOPY_DIR
-    
-            back_res = "50m"
-            back_img = "on"
-    
-            # set up the map background with cartopy
-            myproj = ccrs.LambertConformal(
-                central_longitude=lon_0,
-                central_latitude=lat_0,
-                false_easting=0.0,
-                false_northing=0.0,
-                secant_latitudes=None,
-                standard_parallels=None,
-                globe=None,
-            )
-            ax = plt.axes(projection=myproj)
-            ax.set_extent(extent)
-    
-            fline_wd = 0.5  # line width
-            falpha = 0.3  # transparency
-    
-            # natural_earth
-            #  land=cfeature.NaturalEarthFeature('physical','land',back_res,
-            #                    edgecolor='face',facecolor=cfeature.COLORS['land'],
-            #                    alpha=falpha)
-            lakes = cfeature.NaturalEarthFeature(
-                "physical",
-                "lakes",
-                back_res,
-                edgecolor="blue",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
-            coastline = cfeature.NaturalEarthFeature(
-                "physical",
-                "coastline",
-                back_res,
-                edgecolor="blue",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
-            states = cfeature.NaturalEarthFeature(
-                "cultural",
-                "admin_1_states_provinces",
-                back_res,
-                edgecolor="black",
-                facecolor="none",
-                linewidth=fline_wd,
-                linestyle=":",
-                alpha=falpha,
-            )
-            borders = cfeature.NaturalEarthFeature(
-                "cultural",
-                "admin_0_countries",
-                back_res,
-                edgecolor="red",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
-    
-            # All lat lons are earth relative, so setup the associated projection correct for that data
-            transform = ccrs.PlateCarree()
-    
-            # high-resolution background images
-            if back_img == "on":
-                img = plt.imread(CARTOPY_DIR + "/raster_files/NE1_50M_SR_W.tif")
-                ax.imshow(img, origin="upper", transform=transform)
-    
-            #  ax.add_feature(land)
-            ax.add_feature(lakes)
-            ax.add_feature(states)
-            ax.add_feature(borders)
-            ax.add_feature(coastline)
-    
-            # Map/figure has been set up here, save axes instances for use again later
-            keep_ax_lst = ax.get_children()[:]
-    
-            ################################
-            # Plot SLP
-            ################################
-            t1 = time.perf_counter()
-            logging.info(("Working on slp for " + dom))
-    
-            units = "mb"
-            clevs = [
-                976,
-                980,
-                984,
-                988,
-                992,
-                996,
-                1000,
-                1004,
-                1008,
-                1012,
-                1016,
-                1020,
-                1024,
-                1028,
-                1032,
-                1036,
-                1040,
-                1044,
-                1048,
-                1052,
-            ]
-            clevsdif = [-12, -10, -8, -6, -4, -2, 0, 2, 4, 6, 8, 10, 12]
-            cm = plt.cm.Spectral_r
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs1_a = plt.pcolormesh(
-                lon_shift, lat_shift, slp, transform=transform, cmap=cm, norm=norm
-            )
-            cbar1 = plt.colorbar(
-                cs1_a, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            cs1_b = plt.contour(
-                lon_shift,
-                lat_shift,
-                slpsmooth,
-                np.arange(940, 1060, 4),
-                colors="black",
-                linewidths=1.25,
-                transform=transform,
-            )
-            plt.clabel(cs1_b, np.arange(940, 1060, 4), inline=1, fmt="%d", fontsize=8)
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM SLP ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/slp_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot slp for: " + dom) % t3)
-    
-            #################################
-            # Plot 2-m T
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on t2m for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "\xb0" "F"
-            clevs = np.linspace(-16, 134, 51)
-            cm = plt.cm.Spectral_r  # cmap_t2m()
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift, lat_shift, tmp2m, transform=transform, cmap=cm, norm=norm
-            )
-            cs_1.cmap.set_under("white")
-            cs_1.cmap.set_over("white")
-            cbar1 = plt.colorbar(
-                cs_1,
-                orientation="horizontal",
-                pad=0.05,
-                shrink=0.6,
-                ticks=[-16, -4, 8, 20, 32, 44, 56, 68, 80, 92, 104, 116, 128],
-                extend="both",
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM 2-m Temperature ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/2mt_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot 2mt for: " + dom) % t3)
-    
-            #################################
-            # Plot 2-m Dew Point
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on 2mdew for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "\xb0" "F"
-            clevs = np.linspace(-5, 80, 35)
-            cm = cmap_q2m()
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift, lat_shift, dew2m, transform=transform, cmap=cm, norm=norm
-            )
-            cbar1 = plt.colorbar(
-                cs_1, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM 2-m Dew Point Temperature ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/2mdew_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot 2mdew for: " + dom) % t3)
-    
-            #################################
-            # Plot 10-m WSPD
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on 10mwspd for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "kts"
-            # Places a wind barb every ~180 km, optimized for CONUS domain
-            skip = round(177.28 * (dx / 1000.0) ** -0.97)
-            logging.info("skipping every " + str(skip) + " grid points to plot")
-            barblength = 4
-    
-            clevs = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
-            colorlist = [
-                "turquoise",
-                "dodgerblue",
-                "blue",
-                "#FFF68F",
-                "#E3CF57",
-                "peru",
-                "brown",
-                "crimson",
-                "red",
-                "fuchsia",
-                "DarkViolet",
-            ]
-            cm = matplotlib.colors.ListedColormap(colorlist)
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift,
-                lat_shift,
-                wspd10m,
-                transform=transform,
-                cmap=cm,
-                vmin=5,
-                norm=norm,
-            )
-            cs_1.cmap.set_under("white", alpha=0.0)
-            cs_1.cmap.set_over("black")
-            cbar1 = plt.colorbar(
-                cs_1,
-                orientation="horizontal",
-                pad=0.05,
-                shrink=0.6,
-                ticks=clevs,
-                extend="max",
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            plt.barbs(
-                lon_shift[::skip, ::skip],
-                lat_shift[::skip, ::skip],
-                uwind[::skip, ::skip],
-                vwind[::skip, ::skip],
-                length=barblength,
-                linewidth=0.5,
-                color="black",
-                transform=transform,
-            )
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM 10-m Winds ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/10mwind_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot 10mwspd for: " + dom) % t3)
-    
-            #################################
-            # Plot Surface-Based CAPE/CIN
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on surface-based CAPE/CIN for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "J/kg"
-            clevs = [100, 250, 500, 1000, 1500, 2000, 2500, 3000, 3500, 4000, 4500, 5000]
-            clevs2 = [-2000, -500, -250, -100, -25]
-            colorlist = [
-                "blue",
-                "dodgerblue",
-                "cyan",
-                "mediumspringgreen",
-                "#FAFAD2",
-                "#EEEE00",
-                "#EEC900",
-                "darkorange",
-                "crimson",
-                "darkred",
-                "darkviolet",
-            ]
-            cm = matplotlib.colors.ListedColormap(colorlist)
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift,
-                lat_shift,
-                cape,
-                transform=transform,
-                cmap=cm,
-                vmin=100,
-                norm=norm,
-            )
-            cs_1.cmap.set_under("white", alpha=0.0)
-            cs_1.cmap.set_over("black")
-            cbar1 = plt.colorbar(
-                cs_1,
-                orientation="horizontal",
-                pad=0.05,
-                shrink=0.6,
-                ticks=clevs,
-                extend="max",
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            cs_1b = plt.contourf(
-                lon_shift,
-                lat_shift,
-                cin,
-                clevs2,
-                colors="none",
-                hatches=["**", "++", "////", ".."],
-                transform=transform,
-            )
-            ax.text(
-                0.5,
-                1.05,
-                "FV3-LAM Surface-Based CAPE (shaded) and CIN (hatched) ("
-                + units
-                + ") \n <-500 (*), -500<-250 (+), -250<-100 (/), -100<-25 (.) \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/sfcape_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot surface-based CAPE/CIN for: " + dom) % t3)
-    
-            #################################
-            # Plot 500 mb HGT/WIND/VORT
-            #################################
-            if u500 is not None:
-                t1 = time.perf_counter()
-                logging.info(("Working on 500 mb Hgt/Wind/Vort for " + dom))
-    
-                # Clear off old plottables but keep all the map info
-                cbar1.remove()
-                clear_plotables(ax, keep_ax_lst, fig)
-    
-                units = "x10${^5}$ s${^{-1}}$"
-                skip = round(177.28 * (dx / 1000.0) ** -0.97)
-                barblength = 4
-    
-                vortlevs = [16, 20, 24, 28, 32, 36, 40]
-                colorlist = ["yellow", "gold", "goldenrod", "orange", "orangered", "red"]
-                cm = matplotlib.colors.ListedColormap(colorlist)
-                norm = matplotlib.colors.BoundaryNorm(vortlevs, cm.N)
-    
-                cs1_a = plt.pcolormesh(
-                    lon_shift, lat_shift, vort500, transform=transform, cmap=cm, norm=norm
-                )
-                cs1_a.cmap.set_under("white")
-                cs1_a.cmap.set_over("darkred")
-                cbar1 = plt.colorbar(
-                    cs1_a,
-                    orientation="horizontal",
-                    pad=0.05,
-                    shrink=0.6,
-                    ticks=vortlevs,
-                    extend="both",
-                )
-                cbar1.set_label(units, fontsize=8)
-                cbar1.ax.tick_params(labelsize=8)
-                plt.barbs(
-                    lon_shift[::skip, ::skip],
-                    lat_shift[::skip, ::skip],
-                    u500[::skip, ::skip],
-                    v500[::skip, ::skip],
-                    length=barblength,
-                    linewidth=0.5,
-                    color="steelblue",
-                    transform=transform,
-                )
-                cs1_b = plt.contour(
-                    lon_shift,
-                    lat_shift,
-                    z500,
-                    np.arange(486, 600, 6),
-                    colors="black",
-                    linewidths=1,
-                    transform=transform,
-                )
-                plt.clabel(
-                    cs1_b, np.arange(486, 600, 6), inline_spacing=1, fmt="%d", fontsize=8
-                )
-                ax.text(
-                    0.5,
-                    1.03,
-                    "FV3-LAM 500 mb Heights (dam), Winds (kts), and $\zeta$ ("
-                    + units
-                    + ") \n initialized: "
-                    + itime
-                    + " valid: "
-                    + vtime
-                    + " (f"
-                    + fhour
-                    + ")",
-                    horizontalalignment="center",
-                    fontsize=8,
-                    transform=ax.transAxes,
-                    bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-                )
-    
-                compress_and_save(
-                    COMOUT + "/500_" + dom + "_f" + fhour + ".png"
-                )
-                t2 = time.perf_counter()
-                t3 = round(t2 - t1, 3)
-                logging.info(("%.3f seconds to plot 500 mb Hgt/Wind/Vort for: " + dom) % t3)
-    
-            #################################
-            # Plot 250 mb WIND
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on 250 mb WIND for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "kts"
-            skip = round(177.28 * (dx / 1000.0) ** -0.97)
-    
-            barblength = 4
-    
-            clevs = [50, 60, 70, 80, 90, 100, 110, 120, 130, 140, 150]
-            colorlist = [
-                "turquoise",
-                "deepskyblue",
-                "dodgerblue",
-                "#1874CD",
-                "blue",
-                "beige",
-                "khaki",
-                "peru",
-                "brown",
-                "crimson",
-            ]
-            cm = matplotlib.colors.ListedColormap(colorlist)
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift,
-                lat_shift,
-                wspd250,
-                transform=transform,
-                cmap=cm,
-                vmin=50,
-                norm=norm,
-            )
-            cs_1.cmap.set_under("white", alpha=0.0)
-            cs_1.cmap.set_over("red")
-            cbar1 = plt.colorbar(
-                cs_1,
-                orientation="horizontal",
-                pad=0.05,
-                shrink=0.6,
-                ticks=clevs,
-                extend="max",
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            plt.barbs(
-                lon_shift[::skip, ::skip],
-                lat_shift[::skip, ::skip],
-                u250[::skip, ::skip],
-                v250[::skip, ::skip],
-                length=barblength,
-                linewidth=0.5,
-                color="black",
-                transform=transform,
-            )
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM 250 mb Winds ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/250wind_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot 250 mb WIND for: " + dom) % t3)
-    
-            #################################
-            # Plot Total QPF
-            #################################
-            if fhr > 0:  # Do not make total QPF plot for forecast hour 0
-                t1 = time.perf_counter()
-                logging.info(("Working on total qpf for " + dom))
-    
-                # Clear off old plottables but keep all the map info
-                cbar1.remove()
-                clear_plotables(ax, keep_ax_lst, fig)
-    
-                units = "in"
-                clevs = [
-                    0.01,
-                    0.1,
-                    0.25,
-                    0.5,
-                    0.75,
-                    1,
-                    1.25,
-                    1.5,
-                    1.75,
-                    2,
-                    2.5,
-                    3,
-                    4,
-                    5,
-                    7,
-                    10,
-                    15,
-                    20,
-                ]
-                clevsdif = [-3, -2.5, -2, -1.5, -1, -0.5, 0, 0.5, 1, 1.5, 2, 2.5, 3]
-                colorlist = [
-                    "chartreuse",
-                    "limegreen",
-                    "green",
-                    "blue",
-                    "dodgerblue",
-                    "deepskyblue",
-                    "cyan",
-                    "mediumpurple",
-                    "mediumorchid",
-                    "darkmagenta",
-                    "darkred",
-                    "crimson",
-                    "orangered",
-                    "darkorange",
-                    "goldenrod",
-                    "gold",
-                    "yellow",
-                ]
-                cm = matplotlib.colors.ListedColormap(colorlist)
-                norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-                cs_1 = plt.pcolormesh(
-                    lon_shift,
-                    lat_shift,
-                    qpf,
-                    transform=transform,
-                    cmap=cm,
-                    vmin=0.01,
-                    norm=norm,
-                )
-                cs_1.cmap.set_under("white", alpha=0.0)
-                cs_1.cmap.set_over("pink")
-                cbar1 = plt.colorbar(
-                    cs_1,
-                    orientation="horizontal",
-                    pad=0.05,
-                    shrink=0.6,
-                    ticks=clevs,
-                    extend="max",
-                )
-                cbar1.set_label(units, fontsize=8)
-                cbar1.ax.set_xticklabels(clevs)
-                cbar1.ax.tick_params(labelsize=8)
-                ax.text(
-                    0.5,
-                    1.03,
-                    "FV3-LAM "
-                    + fhour
-                    + "-hr Accumulated Precipitation ("
-                    + units
-                    + ") \n initialized: "
-                    + itime
-                    + " valid: "
-                    + vtime
-                    + " (f"
-                    + fhour
-                    + ")",
-                    horizontalalignment="center",
-                    fontsize=8,
-                    transform=ax.transAxes,
-                    bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-                )
-    
-                compress_and_save(
-                    COMOUT + "/qpf_" + dom + "_f" + fhour + ".png"
-                )
-                t2 = time.perf_counter()
-                t3 = round(t2 - t1, 3)
-                logging.info(("%.3f seconds to plot total qpf for: " + dom) % t3)
-    
-            #################################
-            # Plot composite reflectivity
-            #################################
-            t1 = time.perf_counter()
-            logging.info(("Working on composite reflectivity for " + dom))
-    
-            # Clear off old plottables but keep all the map info
-            cbar1.remove()
-            clear_plotables(ax, keep_ax_lst, fig)
-    
-            units = "dBZ"
-            clevs = np.linspace(5, 70, 14)
-            clevsdif = [20, 1000]
-            colorlist = [
-                "turquoise",
-                "dodgerblue",
-                "mediumblue",
-                "lime",
-                "limegreen",
-                "green",
-                "#EEEE00",
-                "#EEC900",
-                "darkorange",
-                "red",
-                "firebrick",
-                "darkred",
-                "fuchsia",
-            ]
-            cm = matplotlib.colors.ListedColormap(colorlist)
-            norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-            cs_1 = plt.pcolormesh(
-                lon_shift, lat_shift, refc, transform=transform, cmap=cm, vmin=5, norm=norm
-            )
-            cs_1.cmap.set_under("white", alpha=0.0)
-            cs_1.cmap.set_over("black")
-            cbar1 = plt.colorbar(
-                cs_1,
-                orientation="horizontal",
-                pad=0.05,
-                shrink=0.6,
-                ticks=clevs,
-                extend="max",
-            )
-            cbar1.set_label(units, fontsize=8)
-            cbar1.ax.tick_params(labelsize=8)
-            ax.text(
-                0.5,
-                1.03,
-                "FV3-LAM Composite Reflectivity ("
-                + units
-                + ") \n initialized: "
-                + itime
-                + " valid: "
-                + vtime
-                + " (f"
-                + fhour
-                + ")",
-                horizontalalignment="center",
-                fontsize=8,
-                transform=ax.transAxes,
-                bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-            )
-    
-            compress_and_save(
-                COMOUT + "/refc_" + dom + "_f" + fhour + ".png"
-            )
-            t2 = time.perf_counter()
-            t3 = round(t2 - t1, 3)
-            logging.info(("%.3f seconds to plot composite reflectivity for: " + dom) % t3)
-    
-            #################################
-            # Plot Max/Min Hourly 2-5 km UH
-            #################################
-            if fhr > 0:  # Do not make max/min hourly 2-5 km UH plot for forecast hour 0
-                t1 = time.perf_counter()
-                logging.info(("Working on Max/Min Hourly 2-5 km UH for " + dom))
-    
-                # Clear off old plottables but keep all the map info
-                cbar1.remove()
-                clear_plotables(ax, keep_ax_lst, fig)
-    
-                units = "m${^2}$ s$^{-2}$"
-                clevs = [
-                    -150,
-                    -100,
-                    -75,
-                    -50,
-                    -25,
-                    -10,
-                    0,
-                    10,
-                    25,
-                    50,
-                    75,
-                    100,
-                    150,
-                    200,
-                    250,
-                    300,
-                ]
-                #   alternative colormap for just max UH if you don't want to plot the min UH too
-                #     colorlist = ['white','skyblue','mediumblue','green','orchid','firebrick','#EEC900','DarkViolet']
-                colorlist = [
-                    "blue",
-                    "#1874CD",
-                    "dodgerblue",
-                    "deepskyblue",
-                    "turquoise",
-                    "#E5E5E5",
-                    "#E5E5E5",
-                    "#EEEE00",
-                    "#EEC900",
-                    "darkorange",
-                    "orangered",
-                    "red",
-                    "firebrick",
-                    "mediumvioletred",
-                    "darkviolet",
-                ]
-                cm = matplotlib.colors.ListedColormap(colorlist)
-                norm = matplotlib.colors.BoundaryNorm(clevs, cm.N)
-    
-                cs_1 = plt.pcolormesh(
-                    lon_shift, lat_shift, uh25, transform=transform, cmap=cm, norm=norm
-                )
-                cs_1.cmap.set_under("darkblue")
-                cs_1.cmap.set_over("black")
-                cbar1 = plt.colorbar(
-                    cs_1, orientation="horizontal", pad=0.05, shrink=0.6, extend="both"
-                )
-                cbar1.set_label(units, fontsize=8)
-                cbar1.ax.tick_params(labelsize=8)
-                ax.text(
-                    0.5,
-                    1.03,
-                    "FV3-LAM 1-h Max/Min 2-5 km Updraft Helicity ("
-                    + units
-                    + ") \n initialized: "
-                    + itime
-                    + " valid: "
-                    + vtime
-                    + " (f"
-                    + fhour
-                    + ")",
-                    horizontalalignment="center",
-                    fontsize=8,
-                    transform=ax.transAxes,
-                    bbox=dict(facecolor="white", alpha=0.85, boxstyle="square,pad=0.2"),
-                )
-    
-                compress_and_save(
-                    COMOUT + "/uh25_" + dom + "_f" + fhour + ".png"
-                )
-                t2 = time.perf_counter()
-                t3 = round(t2 - t1, 3)
-                logging.info(("%.3f seconds to plot Max/Min Hourly 2-5 km UH for: " + dom) % t3)
-    
-            ######################################################
-    
-            t3dom = round(t2 - t1dom, 3)
-            logging.info(("%.3f seconds to plot all variables for forecast hour " + fhour) % t3dom)
-            plt.clf()
-    
-        ######################################################
-    
-        main()
+    if args.follow:
+        follow(args, fhours, max(1, args.nprocs))
+    else:
+        # Split the plots across forecast hours and plot types, and make them in
+        # parallel when more than one process is requested
+        tasks = plot_tasks(fhours, args.nprocs)
+        nprocs = max(1, min(args.nprocs, len(tasks)))
+        logging.info(f"Making plots with {nprocs} processes")
+        if nprocs > 1:
+            with multiprocessing.Pool(
+                nprocs, initializer=setup_worker, initargs=(args, nprocs)
+            ) as pool:
+                for _ in pool.imap_unordered(functools.partial(plot_fhr, args), tasks):
+                    pass
+        else:
+            setup_image_writer(args.image_format, args.palette_colors, args.encode_threads)
+            set_fft_workers(os.cpu_count() or 1)
+            for task in tasks:
+                plot_fhr(args, task)
+            _image_writer.close()
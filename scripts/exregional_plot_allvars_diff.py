@@ -46,28 +46,34 @@
 ################################################################################
 
 # -------------Import modules --------------------------#
-import pygrib
 import cartopy.crs as ccrs
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-import cartopy.feature as cfeature
 import matplotlib
 
 matplotlib.use("Agg")
-import io
 import matplotlib.pyplot as plt
 import dateutil.relativedelta, dateutil.parser
-from PIL import Image
 from matplotlib.gridspec import GridSpec
 import numpy as np
 import time, os, sys, multiprocessing
 import multiprocessing.pool
-from scipy import ndimage
-import pyproj
 import argparse
-import cartopy
 import logging
 import warnings
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ush")
+)
+from plot_utils import (
+    DerivedFields,
+    GribReader,
+    ImageWriter,
+    IMAGE_FORMATS,
+    add_basemap,
+    barb_skip,
+    set_fft_workers,
+)
+
 # --------------Define some functions ------------------#
 
 
@@ -115,14 +121,27 @@ def clear_plotables(ax, keep_ax_lst, fig):
                 a.remove()
 
 
+# Writer of the images (see setup_image_writer)
+_image_writer = None
+
+
+def setup_image_writer(image_format="png", palette_colors=0, encode_threads=1):
+    """Set up the writer of the images"""
+
+    global _image_writer
+    _image_writer = ImageWriter(
+        image_format=image_format,
+        palette_colors=palette_colors,
+        dpi=150,
+        threads=encode_threads,
+    )
+
+
 def compress_and_save(filename):
     #### - compress and save the image - ####
-    ram = io.BytesIO()
-    plt.savefig(ram, format="png", bbox_inches="tight", dpi=150)
-    ram.seek(0)
-    im = Image.open(ram)
-    im2 = im.convert("RGB")  # .convert('P', palette=Image.ADAPTIVE)
-    im2.save(filename, format="PNG")
+    if _image_writer is None:
+        setup_image_writer()
+    _image_writer.save(plt.gcf(), filename)
 
 
 def cmap_t2m():
@@ -189,70 +208,6 @@ def cmap_q2m():
     return cmap_q2m_coltbl
 
 
-def rotate_wind(true_lat, lov_lon, earth_lons, uin, vin, proj, inverse=False):
-    #  Rotate winds from LCC relative to earth relative (or vice-versa if inverse==true)
-    #   This routine is vectorized and *should* work on any size 2D vg and ug arrays.
-    #   Program will quit if dimensions are too large.
-    #
-    # Input args:
-    #  true_lat = True latitidue for LCC projection (single value in degrees)
-    #  lov_lon  = The LOV value from grib (e.g. - -95.0) (single value in degrees)
-    #              Grib doc says: "Lov = orientation of the grid; i.e. the east longitude value of
-    #                              the meridian which is parallel to the Y-axis (or columns of the grid)
-    #                              along which latitude increases as the Y-coordinate increases (the
-    #                              orientation longitude may or may not appear on a particular grid).
-    #
-    #  earth_lons = Earth relative longitudes (can be an array, in degrees)
-    #  uin, vin     = Input winds to rotate
-    #
-    # Returns:
-    #  uout, vout = Output, rotated winds
-    # -----------------------------------------------------------------------------------------------------
-
-    # Get size and length of input u winds, if not 2d, raise an error
-    q = np.shape(uin)
-    ndims = len(q)
-    if ndims > 2:
-        # Raise error and quit!
-        raise SystemExit("Input winds for rotation have greater than 2 dimensions!")
-    if lov_lon > 0.0:
-        lov_lon = lov_lon - 360.0
-    dtr = np.pi / 180.0  # Degrees to radians
-
-    if not isinstance(inverse, bool):
-        raise TypeError("**kwarg inverse must be of type bool.")
-
-    # Compute rotation constant which is also
-    # known as the Lambert cone constant.  In the case
-    # of a polar stereographic projection, this is one.
-    # See the following pdf for excellent documentation
-    # http://www.dtcenter.org/met/users/docs/write_ups/velocity.pdf
-    if proj.lower() == "lcc":
-        rotcon_p = np.sin(true_lat * dtr)
-    elif proj.lower() in ["stere", "spstere", "npstere"]:
-        rotcon_p = 1.0
-    else:
-        raise SystemExit(
-            "Unsupported map projection: " + proj.lower() + " for wind rotation."
-        )
-
-    angles = rotcon_p * (earth_lons - lov_lon) * dtr
-    sinx2 = np.sin(angles)
-    cosx2 = np.cos(angles)
-
-    # Steps below are elementwise products, not matrix mutliplies
-    if inverse == False:
-        # Return the earth relative winds
-        uout = cosx2 * uin + sinx2 * vin
-        vout = -sinx2 * uin + cosx2 * vin
-    elif inverse == True:
-        # Return the grid relative winds
-        uout = cosx2 * uin - sinx2 * vin
-        vout = sinx2 * uin + cosx2 * vin
-
-    return uout, vout
-
-
 def setup_logging(debug=False):
 
     """Calls initialization functions for logging package, and sets the
@@ -310,6 +265,16 @@ if __name__ == "__main__":
         help="Path to base directory of cartopy shapefiles.",
         required=True,
     )
+    parser.add_argument(
+        "--basemap-cache-dir",
+        help="Directory in which to cache rendered map backgrounds.",
+        required=False,
+    )
+    parser.add_argument(
+        "--field-cache-dir",
+        help="Directory in which to cache the fields derived from the post files.",
+        required=False,
+    )
     parser.add_argument(
         "--domain",
         "-d",
@@ -324,6 +289,25 @@ if __name__ == "__main__":
         help="Name of domains to plot (either 'conus' or 'regional' or both).",
         required=False,
     )
+    parser.add_argument(
+        "--image-format",
+        choices=list(IMAGE_FORMATS),
+        default="png",
+        help="Format of the images.",
+    )
+    parser.add_argument(
+        "--palette-colors",
+        type=int,
+        default=0,
+        help="Number of colors (up to 256) of palette PNG images; 0 writes RGB PNG images.",
+    )
+    parser.add_argument(
+        "--encode-threads",
+        type=int,
+        default=1,
+        help="Number of threads encoding images while the next plots are "
+        "drawn; 0 encodes each image before drawing the next.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -360,7 +344,12 @@ if __name__ == "__main__":
     COMOUT_1 = str(args.comout_1)
     COMOUT_2 = str(args.comout_2)
     CARTOPY_DIR = str(args.cartopy_dir)
+    BASEMAP_CACHE_DIR = args.basemap_cache_dir
+    FIELD_CACHE_DIR = args.field_cache_dir
     POST_OUTPUT_DOMAIN_NAME = str(args.domain).lower()
+    setup_image_writer(args.image_format, args.palette_colors, args.encode_threads)
+    # This script plots in a single process, whose FFTs can use all cores
+    set_fft_workers(os.cpu_count() or 1)
     
     # Loop over forecast hours
     for fhr in fhours:
@@ -370,7 +359,7 @@ if __name__ == "__main__":
         vtime = ndate(itime, int(fhr))
     
         # Define the location of the input files
-        data1 = pygrib.open(
+        data1 = GribReader(
             COMOUT_1
             + "/rrfs.t"
             + cyc
@@ -380,7 +369,7 @@ if __name__ == "__main__":
             + POST_OUTPUT_DOMAIN_NAME
             + ".grib2"
         )
-        data2 = pygrib.open(
+        data2 = GribReader(
             COMOUT_2
             + "/rrfs.t"
             + cyc
@@ -391,55 +380,26 @@ if __name__ == "__main__":
             + ".grib2"
         )
     
-        # Get the lats and lons
-        grids = [data1, data2]
-        lats = []
-        lons = []
-        lats_shift = []
-        lons_shift = []
-    
-        for data in grids:
-            # Unshifted grid for contours and wind barbs
-            lat, lon = data[1].latlons()
-            lats.append(lat)
-            lons.append(lon)
-    
-            # Shift grid for pcolormesh
-            lat1 = data[1]["latitudeOfFirstGridPointInDegrees"]
-            lon1 = data[1]["longitudeOfFirstGridPointInDegrees"]
-            try:
-                nx = data[1]["Nx"]
-                ny = data[1]["Ny"]
-            except:
-                nx = data[1]["Ni"]
-                ny = data[1]["Nj"]
-            dx = data[1]["DxInMetres"]
-            dy = data[1]["DyInMetres"]
-            pj = pyproj.Proj(data[1].projparams)
-            llcrnrx, llcrnry = pj(lon1, lat1)
-            llcrnrx = llcrnrx - (dx / 2.0)
-            llcrnry = llcrnry - (dy / 2.0)
-            x = llcrnrx + dx * np.arange(nx)
-            y = llcrnry + dy * np.arange(ny)
-            x, y = np.meshgrid(x, y)
-            lon, lat = pj(x, y, inverse=True)
-            lats_shift.append(lat)
-            lons_shift.append(lon)
+        # Get the lats and lons. The grids are the same for every forecast
+        # hour, so they are only computed for the first one.
+        grid1 = data1.grid()
+        grid2 = data2.grid()
     
         # Unshifted lat/lon arrays grabbed directly using latlons() method
-        lat = lats[0]
-        lon = lons[0]
-        lat2 = lats[1]
-        lon2 = lons[1]
+        lat = grid1.lat
+        lon = grid1.lon
+        lat2 = grid2.lat
+        lon2 = grid2.lon
     
         # Shifted lat/lon arrays for pcolormesh
-        lat_shift = lats_shift[0]
-        lon_shift = lons_shift[0]
-        lat2_shift = lats_shift[1]
-        lon2_shift = lons_shift[1]
-    
-        Lat0 = data1[1]["LaDInDegrees"]
-        Lon0 = data1[1]["LoVInDegrees"]
+        lat_shift = grid1.lat_shift
+        lon_shift = grid1.lon_shift
+        lat2_shift = grid2.lat_shift
+        lon2_shift = grid2.lon_shift
+        dx = grid2.dx
+    
+        Lat0 = grid1.lat_0
+        Lon0 = grid1.lon_0
         logging.info(Lat0)
         logging.info(Lon0)
     
@@ -453,130 +413,77 @@ if __name__ == "__main__":
         ###################################################
         t1a = time.perf_counter()
     
+        fields_1 = DerivedFields(data1, fhr, cache_dir=FIELD_CACHE_DIR)
+        fields_2 = DerivedFields(data2, fhr, cache_dir=FIELD_CACHE_DIR)
+    
         # Sea level pressure
-        slp_1 = data1.select(name="Pressure reduced to MSL")[0].values * 0.01
-        slpsmooth_1 = ndimage.gaussian_filter(slp_1, 13.78)
-        slp_2 = data2.select(name="Pressure reduced to MSL")[0].values * 0.01
-        slpsmooth_2 = ndimage.gaussian_filter(slp_2, 13.78)
+        slp_1 = fields_1["slp"]
+        slpsmooth_1 = fields_1["slpsmooth"]
+        slp_2 = fields_2["slp"]
+        slpsmooth_2 = fields_2["slpsmooth"]
         slp_diff = slp_2 - slp_1
     
         # 2-m temperature
-        tmp2m_1 = data1.select(name="2 metre temperature")[0].values
-        tmp2m_1 = (tmp2m_1 - 273.15) * 1.8 + 32.0
-        tmp2m_2 = data2.select(name="2 metre temperature")[0].values
-        tmp2m_2 = (tmp2m_2 - 273.15) * 1.8 + 32.0
+        tmp2m_1 = fields_1["tmp2m"]
+        tmp2m_2 = fields_2["tmp2m"]
         tmp2m_diff = tmp2m_2 - tmp2m_1
     
         # 2-m dew point temperature
-        dew2m_1 = data1.select(name="2 metre dewpoint temperature")[0].values
-        dew2m_1 = (dew2m_1 - 273.15) * 1.8 + 32.0
-        dew2m_2 = data2.select(name="2 metre dewpoint temperature")[0].values
-        dew2m_2 = (dew2m_2 - 273.15) * 1.8 + 32.0
+        dew2m_1 = fields_1["dew2m"]
+        dew2m_2 = fields_2["dew2m"]
         dew2m_diff = dew2m_2 - dew2m_1
     
         # 10-m wind speed
-        uwind_1 = data1.select(name="10 metre U wind component")[0].values * 1.94384
-        vwind_1 = data1.select(name="10 metre V wind component")[0].values * 1.94384
-        uwind_2 = data2.select(name="10 metre U wind component")[0].values * 1.94384
-        vwind_2 = data2.select(name="10 metre V wind component")[0].values * 1.94384
-        # Rotate winds from grid relative to Earth relative
-        uwind_1, vwind_1 = rotate_wind(
-            Lat0, Lon0, lon, uwind_1, vwind_1, "lcc", inverse=False
-        )
-        uwind_2, vwind_2 = rotate_wind(
-            Lat0, Lon0, lon2, uwind_2, vwind_2, "lcc", inverse=False
-        )
-        wspd10m_1 = np.sqrt(uwind_1**2 + vwind_1**2)
-        wspd10m_2 = np.sqrt(uwind_2**2 + vwind_2**2)
+        wspd10m_1 = fields_1["wspd10m"]
+        wspd10m_2 = fields_2["wspd10m"]
         wspd10m_diff = wspd10m_2 - wspd10m_1
     
         # Surface-based CAPE
-        cape_1 = data1.select(
-            name="Convective available potential energy", typeOfLevel="surface"
-        )[0].values
-        cape_2 = data2.select(
-            name="Convective available potential energy", typeOfLevel="surface"
-        )[0].values
+        cape_1 = fields_1["cape"]
+        cape_2 = fields_2["cape"]
         cape_diff = cape_2 - cape_1
     
         # Surface-based CIN
-        cin_1 = data1.select(name="Convective inhibition", typeOfLevel="surface")[0].values
-        cin_2 = data2.select(name="Convective inhibition", typeOfLevel="surface")[0].values
+        cin_1 = fields_1["cin"]
+        cin_2 = fields_2["cin"]
         cin_diff = cin_2 - cin_1
     
         # 500 mb height, wind, vorticity
         try:
-            z500_1 = data1.select(name="Geopotential Height", level=500)[0].values * 0.1
-            z500_1 = ndimage.gaussian_filter(z500_1, 6.89)
-            z500_2 = data2.select(name="Geopotential Height", level=500)[0].values * 0.1
-            z500_2 = ndimage.filters.gaussian_filter(z500_2, 6.89)
+            z500_1 = fields_1["z500"]
+            z500_2 = fields_2["z500"]
             z500_diff = z500_2 - z500_1
-            vort500_1 = data1.select(name="Absolute vorticity", level=500)[0].values * 100000
-            vort500_1 = ndimage.filters.gaussian_filter(vort500_1, 1.7225)
-            vort500_1[vort500_1 > 1000] = 0  # Mask out undefined values on domain edge
-            vort500_2 = data2.select(name="Absolute vorticity", level=500)[0].values * 100000
-            vort500_2 = ndimage.filters.gaussian_filter(vort500_2, 1.7225)
-            vort500_2[vort500_2 > 1000] = 0  # Mask out undefined values on domain edge
-            u500_1 = data1.select(name="U component of wind", level=500)[0].values * 1.94384
-            u500_2 = data2.select(name="U component of wind", level=500)[0].values * 1.94384
-            v500_1 = data1.select(name="V component of wind", level=500)[0].values * 1.94384
-            v500_2 = data2.select(name="V component of wind", level=500)[0].values * 1.94384
-            # Rotate winds from grid relative to Earth relative
-            u500_1, v500_1 = rotate_wind(Lat0, Lon0, lon, u500_1, v500_1, "lcc", inverse=False)
-            u500_2, v500_2 = rotate_wind(Lat0, Lon0, lon2, u500_2, v500_2, "lcc", inverse=False)
+            vort500_1 = fields_1["vort500"]
+            vort500_2 = fields_2["vort500"]
+            u500_1 = fields_1["u500"]
+            u500_2 = fields_2["u500"]
         except:
             u500_1 = None
             u500_2 = None
     
         # 250 mb winds
-        u250_1 = data1.select(name="U component of wind", level=250)[0].values * 1.94384
-        u250_2 = data2.select(name="U component of wind", level=250)[0].values * 1.94384
-        v250_1 = data1.select(name="V component of wind", level=250)[0].values * 1.94384
-        v250_2 = data2.select(name="V component of wind", level=250)[0].values * 1.94384
-        # Rotate winds from grid relative to Earth relative
-        u250_1, v250_1 = rotate_wind(Lat0, Lon0, lon, u250_1, v250_1, "lcc", inverse=False)
-        u250_2, v250_2 = rotate_wind(Lat0, Lon0, lon2, u250_2, v250_2, "lcc", inverse=False)
-        wspd250_1 = np.sqrt(u250_1**2 + v250_1**2)
-        wspd250_2 = np.sqrt(u250_2**2 + v250_2**2)
+        wspd250_1 = fields_1["wspd250"]
+        wspd250_2 = fields_2["wspd250"]
         wspd250_diff = wspd250_2 - wspd250_1
     
         # Total precipitation
-        qpf_1 = (
-            data1.select(name="Total Precipitation", lengthOfTimeRange=fhr)[0].values
-            * 0.0393701
-        )
-        qpf_2 = (
-            data2.select(name="Total Precipitation", lengthOfTimeRange=fhr)[0].values
-            * 0.0393701
-        )
+        qpf_1 = fields_1["qpf"]
+        qpf_2 = fields_2["qpf"]
         qpf_diff = qpf_2 - qpf_1
     
         # Composite reflectivity
-        refc_1 = data1.select(name="Maximum/Composite radar reflectivity")[0].values
-        refc_2 = data2.select(name="Maximum/Composite radar reflectivity")[0].values
+        refc_1 = fields_1["refc"]
+        refc_2 = fields_2["refc"]
     
         if fhr > 0:
             # Max/Min Hourly 2-5 km Updraft Helicity
-            maxuh25_1 = data1.select(
-                stepType="max", parameterName="199", topLevel=5000, bottomLevel=2000
-            )[0].values
-            maxuh25_2 = data2.select(
-                stepType="max", parameterName="199", topLevel=5000, bottomLevel=2000
-            )[0].values
-            minuh25_1 = data1.select(
-                stepType="min", parameterName="200", topLevel=5000, bottomLevel=2000
-            )[0].values
-            minuh25_2 = data2.select(
-                stepType="min", parameterName="200", topLevel=5000, bottomLevel=2000
-            )[0].values
-            maxuh25_1[maxuh25_1 < 10] = 0
-            maxuh25_2[maxuh25_2 < 10] = 0
-            minuh25_1[minuh25_1 > -10] = 0
-            minuh25_2[minuh25_2 > -10] = 0
-            uh25_1 = maxuh25_1 + minuh25_1
-            uh25_2 = maxuh25_2 + minuh25_2
+            uh25_1 = fields_1["uh25"]
+            uh25_2 = fields_2["uh25"]
             uh25_diff = uh25_2 - uh25_1
     
+        data1.close()
+        data2.close()
+    
         t2a = time.perf_counter()
         t3a = round(t2a - t1a, 3)
         logging.info(("%.3f seconds to read all messages") % t3a)
@@ -622,12 +529,6 @@ if __name__ == "__main__":
             fig = plt.figure(figsize=(10, 10))
             gs = GridSpec(9, 9, wspace=0.0, hspace=0.0)
     
-            # Define where Cartopy Maps are located
-            cartopy.config["data_dir"] = CARTOPY_DIR
-    
-            back_res = "50m"
-            back_img = "on"
-    
             # set up the map background with cartopy
             myproj = ccrs.LambertConformal(
                 central_longitude=lon_0,
@@ -645,75 +546,13 @@ if __name__ == "__main__":
             ax2.set_extent(extent)
             ax3.set_extent(extent)
     
-            fline_wd = 0.5  # line width
-            falpha = 0.3  # transparency
-    
-            # natural_earth
-            #    land=cfeature.NaturalEarthFeature('physical','land',back_res,
-            #                      edgecolor='face',facecolor=cfeature.COLORS['land'],
-            #                      alpha=falpha)
-            lakes = cfeature.NaturalEarthFeature(
-                "physical",
-                "lakes",
-                back_res,
-                edgecolor="blue",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
-            coastline = cfeature.NaturalEarthFeature(
-                "physical",
-                "coastline",
-                back_res,
-                edgecolor="blue",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
-            states = cfeature.NaturalEarthFeature(
-                "cultural",
-                "admin_1_states_provinces",
-                back_res,
-                edgecolor="black",
-                facecolor="none",
-                linewidth=fline_wd,
-                linestyle=":",
-                alpha=falpha,
-            )
-            borders = cfeature.NaturalEarthFeature(
-                "cultural",
-                "admin_0_countries",
-                back_res,
-                edgecolor="red",
-                facecolor="none",
-                linewidth=fline_wd,
-                alpha=falpha,
-            )
+            add_basemap(ax1, CARTOPY_DIR, BASEMAP_CACHE_DIR)
+            add_basemap(ax2, CARTOPY_DIR, BASEMAP_CACHE_DIR)
+            add_basemap(ax3, CARTOPY_DIR, BASEMAP_CACHE_DIR)
     
             # All lat lons are earth relative, so setup the associated projection correct for that data
             transform = ccrs.PlateCarree()
     
-            # high-resolution background images
-            if back_img == "on":
-                img = plt.imread(CARTOPY_DIR + "/raster_files/NE1_50M_SR_W.tif")
-                ax1.imshow(img, origin="upper", transform=transform)
-                ax2.imshow(img, origin="upper", transform=transform)
-                ax3.imshow(img, origin="upper", transform=transform)
-    
-            #  ax.add_feature(land)
-            ax1.add_feature(lakes)
-            ax1.add_feature(states)
-            ax1.add_feature(borders)
-            ax1.add_feature(coastline)
-            ax2.add_feature(lakes)
-            ax2.add_feature(states)
-            ax2.add_feature(borders)
-            ax2.add_feature(coastline)
-            ax3.add_feature(lakes)
-            ax3.add_feature(states)
-            ax3.add_feature(borders)
-            ax3.add_feature(coastline)
-    
             # Map/figure has been set up here, save axes instances for use again later
             keep_ax_lst_1 = ax1.get_children()[:]
             keep_ax_lst_2 = ax2.get_children()[:]
@@ -1146,7 +985,7 @@ if __name__ == "__main__":
     
             units = "kts"
             # Places a wind barb every ~180 km, optimized for CONUS domain
-            skip = round(177.28 * (dx / 1000.0) ** -0.97)
+            skip = barb_skip(dx)
             logging.info("skipping every " + str(skip) + " grid points to plot")
             barblength = 4
     
@@ -1194,8 +1033,7 @@ if __name__ == "__main__":
             ax1.barbs(
                 lon_shift[::skip, ::skip],
                 lat_shift[::skip, ::skip],
-                uwind_1[::skip, ::skip],
-                vwind_1[::skip, ::skip],
+                *fields_1.barbs("uwind", "vwind", skip),
                 length=barblength,
                 linewidth=0.5,
                 color="black",
@@ -1244,8 +1082,7 @@ if __name__ == "__main__":
             ax2.barbs(
                 lon2_shift[::skip, ::skip],
                 lat2_shift[::skip, ::skip],
-                uwind_2[::skip, ::skip],
-                vwind_2[::skip, ::skip],
+                *fields_2.barbs("uwind", "vwind", skip),
                 length=barblength,
                 linewidth=0.5,
                 color="black",
@@ -1522,7 +1359,7 @@ if __name__ == "__main__":
                 clear_plotables(ax3, keep_ax_lst_3, fig)
     
                 units = "x10${^5}$ s${^{-1}}$"
-                skip = round(177.28 * (dx / 1000.0) ** -0.97)
+                skip = barb_skip(dx)
                 logging.info("skipping every " + str(skip) + " grid points to plot")
                 barblength = 4
     
@@ -1552,8 +1389,7 @@ if __name__ == "__main__":
                 ax1.barbs(
                     lon_shift[::skip, ::skip],
                     lat_shift[::skip, ::skip],
-                    u500_1[::skip, ::skip],
-                    v500_1[::skip, ::skip],
+                    *fields_1.barbs("u500", "v500", skip),
                     length=barblength,
                     linewidth=0.5,
                     color="steelblue",
@@ -1608,8 +1444,7 @@ if __name__ == "__main__":
                 ax2.barbs(
                     lon2_shift[::skip, ::skip],
                     lat2_shift[::skip, ::skip],
-                    u500_2[::skip, ::skip],
-                    v500_2[::skip, ::skip],
+                    *fields_2.barbs("u500", "v500", skip),
                     length=barblength,
                     linewidth=0.5,
                     color="steelblue",
@@ -1698,7 +1533,7 @@ if __name__ == "__main__":
             clear_plotables(ax3, keep_ax_lst_3, fig)
     
             units = "kts"
-            skip = round(177.28 * (dx / 1000.0) ** -0.97)
+            skip = barb_skip(dx)
             logging.info("skipping every " + str(skip) + " grid points to plot")
             barblength = 4
     
@@ -1745,8 +1580,7 @@ if __name__ == "__main__":
             ax1.barbs(
                 lon_shift[::skip, ::skip],
                 lat_shift[::skip, ::skip],
-                u250_1[::skip, ::skip],
-                v250_1[::skip, ::skip],
+                *fields_1.barbs("u250", "v250", skip),
                 length=barblength,
                 linewidth=0.5,
                 color="black",
@@ -1795,8 +1629,7 @@ if __name__ == "__main__":
             ax2.barbs(
                 lon2_shift[::skip, ::skip],
                 lat2_shift[::skip, ::skip],
-                u250_2[::skip, ::skip],
-                v250_2[::skip, ::skip],
+                *fields_2.barbs("u250", "v250", skip),
                 length=barblength,
                 linewidth=0.5,
                 color="black",
@@ -2402,3 +2235,5 @@ if __name__ == "__main__":
         ######################################################
     
         main()
+
+    _image_writer.close()
@@ -462,39 +462,18 @@ if [ "${CPL_AQM}" = "TRUE" ]; then
   if [ "${COLDSTART}" = "TRUE" ] && [ "${PDY}${cyc}" = "${DATE_FIRST_CYCL:0:10}" ]; then
     init_concentrations="true"
   fi
+fi
 #
 #-----------------------------------------------------------------------
 #
-# Call the function that creates the aqm.rc file within each
-# cycle directory.
+# If stochastic seeds are not being set for this member, symlink the
+# experiment's namelist file into the run directory.  (Otherwise, a
+# member-specific namelist file is created below.)
 #
 #-----------------------------------------------------------------------
 #
-  python3 $USHdir/create_aqm_rc_file.py \
-    --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-    --cdate "$CDATE" \
-    --run-dir "${DATA}" \
-    --init-concentration "${init_concentrations}" \
-    || print_err_msg_exit "\
-Call to function to create an aqm.rc file for the current
-cycle's (cdate) run directory (DATA) failed:
-  cdate = \"${CDATE}\"
-  DATA = \"${DATA}\""
-fi
-#
-#-----------------------------------------------------------------------
-#
-
-if [ "${DO_ENSEMBLE}" = TRUE ] && ([ "${DO_SPP}" = TRUE ] || [ "${DO_SPPT}" = TRUE ] || [ "${DO_SHUM}" = TRUE ] || \
-   [ "${DO_SKEB}" = TRUE ] || [ "${DO_LSM_SPP}" =  TRUE ]); then
-  python3 $USHdir/set_FV3nml_ens_stoch_seeds.py \
-      --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-      --cdate "$CDATE" || print_err_msg_exit "\
-Call to function to create the ensemble-based namelist for the current
-cycle's (cdate) run directory (DATA) failed:
-  cdate = \"${CDATE}\"
-  DATA = \"${DATA}\""
-else
+if ! ( [ "${DO_ENSEMBLE}" = TRUE ] && ([ "${DO_SPP}" = TRUE ] || [ "${DO_SPPT}" = TRUE ] || [ "${DO_SHUM}" = TRUE ] || \
+   [ "${DO_SKEB}" = TRUE ] || [ "${DO_LSM_SPP}" =  TRUE ]) ); then
   create_symlink_to_file target="${FV3_NML_FP}" \
                          symlink="${DATA}/${FV3_NML_FN}" \
                          relative="${relative_link_flag}"
@@ -502,40 +481,6 @@ fi
 #
 #-----------------------------------------------------------------------
 #
-# Call the function that creates the model configuration file within each
-# cycle directory.
-#
-#-----------------------------------------------------------------------
-#
-python3 $USHdir/create_model_configure_file.py \
-  --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-  --cdate "$CDATE" \
-  --fcst_len_hrs "${FCST_LEN_HRS}" \
-  --run-dir "${DATA}" \
-  --sub-hourly-post "${SUB_HOURLY_POST}" \
-  --dt-subhourly-post-mnts "${DT_SUBHOURLY_POST_MNTS}" \
-  --dt-atmos "${DT_ATMOS}" || print_err_msg_exit "\
-Call to function to create a model configuration file for the current
-cycle's (cdate) run directory (DATA) failed:
-  cdate = \"${CDATE}\"
-  DATA = \"${DATA}\""
-#
-#-----------------------------------------------------------------------
-#
-# Call the function that creates the diag_table file within each cycle 
-# directory.
-#
-#-----------------------------------------------------------------------
-#
-python3 $USHdir/create_diag_table_file.py \
-  --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-  --run-dir "${DATA}" || print_err_msg_exit "\
-Call to function to create a diag table file for the current cycle's 
-(cdate) run directory (DATA) failed:
-  DATA = \"${DATA}\""
-#
-#-----------------------------------------------------------------------
-#
 # Pre-generate symlinks to forecast output in DATA
 #
 #-----------------------------------------------------------------------
@@ -547,17 +492,25 @@ fi
 #
 #-----------------------------------------------------------------------
 #
-# Call the function that creates the NEMS configuration file within each
-# cycle directory.
+# Create the per-cycle files in the cycle's run directory in a single
+# call: the aqm.rc file (for AQM runs), the ensemble member's namelist
+# file with unique stochastic seeds (for stochastic ensembles), and the
+# model configuration, diag_table and NEMS configuration files.
 #
 #-----------------------------------------------------------------------
 #
-python3 $USHdir/create_nems_configure_file.py \
+python3 $USHdir/prepare_fcst_rundir.py \
   --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
+  --cdate "$CDATE" \
   --run-dir "${DATA}" \
-  || print_err_msg_exit "\
-Call to function to create a NEMS configuration file for the current
-cycle's (cdate) run directory (DATA) failed:
+  --init-concentrations "${init_concentrations:-false}" \
+  --fcst_len_hrs "${FCST_LEN_HRS}" \
+  --sub-hourly-post "${SUB_HOURLY_POST}" \
+  --dt-subhourly-post-mnts "${DT_SUBHOURLY_POST_MNTS}" \
+  --dt-atmos "${DT_ATMOS}" || print_err_msg_exit "\
+Call to function to prepare the run directory for the current cycle's
+(cdate) forecast failed:
+  cdate = \"${CDATE}\"
   DATA = \"${DATA}\""
 #
 #-----------------------------------------------------------------------
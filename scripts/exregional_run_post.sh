@@ -77,7 +77,10 @@ fi
 #-----------------------------------------------------------------------
 #
 # Remove any files from previous runs and stage necessary files in the 
-# temporary work directory specified by DATA_FHR.
+# temporary work directory specified by DATA_POST.  When a single output
+# time is post-processed, this is the work directory for that time 
+# (DATA_FHR).  When a batch of forecast hours is post-processed, the files
+# are staged once and linked into the work directory of each output time.
 #
 #-----------------------------------------------------------------------
 #
@@ -88,9 +91,9 @@ if [ ${USE_CUSTOM_POST_CONFIG_FILE} = "TRUE" ]; then
   print_info_msg "
 ====================================================================
 Copying the user-defined post flat file specified by CUSTOM_POST_CONFIG_FP
-to the temporary work directory (DATA_FHR):
+to the temporary work directory (DATA_POST):
   CUSTOM_POST_CONFIG_FP = \"${CUSTOM_POST_CONFIG_FP}\"
-  DATA_FHR = \"${DATA_FHR}\"
+  DATA_POST = \"${DATA_POST}\"
 ===================================================================="
 else
   if [ "${CPL_AQM}" = "TRUE" ]; then
@@ -101,9 +104,9 @@ else
   print_info_msg "
 ====================================================================
 Copying the default post flat file specified by post_config_fp to the 
-temporary work directory (DATA_FHR):
+temporary work directory (DATA_POST):
   post_config_fp = \"${post_config_fp}\"
-  DATA_FHR = \"${DATA_FHR}\"
+  DATA_POST = \"${DATA_POST}\"
 ===================================================================="
 fi
 cp_vrfy ${post_config_fp} ./postxconfig-NT.txt
@@ -121,9 +124,9 @@ if [ ${USE_CRTM} = "TRUE" ]; then
   print_info_msg "
 ====================================================================
 Copying the external CRTM fix files from CRTM_DIR to the temporary
-work directory (DATA_FHR):
+work directory (DATA_POST):
   CRTM_DIR = \"${CRTM_DIR}\"
-  DATA_FHR = \"${DATA_FHR}\"
+  DATA_POST = \"${DATA_POST}\"
 ===================================================================="
 fi
 #
@@ -139,59 +142,120 @@ hh=${cyc}
 #
 #-----------------------------------------------------------------------
 #
-# Create the namelist file (itag) containing arguments to pass to the post-
-# processor's executable.
+# Post-process each output time.  The output times (given by the J-job in
+# post_times) are the single time given by fhr and fmn, or all output 
+# times of the batch of forecast hours from fhr to fhr_end.  In the latter
+# case, each output time is post-processed in its own work directory 
+# (DATA_FHR) into which the files staged in DATA_POST are linked, so that
+# UPP is run exactly as for a single output time.
 #
 #-----------------------------------------------------------------------
 #
-# Set the variable (mnts_secs_str) that determines the suffix in the names 
-# of the forecast model's write-component output files that specifies the 
-# minutes and seconds of the corresponding output forecast time.
-#
-# Note that if the forecast model is instructed to output at some hourly
-# interval (via the output_fh parameter in the MODEL_CONFIG_FN file, 
-# with nsout set to a non-positive value), then the write-component
-# output file names will not contain any suffix for the minutes and seconds.
-# For this reason, when SUB_HOURLY_POST is not set to "TRUE", mnts_sec_str
-# must be set to a null string.
-#
-mnts_secs_str=""
-if [ "${SUB_HOURLY_POST}" = "TRUE" ]; then
-  if [ ${fhr}${fmn} = "00000" ]; then
-    mnts_secs_str=":"$( $DATE_UTIL --utc --date "${yyyymmdd} ${hh} UTC + ${DT_ATMOS} seconds" "+%M:%S" )
-  else
-    mnts_secs_str=":${fmn}:00"
-  fi
-fi
-#
-# Set the names of the forecast model's write-component output files.
-#
-if [ "${RUN_ENVIR}" = "nco" ]; then
-    DATAFCST=$DATAROOT/run_fcst${dot_ensmem/./_}.${share_pid}
+if [ -n "${fhr_end:-}" ]; then
+  post_hrs_msg="forecast hours $fhr to ${fhr_end}"
 else
-    DATAFCST=$DATA
+  post_hrs_msg="forecast hour $fhr"
 fi
-dyn_file="${DATAFCST}/dynf${fhr}${mnts_secs_str}.nc"
-phy_file="${DATAFCST}/phyf${fhr}${mnts_secs_str}.nc"
-#
-# Set parameters that specify the actual time (not forecast time) of the
-# output.
-#
-post_time=$( $DATE_UTIL --utc --date "${yyyymmdd} ${hh} UTC + ${fhr} hours + ${fmn} minutes" "+%Y%m%d%H%M" )
-post_yyyy=${post_time:0:4}
-post_mm=${post_time:4:2}
-post_dd=${post_time:6:2}
-post_hh=${post_time:8:2}
-post_mn=${post_time:10:2}
-#
-# Create the input namelist file to the post-processor executable.
-#
-if [ "${CPL_AQM}" = "TRUE" ]; then
-  post_itag_add="aqfcmaq_on=.true.,"
-else
-  post_itag_add=""
-fi
-cat > itag <<EOF
+
+for post_time_str in ${post_times}; do
+
+  fhr="${post_time_str%:*}"
+  fmn="${post_time_str#*:}"
+  if [ -n "${fhr_end:-}" ]; then
+    if [ "${SUB_HOURLY_POST}" = "TRUE" ]; then
+      DATA_FHR="${DATA:-$COMOUT}/$fhr$fmn"
+    else
+      DATA_FHR="${DATA:-$COMOUT}/$fhr"
+    fi
+    check_for_preexist_dir_file "${DATA_FHR}" "delete"
+    mkdir_vrfy -p "${DATA_FHR}"
+    ln_vrfy -sf "${DATA_POST}"/* "${DATA_FHR}"
+    cd_vrfy "${DATA_FHR}"
+  fi
+
+  #
+  #-----------------------------------------------------------------------
+  #
+  # Create the namelist file (itag) containing arguments to pass to the post-
+  # processor's executable.
+  #
+  #-----------------------------------------------------------------------
+  #
+  # Set the variable (mnts_secs_str) that determines the suffix in the names 
+  # of the forecast model's write-component output files that specifies the 
+  # minutes and seconds of the corresponding output forecast time.
+  #
+  # Note that if the forecast model is instructed to output at some hourly
+  # interval (via the output_fh parameter in the MODEL_CONFIG_FN file, 
+  # with nsout set to a non-positive value), then the write-component
+  # output file names will not contain any suffix for the minutes and seconds.
+  # For this reason, when SUB_HOURLY_POST is not set to "TRUE", mnts_sec_str
+  # must be set to a null string.
+  #
+  mnts_secs_str=""
+  if [ "${SUB_HOURLY_POST}" = "TRUE" ]; then
+    if [ ${fhr}${fmn} = "00000" ]; then
+      mnts_secs_str=":"$( $DATE_UTIL --utc --date "${yyyymmdd} ${hh} UTC + ${DT_ATMOS} seconds" "+%M:%S" )
+    else
+      mnts_secs_str=":${fmn}:00"
+    fi
+  fi
+  #
+  # Set the names of the forecast model's write-component output files.
+  #
+  if [ "${RUN_ENVIR}" = "nco" ]; then
+      DATAFCST=$DATAROOT/run_fcst${dot_ensmem/./_}.${share_pid}
+  else
+      DATAFCST=$DATA
+  fi
+  dyn_file="${DATAFCST}/dynf${fhr}${mnts_secs_str}.nc"
+  phy_file="${DATAFCST}/phyf${fhr}${mnts_secs_str}.nc"
+  #
+  # When post-processing a batch of forecast hours, the forecast may still
+  # be running.  As in the dependencies of the tasks that post-process a
+  # single output time, wait until the output files exist and have not been
+  # modified for 5 minutes.  Give up after POST_BATCH_TIMEOUT_SECS seconds,
+  # e.g. if the forecast failed, rather than waiting until the walltime of 
+  # the task runs out.
+  #
+  if [ -n "${fhr_end:-}" ]; then
+    wait_secs=0
+    while [ $( find "${dyn_file}" "${phy_file}" -mmin +5 2>/dev/null | wc -l ) -ne 2 ]; do
+      if [ ${wait_secs} -ge ${POST_BATCH_TIMEOUT_SECS} ]; then
+        print_err_msg_exit "\
+The forecast output files for forecast hour $fhr were not available after
+waiting for POST_BATCH_TIMEOUT_SECS seconds:
+  dyn_file = \"${dyn_file}\"
+  phy_file = \"${phy_file}\"
+  POST_BATCH_TIMEOUT_SECS = ${POST_BATCH_TIMEOUT_SECS}"
+      fi
+      print_info_msg "$VERBOSE" "
+Waiting for forecast output files:
+  dyn_file = \"${dyn_file}\"
+  phy_file = \"${phy_file}\""
+      sleep 60
+      wait_secs=$(( wait_secs + 60 ))
+    done
+  fi
+  #
+  # Set parameters that specify the actual time (not forecast time) of the
+  # output.
+  #
+  post_time=$( $DATE_UTIL --utc --date "${yyyymmdd} ${hh} UTC + ${fhr} hours + ${fmn} minutes" "+%Y%m%d%H%M" )
+  post_yyyy=${post_time:0:4}
+  post_mm=${post_time:4:2}
+  post_dd=${post_time:6:2}
+  post_hh=${post_time:8:2}
+  post_mn=${post_time:10:2}
+  #
+  # Create the input namelist file to the post-processor executable.
+  #
+  if [ "${CPL_AQM}" = "TRUE" ]; then
+    post_itag_add="aqfcmaq_on=.true.,"
+  else
+    post_itag_add=""
+  fi
+  cat > itag <<EOF
 &model_inputs
 fileName='${dyn_file}'
 IOFORM='netcdf'
@@ -205,97 +269,103 @@ fileNameFlux='${phy_file}'
  KPO=47,PO=1000.,975.,950.,925.,900.,875.,850.,825.,800.,775.,750.,725.,700.,675.,650.,625.,600.,575.,550.,525.,500.,475.,450.,425.,400.,375.,350.,325.,300.,275.,250.,225.,200.,175.,150.,125.,100.,70.,50.,30.,20.,10.,7.,5.,3.,2.,1.,${post_itag_add}
  /
 EOF
-#
-#-----------------------------------------------------------------------
-#
-# Run the UPP executable in the temporary directory (DATA_FHR) for this
-# output time.
-#
-#-----------------------------------------------------------------------
-#
-print_info_msg "$VERBOSE" "
+  #
+  #-----------------------------------------------------------------------
+  #
+  # Run the UPP executable in the temporary directory (DATA_FHR) for this
+  # output time.
+  #
+  #-----------------------------------------------------------------------
+  #
+  print_info_msg "$VERBOSE" "
 Starting post-processing for fhr = $fhr hr..."
 
-PREP_STEP
-eval ${RUN_CMD_POST} ${EXECdir}/upp.x < itag ${REDIRECT_OUT_ERR} || print_err_msg_exit "\
+  PREP_STEP
+  eval ${RUN_CMD_POST} ${EXECdir}/upp.x < itag ${REDIRECT_OUT_ERR} || print_err_msg_exit "\
 Call to executable to run post for forecast hour $fhr returned with non-
 zero exit code."
-POST_STEP
-#
-#-----------------------------------------------------------------------
-#
-# Move and rename the output files from the work directory to their final 
-# location in COMOUT.  Also, create symlinks in COMOUT to the
-# grib2 files that are needed by the data services group.  Then delete 
-# the work directory.
-#
-#-----------------------------------------------------------------------
-#
-# Set variables needed in constructing the names of the grib2 files
-# generated by UPP.
-#
-len_fhr=${#fhr}
-if [ ${len_fhr} -eq 2 ]; then
-  post_fhr=${fhr}
-elif [ ${len_fhr} -eq 3 ]; then
-  if [ "${fhr:0:1}" = "0" ]; then
-    post_fhr="${fhr:1}"
+  POST_STEP
+  #
+  #-----------------------------------------------------------------------
+  #
+  # Move and rename the output files from the work directory to their final 
+  # location in COMOUT.  Also, create symlinks in COMOUT to the
+  # grib2 files that are needed by the data services group.  Then delete 
+  # the work directory.
+  #
+  #-----------------------------------------------------------------------
+  #
+  # Set variables needed in constructing the names of the grib2 files
+  # generated by UPP.
+  #
+  len_fhr=${#fhr}
+  if [ ${len_fhr} -eq 2 ]; then
+    post_fhr=${fhr}
+  elif [ ${len_fhr} -eq 3 ]; then
+    if [ "${fhr:0:1}" = "0" ]; then
+      post_fhr="${fhr:1}"
+    else
+      post_fhr="${fhr}"
+    fi
   else
-    post_fhr="${fhr}"
-  fi
-else
-  print_err_msg_exit "\
+    print_err_msg_exit "\
 The \${fhr} variable contains too few or too many characters:
   fhr = \"$fhr\""
-fi
+  fi
 
-post_mn_or_null=""
-dot_post_mn_or_null=""
-if [ "${post_mn}" != "00" ]; then
-  post_mn_or_null="${post_mn}"
-  dot_post_mn_or_null=".${post_mn}"
-fi
+  post_mn_or_null=""
+  dot_post_mn_or_null=""
+  if [ "${post_mn}" != "00" ]; then
+    post_mn_or_null="${post_mn}"
+    dot_post_mn_or_null=".${post_mn}"
+  fi
 
-post_fn_suffix="GrbF${post_fhr}${dot_post_mn_or_null}"
-post_renamed_fn_suffix="f${fhr}${post_mn_or_null}.${POST_OUTPUT_DOMAIN_NAME}.grib2"
-#
-# For convenience, change location to COMOUT (where the final output
-# from UPP will be located).  Then loop through the two files that UPP
-# generates (i.e. "...prslev..." and "...natlev..." files) and move, 
-# rename, and create symlinks to them.
-#
-cd_vrfy "${COMOUT}"
-basetime=$( $DATE_UTIL --date "$yyyymmdd $hh" +%y%j%H%M )
-symlink_suffix="${dot_ensmem}.${basetime}f${fhr}${post_mn}"
-if [ "${CPL_AQM}" = "TRUE" ]; then
-  fids=( "cmaq" )
-else
-  fids=( "prslev" "natlev" )
-fi
-for fid in "${fids[@]}"; do
-  FID=$(echo_uppercase $fid)
-  post_orig_fn="${FID}.${post_fn_suffix}"
-  post_renamed_fn="${NET}.${cycle}${dot_ensmem}.${fid}.${post_renamed_fn_suffix}"
-  mv_vrfy ${DATA_FHR}/${post_orig_fn} ${post_renamed_fn}
-  if [ $RUN_ENVIR != "nco" ]; then
-    create_symlink_to_file target="${post_renamed_fn}" \
-                         symlink="${FID}${symlink_suffix}" \
-                         relative="TRUE"
+  post_fn_suffix="GrbF${post_fhr}${dot_post_mn_or_null}"
+  post_renamed_fn_suffix="f${fhr}${post_mn_or_null}.${POST_OUTPUT_DOMAIN_NAME}.grib2"
+  #
+  # For convenience, change location to COMOUT (where the final output
+  # from UPP will be located).  Then loop through the two files that UPP
+  # generates (i.e. "...prslev..." and "...natlev..." files) and move, 
+  # rename, and create symlinks to them.
+  #
+  cd_vrfy "${COMOUT}"
+  basetime=$( $DATE_UTIL --date "$yyyymmdd $hh" +%y%j%H%M )
+  symlink_suffix="${dot_ensmem}.${basetime}f${fhr}${post_mn}"
+  if [ "${CPL_AQM}" = "TRUE" ]; then
+    fids=( "cmaq" )
+  else
+    fids=( "prslev" "natlev" )
   fi
-  # DBN alert
-  if [ $SENDDBN = "TRUE" ]; then
-    $DBNROOT/bin/dbn_alert MODEL rrfs_post ${job} ${COMOUT}/${post_renamed_fn}
+  for fid in "${fids[@]}"; do
+    FID=$(echo_uppercase $fid)
+    post_orig_fn="${FID}.${post_fn_suffix}"
+    post_renamed_fn="${NET}.${cycle}${dot_ensmem}.${fid}.${post_renamed_fn_suffix}"
+    mv_vrfy ${DATA_FHR}/${post_orig_fn} ${post_renamed_fn}
+    if [ $RUN_ENVIR != "nco" ]; then
+      create_symlink_to_file target="${post_renamed_fn}" \
+                           symlink="${FID}${symlink_suffix}" \
+                           relative="TRUE"
+    fi
+    # DBN alert
+    if [ $SENDDBN = "TRUE" ]; then
+      $DBNROOT/bin/dbn_alert MODEL rrfs_post ${job} ${COMOUT}/${post_renamed_fn}
+    fi
+  done
+
+  # Move phy and dyn files to COMIN only for AQM in NCO mode
+  if [ "${CPL_AQM}" = "TRUE" ] && [ "${RUN_ENVIR}" = "nco" ]; then
+    mv_vrfy ${dyn_file} ${COMIN}/${NET}.${cycle}${dot_ensmem}.dyn.f${fhr}.nc
+    mv_vrfy ${phy_file} ${COMIN}/${NET}.${cycle}${dot_ensmem}.phy.f${fhr}.nc
   fi
+
+  rm_vrfy -rf ${DATA_FHR}
+
 done
 
-# Move phy and dyn files to COMIN only for AQM in NCO mode
-if [ "${CPL_AQM}" = "TRUE" ] && [ "${RUN_ENVIR}" = "nco" ]; then
-  mv_vrfy ${dyn_file} ${COMIN}/${NET}.${cycle}${dot_ensmem}.dyn.f${fhr}.nc
-  mv_vrfy ${phy_file} ${COMIN}/${NET}.${cycle}${dot_ensmem}.phy.f${fhr}.nc
+if [ -n "${fhr_end:-}" ]; then
+  rm_vrfy -rf ${DATA_POST}
 fi
 
-rm_vrfy -rf ${DATA_FHR}
-
 # Delete the forecast directory
 if [ $RUN_ENVIR = "nco" ] && [ $KEEPDATA = "FALSE" ]; then
    rm -rf $DATAFCST
@@ -309,7 +379,7 @@ fi
 #
 print_info_msg "
 ========================================================================
-Post-processing for forecast hour $fhr completed successfully.
+Post-processing for ${post_hrs_msg} completed successfully.
 
 Exiting script:  \"${scrfunc_fn}\"
 In directory:    \"${scrfunc_dir}\"
@@ -22,6 +22,12 @@ Examples:
 
       python create_WE2E_resource_summary.py -e /path/to/expt_dir -c $0.15
 
+    To break the usage down by task and number of tries, and also save it to a
+    CSV file labeled with the release it was run for
+
+      python create_WE2E_resource_summary.py -e /path/to/expt_dir \
+        -g task tries --csv usage.csv --label v2.1.0
+
 Information about the output summary.
 
  - The core hours are an underestimate in many cases.
@@ -46,7 +52,13 @@ import argparse
 import glob
 import os
 import sys
-import sqlite3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../ush"))
+
+from python_utils import (
+    experiments_job_stats,
+    write_job_stats_csv,
+)
 
 REPORT_WIDTH = 110
 
@@ -85,58 +97,49 @@ def parse_args(argv):
         Only supports homogenous clusters.',
         type=float,
         )
+    parser.add_argument(
+        '-g', '--group_by',
+        choices=['task', 'cycle', 'tries', 'state'],
+        default=[],
+        help='Break the usage of each experiment down by task, cycle, number \
+        of tries and/or final job state.',
+        nargs='*',
+        )
+    parser.add_argument(
+        '--csv',
+        help='Also write the usage to this CSV file, one row per experiment \
+        (and group).',
+        )
+    parser.add_argument(
+        '--label',
+        help='Value of a "label" column added to the CSV file, e.g. a release \
+        tag, so that files from several runs can be combined.',
+        )
+    parser.add_argument(
+        '-p', '--procs',
+        default=8,
+        help='Number of experiment databases to read at the same time.',
+        type=int,
+        )
 
     return parser.parse_args(argv)
 
-def get_workflow_info(db_path):
-
-    ''' Given the path to a Rocoto database, return the total number of tasks,
-    core hours and wall time for the workflow. '''
-
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
-
-    # jobs schema is:
-    # (id INTEGER PRIMARY KEY, jobid VARCHAR(64), taskname VARCHAR(64), cycle
-    # DATETIME, cores INTEGER, state VARCHAR(64), native_state VARCHAR[64],
-    # exit_status INTEGER, tries INTEGER, nunknowns INTEGER, duration REAL)
-    #
-    # an example:
-    # 5|66993580|make_sfc_climo|1597017600|48|SUCCEEDED|COMPLETED|0|1|0|83.0
-    try:
-        cur.execute('SELECT cores, duration from jobs')
-    except sqlite3.OperationalError:
-        return 0, 0, 0
-
-    workflow_info = cur.fetchall()
-
-    core_hours = 0
-    wall_time = 0
-    ntasks = 0
-    for cores, duration in workflow_info:
-        core_hours += cores * duration / 3600
-        wall_time += duration / 60
-        ntasks += 1
-
-    return ntasks, core_hours, wall_time
-
-
-def fetch_expt_summaries(expts):
+def fetch_expt_summaries(expts, group_by=(), procs=8):
 
     ''' Get the important information from the database of each experiment, and
-    return a list, sorted by experiment name. '''
+    return a list of dictionaries (one per experiment, or per group of jobs of
+    each experiment), sorted by experiment name. '''
 
-    summaries = []
+    db_paths = {}
     for expt in expts:
         test_name = expt.split('/')[-1]
         db_path = os.path.join(expt, 'FV3LAM_wflow.db')
         if not os.path.exists(db_path):
             print(f'No FV3LAM_wflow.db exists for expt: {test_name}')
             continue
-        ntasks, core_hours, wall_time = get_workflow_info(db_path)
-        summaries.append((test_name, ntasks, core_hours, wall_time))
+        db_paths[test_name] = db_path
 
-    return sorted(summaries)
+    return experiments_job_stats(db_paths, group_by, max_workers=procs)
 
 def generate_report(argv):
 
@@ -151,6 +154,11 @@ def generate_report(argv):
             os.path.join(cla.expt_path, expt)
             ))
 
+    summaries = fetch_expt_summaries(experiments, cla.group_by, cla.procs)
+    if cla.csv:
+        extra_columns = {'label': cla.label} if cla.label else None
+        write_job_stats_csv(summaries, cla.csv, extra_columns)
+
     header = f'{" "*60} Core Hours  |  Run Time (mins)'
     if cla.cost_per_core_hour:
         header = f'{header}  |  Est. Cost ($) '
@@ -162,7 +170,13 @@ def generate_report(argv):
 
     total_ch = 0
     total_cost = 0
-    for name, ntasks, ch, wt in fetch_expt_summaries(experiments):
+    for summary in summaries:
+        name = summary['experiment']
+        ch = summary['core_hours']
+        wt = summary['wall_time_mins']
+        if cla.group_by:
+            group = ' '.join(str(summary[key]) for key in cla.group_by)
+            name = f'{name[:58 - len(group)]}  {group}'
         line = f'{name[:60]:<60s} {ch:^12.2f} {wt:^20.1f}'
         if cla.cost_per_core_hour:
             cost = ch * cla.cost_per_core_hour
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import argparse
 import logging
 import subprocess
 import sqlite3
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from textwrap import dedent
 from datetime import datetime
 from contextlib import closing
@@ -20,14 +22,27 @@ from python_utils import (
 from check_python_version import check_python_version
 
 
-def monitor_jobs(expt_dict: dict, monitor_file: str = '', debug: bool = False) -> str:
+# Seconds between checks of an experiment, by experiment status. An experiment whose jobs did
+# not change since the last check is checked less often, up to POLL_INTERVAL_MAX, so that
+# status updates still come within seconds
+POLL_INTERVALS = {"SUBMITTING": 2, "SUCCEEDED": 2, "DYING": 5, "RUNNING": 5, "QUEUED": 5}
+POLL_INTERVAL_MAX = 10
+
+
+def monitor_jobs(expt_dict: dict, monitor_file: str = '', debug: bool = False, procs: int = 8) -> str:
     """Function to monitor and run jobs for the specified experiment using Rocoto
 
+    Experiments are checked concurrently, by up to "procs" threads, each running rocotorun
+    for one experiment at a time. Each experiment is checked on its own schedule, which
+    depends on its status and on whether its jobs changed at the last check (see
+    POLL_INTERVALS).
+
     Args:
         expt_dict   (dict): A dictionary containing the information needed to run
                             one or more experiments. See example file monitor_jobs.yaml
         monitor_file (str): [optional]
         debug       (bool): [optional] Enable extra output for debugging
+        procs        (int): [optional] Number of experiments to check at the same time
     Returns:
         str: The name of the file used for job monitoring (when script is finished, this 
              contains results/summary)
@@ -42,40 +57,79 @@ def monitor_jobs(expt_dict: dict, monitor_file: str = '', debug: bool = False) -
 
     write_monitor_file(monitor_file,expt_dict)
 
-    # Perform initial setup for each experiment
-    logging.info("Checking tests available for monitoring...")
-    for expt in expt_dict:
-        logging.info(f"Starting experiment {expt} running")
-        expt_dict[expt] = update_expt_status(expt_dict[expt], expt, True)
+    # Rocoto database contents read so far, for each experiment
+    db_state = {expt: dict() for expt in expt_dict}
+    procs = max(1, min(procs, len(expt_dict)))
 
-    write_monitor_file(monitor_file,expt_dict)
+    # Each check is given a copy of the experiment's dictionary, which is only put back into
+    # expt_dict by this thread, so that write_monitor_file() never sees a dictionary changing
+    with ThreadPoolExecutor(max_workers=procs) as executor:
 
-    logging.info(f'Setup complete; monitoring {len(expt_dict)} experiments')
+        # Perform initial setup for each experiment
+        logging.info("Checking tests available for monitoring...")
+        futures = dict()
+        for expt in expt_dict:
+            logging.info(f"Starting experiment {expt} running")
+            futures[executor.submit(update_expt_status, dict(expt_dict[expt]), expt, True,
+                                    db_state[expt])] = expt
+        for future, expt in futures.items():
+            expt_dict[expt] = future.result()
 
-    #Make a copy of experiment dictionary; will use this copy to monitor active experiments
-    running_expts = expt_dict.copy()
+        write_monitor_file(monitor_file,expt_dict)
 
-    i = 0
-    while running_expts:
-        i += 1
-        for expt in running_expts.copy():
-            expt_dict[expt] = update_expt_status(expt_dict[expt], expt)
-            running_expts[expt] = expt_dict[expt]
-            if running_expts[expt]["status"] in ['DEAD','ERROR','COMPLETE']: 
-                logging.info(f'Experiment {expt} is {running_expts[expt]["status"]}; will no longer monitor.')
-                running_expts.pop(expt)
+        logging.info(f'Setup complete; monitoring {len(expt_dict)} experiments with {procs} threads')
+
+        #Time of the next check and polling interval of each active experiment
+        now = time.monotonic()
+        running_expts = dict()
+        for expt in expt_dict:
+            if expt_dict[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
+                logging.info(f'Experiment {expt} is {expt_dict[expt]["status"]}; will no longer monitor.')
+            else:
+                running_expts[expt] = [now, POLL_INTERVALS.get(expt_dict[expt]["status"], 5)]
+
+        futures = dict()
+        i = 0
+        while running_expts:
+            # Start checks of the experiments that are due and not already being checked
+            now = time.monotonic()
+            checking = set(futures.values())
+            for expt, (next_poll, _) in running_expts.items():
+                if expt not in checking and next_poll <= now:
+                    futures[executor.submit(update_expt_status, dict(expt_dict[expt]), expt,
+                                            False, db_state[expt])] = expt
+
+            if futures:
+                timeout = None
+            else:
+                timeout = max(0, min(t for t, _ in running_expts.values()) - now)
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
                 continue
-            logging.debug(f'Experiment {expt} status is {expt_dict[expt]["status"]}')
 
+            i += 1
+            now = time.monotonic()
+            for future in done:
+                expt = futures.pop(future)
+                status = expt_dict[expt]["status"]
+                expt_dict[expt] = future.result()
+                if expt_dict[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
+                    logging.info(f'Experiment {expt} is {expt_dict[expt]["status"]}; will no longer monitor.')
+                    running_expts.pop(expt)
+                    continue
+                logging.debug(f'Experiment {expt} status is {expt_dict[expt]["status"]}')
 
-        write_monitor_file(monitor_file,expt_dict)
-        endtime = datetime.now()
-        total_walltime = endtime - starttime
+                # Check again soon after a change; otherwise back off
+                interval = POLL_INTERVALS.get(expt_dict[expt]["status"], 5)
+                if expt_dict[expt]["status"] == status and not db_state[expt].get("changed"):
+                    interval = min(max(interval, 2 * running_expts[expt][1]), POLL_INTERVAL_MAX)
+                running_expts[expt] = [now + interval, interval]
 
-        logging.debug(f"Finished loop {i}\nWalltime so far is {str(total_walltime)}")
-        
-        #Slow things down just a tad between loops so experiments behave better
-        time.sleep(5)
+            write_monitor_file(monitor_file,expt_dict)
+            endtime = datetime.now()
+            total_walltime = endtime - starttime
+
+            logging.debug(f"Finished update {i}\nWalltime so far is {str(total_walltime)}")
 
 
     endtime = datetime.now()
@@ -85,7 +139,47 @@ def monitor_jobs(expt_dict: dict, monitor_file: str = '', debug: bool = False) -
 
     return monitor_file
 
-def update_expt_status(expt: dict, name: str, refresh: bool = False) -> dict:
+
+def read_rocoto_db(rocoto_db: str, db_state: dict) -> list:
+    """
+    This function reads the jobs of an experiment from its rocoto database, returning a list of
+    tuples containing the taskname, cycle, and state of each job respectively.
+
+    If db_state is given, the database is not queried at all if the file has not been modified
+    since the last call with the same db_state, and an empty list is returned. Otherwise the whole
+    jobs table is read, since rocoto may rewrite any row, and db_state["changed"] tells whether
+    any job differs from the last read.
+
+    Args:
+        rocoto_db (str): Path to the rocoto database file
+        db_state (dict): Information about the previous reads; updated in place
+    Returns:
+        list: (taskname, cycle, state) of each job read
+    """
+
+    if db_state is None:
+        with closing(sqlite3.connect(rocoto_db)) as connection:
+            with closing(connection.cursor()) as cur:
+                return cur.execute('SELECT taskname,cycle,state from jobs').fetchall()
+
+    st = os.stat(rocoto_db)
+    file_id = (st.st_mtime_ns, st.st_size)
+    db_state["changed"] = False
+    if db_state.get("file_id") == file_id:
+        return []
+
+    with closing(sqlite3.connect(rocoto_db)) as connection:
+        with closing(connection.cursor()) as cur:
+            db = cur.execute('SELECT taskname,cycle,state from jobs').fetchall()
+
+    jobs = set(db)
+    db_state["changed"] = jobs != db_state.get("jobs")
+    db_state["jobs"] = jobs
+    db_state["file_id"] = file_id
+    return db
+
+
+def update_expt_status(expt: dict, name: str, refresh: bool = False, db_state: dict = None) -> dict:
     """
     This function reads the dictionary showing the location of a given experiment, runs a
     `rocotorun` command to update the experiment (running new jobs and updating the status of
@@ -127,6 +221,9 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False) -> dict:
         refresh (bool):    If true, this flag will check an experiment status even if it is listed
                            as DEAD, ERROR, or COMPLETE. Used for initial checks for experiments
                            that may have been restarted.
+        db_state (dict):   [optional] Information about previous reads of the experiment's rocoto
+                           database, so that only jobs that may have changed are read; see
+                           read_rocoto_db()
     Returns:
         dict: The updated experiment dictionary.
     """
@@ -142,11 +239,7 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False) -> dict:
 
     logging.debug(f"Reading database for experiment {name}, updating experiment dictionary")
     try:
-        # This section of code queries the "job" table of the rocoto database, returning a list
-        # of tuples containing the taskname, cycle, and state of each job respectively
-        with closing(sqlite3.connect(rocoto_db)) as connection:
-            with closing(connection.cursor()) as cur:
-                db = cur.execute('SELECT taskname,cycle,state from jobs').fetchall()
+        db = read_rocoto_db(rocoto_db, db_state)
     except:
         logging.warning(f"Unable to read database {rocoto_db}\nCan not track experiment {name}")
         expt["status"] = "ERROR"
@@ -251,6 +344,7 @@ if __name__ == "__main__":
 
     parser.add_argument('-y', '--yaml_file', type=str, help='YAML-format file specifying the information of jobs to be run; for an example file, see monitor_jobs.yaml', required=True)
     parser.add_argument('-d', '--debug', action='store_true', help='Script will be run in debug mode with more verbose output')
+    parser.add_argument('-p', '--procs', type=int, default=8, help='Number of experiments to check at the same time')
 
     args = parser.parse_args()
 
@@ -261,7 +355,7 @@ if __name__ == "__main__":
     #Call main function
 
     try:
-        monitor_jobs(expt_dict,args.yaml_file, args.debug)
+        monitor_jobs(expt_dict,args.yaml_file, args.debug, args.procs)
     except:
         logging.exception(
             dedent(
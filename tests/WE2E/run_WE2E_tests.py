@@ -2,9 +2,11 @@
 
 import os
 import sys
-import glob
+import shutil
 import argparse
 import logging
+import tempfile
+import multiprocessing
 from textwrap import dedent
 
 sys.path.append("../../ush")
@@ -18,6 +20,7 @@ from python_utils import (
 from check_python_version import check_python_version
 
 from monitor_jobs import monitor_jobs
+from we2e_catalog import WE2ECatalog
 
 
 def run_we2e_tests(homedir, args) -> None:
@@ -45,6 +48,9 @@ def run_we2e_tests(homedir, args) -> None:
         if run_envir not in ['nco', 'community']:
             raise KeyError(f"Invalid 'run_envir' provided: {run_envir}")
 
+    # Find and read all test configs
+    catalog = WE2ECatalog(cache_file=args.catalog)
+
     # If args.tests is a list of length more than one, we assume it is a list of test names
     if len(args.tests) > 1:
         tests_to_check=args.tests
@@ -53,19 +59,14 @@ def run_we2e_tests(homedir, args) -> None:
         #First see if args.tests is a valid test name
         user_spec_tests = args.tests
         logging.debug(f'Checking if {user_spec_tests} is a valid test name')
-        match = check_test(user_spec_tests[0])
+        match = check_test(user_spec_tests[0], catalog)
         if match:
             tests_to_check = user_spec_tests
         else:
             # If not a valid test name, check if it is a test suite
             logging.debug(f'Checking if {user_spec_tests} is a valid test suite')
             if user_spec_tests[0] == 'all':
-                alltests = glob.glob('test_configs/**/config*.yaml', recursive=True)
-                tests_to_check = []
-                for f in alltests:
-                    filename = os.path.basename(f)
-                    # We just want the test namein this list, so cut out the "config." prefix and ".yaml" extension
-                    tests_to_check.append(filename[7:-5])
+                tests_to_check = catalog.names()
                 logging.debug(f"Will check all tests:\n{tests_to_check}")
             elif user_spec_tests[0] in ['fundamental', 'comprehensive']:
                 # I am writing this section of code under protest; we should use args.run_envir to check for run_envir-specific files!
@@ -110,7 +111,7 @@ def run_we2e_tests(homedir, args) -> None:
 
     logging.info("Checking that all tests are valid")
 
-    tests_to_run=check_tests(tests_to_check)
+    tests_to_run=check_tests(tests_to_check, catalog)
 
     pretty_list = "\n".join(str(x) for x in tests_to_run)
     logging.info(f'Will run {len(tests_to_run)} tests:\n{pretty_list}')
@@ -128,12 +129,13 @@ def run_we2e_tests(homedir, args) -> None:
     if not args.use_cron_to_relaunch:
         monitor_yaml = dict()
 
+    test_cfgs = {}
     for test in tests_to_run:
         #Starting with test yaml template, fill in user-specified and machine- and
         # test-specific options, then write resulting complete config.yaml
         test_name = os.path.basename(test).split('.')[1]
         logging.debug(f"For test {test_name}, constructing config.yaml")
-        test_cfg = load_config_file(test)
+        test_cfg = catalog.config(test_name)
 
         test_cfg['user'].update({"MACHINE": machine})
         test_cfg['user'].update({"ACCOUNT": args.account})
@@ -178,22 +180,33 @@ def run_we2e_tests(homedir, args) -> None:
         test_cfg['verification'] = check_task_verification(test_cfg,machine_defaults,config_defaults)
         logging.debug(test_cfg['verification'])
 
-        logging.debug(f"Writing updated config.yaml for test {test_name}\nbased on specified command-line arguments:\n")
+        logging.debug(f"Updated config.yaml for test {test_name}\nbased on specified command-line arguments:\n")
         logging.debug(cfg_to_yaml_str(test_cfg))
-        with open(ushdir + "/config.yaml","w") as f:
-            f.writelines(cfg_to_yaml_str(test_cfg))
-
-        logging.info(f"Calling workflow generation function for test {test_name}\n")
-        if args.quiet:
-            console_handler = logging.getLogger().handlers[1]
-            console_handler.setLevel(logging.WARNING)
-        expt_dir = generate_FV3LAM_wflow(ushdir,logfile=f"{ushdir}/log.generate_FV3LAM_wflow",debug=args.debug)
-        if args.quiet:
-            if args.debug:
-                console_handler.setLevel(logging.DEBUG)
-            else:
-                console_handler.setLevel(logging.INFO)
-        logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dir}\n")
+        test_cfgs[test_name] = test_cfg
+
+    if args.procs == 1:
+        expt_dirs = {}
+        for test_name, test_cfg in test_cfgs.items():
+            logging.debug(f"Writing config.yaml for test {test_name}")
+            with open(ushdir + "/config.yaml","w") as f:
+                f.writelines(cfg_to_yaml_str(test_cfg))
+
+            logging.info(f"Calling workflow generation function for test {test_name}\n")
+            if args.quiet:
+                console_handler = logging.getLogger().handlers[1]
+                console_handler.setLevel(logging.WARNING)
+            expt_dirs[test_name] = generate_FV3LAM_wflow(ushdir,logfile=f"{ushdir}/log.generate_FV3LAM_wflow",debug=args.debug)
+            if args.quiet:
+                if args.debug:
+                    console_handler.setLevel(logging.DEBUG)
+                else:
+                    console_handler.setLevel(logging.INFO)
+            logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dirs[test_name]}\n")
+    else:
+        expt_dirs = generate_tests_parallel(ushdir, test_cfgs, args.procs, debug=args.debug)
+
+    for test_name, test_cfg in test_cfgs.items():
+        expt_dir = expt_dirs[test_name]
         # If this job is not using crontab, we need to add an entry to monitor.yaml
         if 'USE_CRON_TO_RELAUNCH' not in test_cfg['workflow']:
             test_cfg['workflow'].update({"USE_CRON_TO_RELAUNCH": False})
@@ -214,45 +227,119 @@ def run_we2e_tests(homedir, args) -> None:
 
 
 
-def check_tests(tests: list) -> list:
+def generate_test(ushdir: str, test_name: str, test_cfg: dict, debug: bool = False) -> tuple:
+    """
+    Function for generating the experiment for one test in a worker process. The test's config
+    file and generation log are written to a directory of their own, so that several tests can
+    be generated at the same time.
+
+    Args:
+        ushdir    (str): The full path of the ush directory
+        test_name (str): Name of the test
+        test_cfg (dict): Complete config for the test
+        debug    (bool): Enable extra output for debugging
+    Returns:
+        tuple : test name, experiment directory (None on failure), and an error message
+    """
+
+    workdir = tempfile.mkdtemp(prefix=f"{test_name}.")
+    config_fp = os.path.join(workdir, "config.yaml")
+    logfile = os.path.join(workdir, "log.generate_FV3LAM_wflow")
+    with open(config_fp, "w") as f:
+        f.writelines(cfg_to_yaml_str(test_cfg))
+
+    # Don't share the parent's log file and console; only warnings go to the console
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    console = logging.StreamHandler()
+    console.setLevel(logging.WARNING)
+    console.setFormatter(logging.Formatter(f"{test_name}: %(levelname)s %(message)s"))
+    root.addHandler(console)
+
+    try:
+        expt_dir = generate_FV3LAM_wflow(ushdir, logfile=logfile, debug=debug, config_fn=config_fp)
+    except Exception as e:
+        logging.exception(f"Workflow generation failed; see {logfile}")
+        return test_name, None, f"{type(e).__name__}: {e} (log file: {logfile})"
+    shutil.rmtree(workdir, ignore_errors=True)
+    return test_name, expt_dir, ""
+
+
+def generate_tests_parallel(ushdir: str, test_cfgs: dict, procs: int, debug: bool = False) -> dict:
+    """
+    Function for generating the experiments for a set of tests in parallel. Each test is
+    generated in a new worker process, since workflow generation sets process-wide state
+    (environment variables and module globals).
+
+    Args:
+        ushdir     (str): The full path of the ush directory
+        test_cfgs (dict): Complete config for each test, keyed by test name
+        procs      (int): Number of tests to generate at the same time; all cores if <= 0
+        debug     (bool): Enable extra output for debugging
+    Returns:
+        dict : experiment directory of each test, keyed by test name
+    """
+
+    if procs <= 0:
+        procs = os.cpu_count()
+    procs = min(procs, len(test_cfgs)) or 1
+    logging.info(f"Generating {len(test_cfgs)} experiments with {procs} processes\n")
+
+    expt_dirs = {}
+    errors = {}
+    jobs = [(ushdir, test_name, test_cfg, debug) for test_name, test_cfg in test_cfgs.items()]
+    with multiprocessing.Pool(procs, maxtasksperchild=1) as pool:
+        for test_name, expt_dir, error in pool.imap_unordered(_generate_test_job, jobs):
+            if error:
+                logging.error(f"Workflow generation for test {test_name} failed:\n{error}\n")
+                errors[test_name] = error
+            else:
+                logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dir}\n")
+                expt_dirs[test_name] = expt_dir
+
+    if errors:
+        pretty_list = "\n".join(errors)
+        raise Exception(f"Workflow generation failed for {len(errors)} tests:\n{pretty_list}")
+    return expt_dirs
+
+
+def _generate_test_job(job: tuple) -> tuple:
+    """Unpack the arguments of generate_test for Pool.imap_unordered"""
+    return generate_test(*job)
+
+
+def check_tests(tests: list, catalog: WE2ECatalog = None) -> list:
     """
     Function for checking that all tests in a provided list of tests are valid
 
     Args:
         tests        : List of potentially valid test names
+        catalog      : [optional] Catalog of all tests; built from test_configs/ if not given.
+                       Building the catalog fails if test file names are not unique.
     Returns:
         tests_to_run : List of config files corresponding to test names
     """
 
-    testfiles = glob.glob('test_configs/**/config*.yaml', recursive=True)
-    # Check that there are no duplicate test filenames
-    testfilenames=[]
-    for testfile in testfiles:
-        if os.path.basename(testfile) in testfilenames:
-            duplicates = glob.glob('test_configs/**/' + os.path.basename(testfile), recursive=True)
-            raise Exception(dedent(f"""
-                            Found duplicate test file names:
-                            {duplicates}
-                            Ensure that each test file name under the test_configs/ directory
-                            is unique.
-                            """))
-        testfilenames.append(os.path.basename(testfile))
+    if catalog is None:
+        catalog = WE2ECatalog()
     tests_to_run=[]
     for test in tests:
         # Skip blank/empty testnames; this avoids failure if newlines or spaces are included
         if not test or test.isspace():
             continue
-        match = check_test(test)
+        match = check_test(test, catalog)
         if not match:
             raise Exception(f"Could not find test {test}")
         tests_to_run.append(match)
     # Because some test files are symlinks to other tests, check that we don't
     # include the same test twice
     for testfile in tests_to_run.copy():
-        if os.path.islink(testfile):
-            if os.path.realpath(testfile) in tests_to_run:
+        target = catalog.target(os.path.basename(testfile)[7:-5])
+        if target:
+            if target in tests_to_run:
                 logging.warning(dedent(f"""WARNING: test file {testfile} is a symbolic link to a
-                                test file ({os.path.realpath(testfile)}) that is also included in the
+                                test file ({target}) that is also included in the
                                 test list. Only the latter test will be run."""))
                 tests_to_run.remove(testfile)
     if len(tests_to_run) != len(set(tests_to_run)):
@@ -262,24 +349,21 @@ def check_tests(tests: list) -> list:
 
 
 
-def check_test(test: str) -> str:
+def check_test(test: str, catalog: WE2ECatalog = None) -> str:
     """
     Function for checking that a string corresponds to a valid test name
 
     Args:
-        test (str) : String of potential test name
+        test (str)            : String of potential test name
+        catalog (WE2ECatalog) : [optional] Catalog of all tests; built from test_configs/ if not given
     Returns:
         str        : File name of test config file (empty string if no test file found)
     """
-    # potential test files
-    testfiles = glob.glob('test_configs/**/config*.yaml', recursive=True)
-    # potential test file for input test name
-    test_config=f'config.{test.strip()}.yaml'
-    config = ''
-    for testfile in testfiles:
-        if test_config in testfile:
-            logging.debug(f"found test {test}, testfile {testfile}")
-            config = os.path.abspath(testfile)
+    if catalog is None:
+        catalog = WE2ECatalog()
+    config = catalog.path(test)
+    if config:
+        logging.debug(f"found test {test}, testfile {config}")
     return config
 
 
@@ -496,6 +580,10 @@ if __name__ == "__main__":
     parser.add_argument('-c', '--compiler', type=str, help='Compiler used for building the app', default='intel')
     parser.add_argument('-d', '--debug', action='store_true', help='Script will be run in debug mode with more verbose output')
     parser.add_argument('-q', '--quiet', action='store_true', help='Suppress console output from workflow generation; this will help keep the screen uncluttered')
+    parser.add_argument('--catalog', type=str, help='JSON file in which to store the catalog of all tests, '\
+                        'so that test configs are only read again when they change')
+    parser.add_argument('-p', '--procs', type=int, default=1, help='Number of experiments to generate in parallel; 0 uses all cores. '\
+                        'In parallel mode, output from workflow generation goes to each experiment\'s log file')
 
 
     parser.add_argument('--modulefile', type=str, help='Modulefile used for building the app')
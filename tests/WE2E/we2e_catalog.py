@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+Catalog of the WE2E tests under test_configs/.
+
+The catalog is built by walking test_configs/ once. For each test it holds
+the config file, the test it is a symbolic link to (if any), the parsed
+test config, and a few properties taken from the config (grid, physics
+suite, external models, ...) that can be used to select tests, e.g.
+
+    python3 we2e_catalog.py grid=RRFS_CONUS_3km suite=FV3_HRRR
+
+lists the tests run on the RRFS_CONUS_3km grid with the HRRR suite.
+
+The catalog can be stored in a JSON file. A stored catalog is reused as
+long as no test was added, removed or modified since it was written.
+"""
+
+import os
+import sys
+import copy
+import json
+import argparse
+import logging
+from textwrap import dedent
+
+sys.path.append("../../ush")
+
+from python_utils import load_config_file
+
+
+TEST_CONFIGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_configs")
+
+# Properties of each test, and where they are found in the test config
+PROPERTIES = {
+    "grid": ("workflow", "PREDEF_GRID_NAME"),
+    "suite": ("workflow", "CCPP_PHYS_SUITE"),
+    "ics": ("task_get_extrn_ics", "EXTRN_MDL_NAME_ICS"),
+    "lbcs": ("task_get_extrn_lbcs", "EXTRN_MDL_NAME_LBCS"),
+    "run_envir": ("user", "RUN_ENVIR"),
+}
+
+CACHE_VERSION = 1
+
+
+class WE2ECatalog:
+    """Catalog of the WE2E tests, indexed by test name
+
+    Args:
+        test_dir (str): directory containing the test config files
+        cache_file (str): [optional] JSON file in which the catalog is stored
+    """
+
+    def __init__(self, test_dir: str = TEST_CONFIGS_DIR, cache_file: str = None):
+        self.test_dir = os.path.abspath(test_dir)
+        self.cache_file = cache_file
+        self.tests = dict()
+        self.dirs = dict()
+
+        cached = self._read_cache()
+        if cached and cached["dirs"] == self._dir_mtimes():
+            self.dirs = cached["dirs"]
+            self.tests = cached["tests"]
+            stale = [name for name, test in self.tests.items()
+                     if test["file_id"] != _file_id(test["path"])]
+            for name in stale:
+                logging.debug(f"Test {name} was modified; reading it again")
+                self.tests[name] = self._read_test(self.tests[name]["path"])
+            if stale:
+                self._write_cache()
+        else:
+            self._scan()
+            self._write_cache()
+
+    def _dir_mtimes(self) -> dict:
+        """Modification times of the test directories, which change when tests are added,
+        removed or renamed"""
+        dirs = dict()
+        for dirpath, dirnames, _ in os.walk(self.test_dir):
+            dirnames.sort()
+            dirs[dirpath] = os.stat(dirpath).st_mtime_ns
+        return dirs
+
+    def _scan(self):
+        """Find and read all test config files"""
+        logging.debug(f"Building test catalog from {self.test_dir}")
+        self.dirs = self._dir_mtimes()
+        self.tests = dict()
+        for dirpath in self.dirs:
+            for filename in sorted(os.listdir(dirpath)):
+                if not (filename.startswith("config.") and filename.endswith(".yaml")):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = get_test_name(path)
+                if name in self.tests:
+                    raise Exception(dedent(f"""
+                                    Found duplicate test file names:
+                                    {[self.tests[name]["path"], path]}
+                                    Ensure that each test file name under the test_configs/ directory
+                                    is unique.
+                                    """))
+                self.tests[name] = self._read_test(path)
+
+    @staticmethod
+    def _read_test(path: str) -> dict:
+        """Read the config file of a test and collect its properties"""
+        config = load_config_file(path)
+        test = {
+            "path": path,
+            "target": os.path.realpath(path) if os.path.islink(path) else None,
+            "file_id": _file_id(path),
+            "config": config,
+            "description": config.get("metadata", {}).get("description", ""),
+            "switches": config.get("workflow_switches", {}),
+        }
+        for prop, (section, key) in PROPERTIES.items():
+            test[prop] = config.get(section, {}).get(key)
+        return test
+
+    def _read_cache(self) -> dict:
+        if not self.cache_file or not os.path.isfile(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("version") != CACHE_VERSION or cached.get("test_dir") != self.test_dir:
+            return None
+        return cached
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        temp_file = f"{self.cache_file}.{os.getpid()}"
+        with open(temp_file, "w") as f:
+            json.dump({"version": CACHE_VERSION, "test_dir": self.test_dir,
+                       "dirs": self.dirs, "tests": self.tests}, f, default=str)
+        os.replace(temp_file, self.cache_file)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tests
+
+    def __len__(self) -> int:
+        return len(self.tests)
+
+    def names(self) -> list:
+        """Names of all tests"""
+        return list(self.tests)
+
+    def path(self, name: str) -> str:
+        """Config file of a test (empty string if there is no such test)"""
+        test = self.tests.get(name.strip())
+        return test["path"] if test else ""
+
+    def target(self, name: str) -> str:
+        """Config file of the test that a test is a symbolic link to (None if not a link)"""
+        return self.tests[name]["target"]
+
+    def config(self, name: str) -> dict:
+        """Copy of the test config of a test"""
+        return copy.deepcopy(self.tests[name]["config"])
+
+    def info(self, name: str) -> dict:
+        """Properties of a test, without its config"""
+        return {k: v for k, v in self.tests[name].items() if k not in ["config", "file_id"]}
+
+    def find(self, **criteria) -> list:
+        """Names of the tests matching all of the given criteria. Criteria are properties
+        (see PROPERTIES) or config settings given as "section.KEY", e.g.
+
+            catalog.find(grid="RRFS_CONUS_3km")
+            catalog.find(**{"workflow.FCST_LEN_HRS": 6})
+
+        Values are compared as strings; None matches tests that do not set the property.
+        """
+        matches = []
+        for name, test in self.tests.items():
+            for key, value in criteria.items():
+                if "." in key:
+                    section, option = key.split(".", 1)
+                    actual = test["config"].get(section, {}).get(option)
+                else:
+                    actual = test.get(key)
+                if value is None:
+                    if actual is not None:
+                        break
+                elif actual is None or str(actual) != str(value):
+                    break
+            else:
+                matches.append(name)
+        return matches
+
+
+def get_test_name(path: str) -> str:
+    """Name of a test given its config file (the file name without the "config." prefix and
+    ".yaml" extension)"""
+    return os.path.basename(path)[7:-5]
+
+
+def _file_id(path: str) -> list:
+    """Size and modification time of a file (following symbolic links)"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="List the WE2E tests matching the given criteria\n")
+    parser.add_argument('criteria', nargs='*', help='Criteria given as key=value; keys are '
+                        f'{", ".join(PROPERTIES)} or config settings given as section.KEY')
+    parser.add_argument('-c', '--cache_file', type=str, help='JSON file in which to store the catalog')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Also print the properties of each test')
+
+    args = parser.parse_args()
+
+    criteria = dict()
+    for criterion in args.criteria:
+        key, sep, value = criterion.partition("=")
+        if not sep:
+            parser.error(f"Criteria must be given as key=value, not {criterion}")
+        criteria[key] = value
+
+    catalog = WE2ECatalog(cache_file=args.cache_file)
+    for name in catalog.find(**criteria):
+        print(name)
+        if args.verbose:
+            for key, value in catalog.info(name).items():
+                if key != "description":
+                    print(f"    {key}: {value}")
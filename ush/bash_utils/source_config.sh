@@ -43,11 +43,39 @@ function source_config() {
 #
 #-----------------------------------------------------------------------
 # Source partial contents of a config file to shell script.
-#   Only those variables needed by the task are sourced
+#   Only those variables needed by the task are sourced, i.e. those in
+#   sections that are not task sections or whose names match the
+#   pattern given as the first argument.
+#
+#   For a shell config file such as var_defns.sh, the sections are read
+#   from the per-section files that the workflow generation writes next
+#   to it (see cfg_to_shell_files in python_utils), so no Python process
+#   is started. If the config file has changed since those files were
+#   written, they are written again first.
 #-----------------------------------------------------------------------
 #
 function source_config_for_task() {
 
-  source <( config_to_shell_str "${@:2}" -k "(^(?!task_)|$1).*" )
+  local _cfg_file="$2"
+  local _sections_dir="${_cfg_file%.*}_sections"
+  local _section
+
+  if [ "$#" -ne 2 ] || [ "${_cfg_file##*.}" != "sh" ]; then
+    source <( config_to_shell_str "${@:2}" -k "(^(?!task_)|$1).*" )
+    return
+  fi
+
+  if [ ! "${_sections_dir}/index" -nt "${_cfg_file}" ]; then
+    $USHdir/config_utils.py -c "${_cfg_file}" -d "${_sections_dir}" || {
+      source <( config_to_shell_str "${@:2}" -k "(^(?!task_)|$1).*" )
+      return
+    }
+  fi
+
+  while read -r _section; do
+    if [[ "${_section}" != task_* ]] || [[ "${_section}" =~ ^($1) ]]; then
+      source "${_sections_dir}/${_section}.sh"
+    fi
+  done < "${_sections_dir}/index"
 
 }
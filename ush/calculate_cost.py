@@ -1,108 +1,369 @@
 #!/usr/bin/env python3
 
+"""
+Estimate the cost of running an experiment.
+
+calculate_cost() gives the parameters of the relative forecast cost used by
+the WE2E test documentation: the time step and number of grid points of a
+test's grid and of the reference grid (RRFS_CONUS_25km).
+
+CostModel predicts the core-hours and wall time of all tasks of a workflow
+from the grid size, time step, layout, forecast length, number of cycles
+and ensemble members, and the tasks turned on. Each task's cost is taken
+to be proportional to a measure of the work it does (e.g. grid points times
+time steps for the forecast, grid points for each post-processed hour); the
+factors are calibrated from the rocoto databases of experiments that were
+already run:
+
+    calculate_cost.py --calibrate /path/to/expt_dirs/* --model cost_model.json
+    calculate_cost.py -c config.yaml --model cost_model.json
+"""
+
 import os
-import unittest
+import sys
+import json
+import math
+import sqlite3
 import argparse
+import unittest
+from datetime import datetime, timedelta
 
 from python_utils import (
     set_env_var,
-    import_vars,
+    get_env_var,
     load_config_file,
+    load_shell_config,
+    cfg_to_shell_str,
     flatten_dict,
+    update_dict,
+    job_stats,
+    mkdir_vrfy,
+    rm_vrfy,
 )
 
 from set_predef_grid_params import set_predef_grid_params
 from set_gridparams_ESGgrid import set_gridparams_ESGgrid
 from set_gridparams_GFDLgrid import set_gridparams_GFDLgrid
 
+USHdir = os.path.dirname(os.path.abspath(__file__))
 
-def calculate_cost(config_fn):
-    global PREDEF_GRID_NAME, QUILTING, GRID_GEN_METHOD
+# Reference grid of the relative cost
+REF_GRID_NAME = "RRFS_CONUS_25km"
 
-    # import all environment variables
-    IMPORTS = [
-        "PREDEF_GRID_NAME",
-        "QUILTING",
-        "GRID_GEN_METHOD",
-        "DT_ATMOS",
-        "LAYOUT_X",
-        "LAYOUT_Y",
-        "BLOCKSIZE",
-    ]
-    import_vars(env_vars=IMPORTS)
 
-    ushdir = os.path.dirname(os.path.abspath(__file__))
+def get_grid_params(cfg, ushdir=USHdir):
+    """Gets the parameters of the grid of an experiment, including its size
+
+    Args:
+        cfg: flattened experiment configuration. Settings of a predefined
+            grid (PREDEF_GRID_NAME) are overridden by those in cfg.
+        ushdir: path to the SRW ush directory
+    Returns:
+        Dictionary of grid parameters, with the number of grid points in
+        each direction in NX and NY
+    """
 
-    # get grid config parameters (predefined or custom)
-    if PREDEF_GRID_NAME:
-        QUILTING = False
-        params_dict = set_predef_grid_params(
+    params = {}
+    if cfg.get("PREDEF_GRID_NAME"):
+        params = set_predef_grid_params(
             USHdir=ushdir,
-            grid_name=PREDEF_GRID_NAME,
-            quilting=QUILTING,
+            grid_name=cfg["PREDEF_GRID_NAME"],
+            quilting=True,
         )
-        for param, value in params_dict.items():
-            if param in IMPORTS and globals()[param] is not None:
-                params_dict[param] = globals()[param]
-        import_vars(dictionary=params_dict)
-    else:
-        cfg_u = load_config_file(config_fn)
-        cfg_u = flatten_dict(cfg_u)
-        import_vars(dictionary=cfg_u)
+    # skip unset and not yet rendered settings (e.g. from config_defaults.yaml)
+    for param, value in cfg.items():
+        if value in [None, ""] or (isinstance(value, str) and "{{" in value):
+            continue
+        params[param] = value
 
     # number of gridpoints (nx*ny) depends on grid generation method
-    if GRID_GEN_METHOD == "GFDLgrid":
+    if params.get("GRID_GEN_METHOD") == "GFDLgrid":
         grid_params = set_gridparams_GFDLgrid(
-            lon_of_t6_ctr=GFDLgrid_LON_T6_CTR,
-            lat_of_t6_ctr=GFDLgrid_LAT_T6_CTR,
-            res_of_t6g=GFDLgrid_NUM_CELLS,
-            stretch_factor=GFDLgrid_STRETCH_FAC,
-            refine_ratio_t6g_to_t7g=GFDLgrid_REFINE_RATIO,
-            istart_of_t7_on_t6g=GFDLgrid_ISTART_OF_RGNL_DOM_ON_T6G,
-            iend_of_t7_on_t6g=GFDLgrid_IEND_OF_RGNL_DOM_ON_T6G,
-            jstart_of_t7_on_t6g=GFDLgrid_JSTART_OF_RGNL_DOM_ON_T6G,
-            jend_of_t7_on_t6g=GFDLgrid_JEND_OF_RGNL_DOM_ON_T6G,
+            lon_of_t6_ctr=params["GFDLgrid_LON_T6_CTR"],
+            lat_of_t6_ctr=params["GFDLgrid_LAT_T6_CTR"],
+            res_of_t6g=params["GFDLgrid_NUM_CELLS"],
+            stretch_factor=params["GFDLgrid_STRETCH_FAC"],
+            refine_ratio_t6g_to_t7g=params["GFDLgrid_REFINE_RATIO"],
+            istart_of_t7_on_t6g=params["GFDLgrid_ISTART_OF_RGNL_DOM_ON_T6G"],
+            iend_of_t7_on_t6g=params["GFDLgrid_IEND_OF_RGNL_DOM_ON_T6G"],
+            jstart_of_t7_on_t6g=params["GFDLgrid_JSTART_OF_RGNL_DOM_ON_T6G"],
+            jend_of_t7_on_t6g=params["GFDLgrid_JEND_OF_RGNL_DOM_ON_T6G"],
             run_envir="community",
             verbose=False,
             nh4=4,
         )
 
-    elif GRID_GEN_METHOD == "ESGgrid":
+    elif params.get("GRID_GEN_METHOD") == "ESGgrid":
         constants = load_config_file(os.path.join(ushdir, "constants.yaml"))
         grid_params = set_gridparams_ESGgrid(
-            lon_ctr=ESGgrid_LON_CTR,
-            lat_ctr=ESGgrid_LAT_CTR,
-            nx=ESGgrid_NX,
-            ny=ESGgrid_NY,
-            pazi=ESGgrid_PAZI,
-            halo_width=ESGgrid_WIDE_HALO_WIDTH,
-            delx=ESGgrid_DELX,
-            dely=ESGgrid_DELY,
+            lon_ctr=params["ESGgrid_LON_CTR"],
+            lat_ctr=params["ESGgrid_LAT_CTR"],
+            nx=params["ESGgrid_NX"],
+            ny=params["ESGgrid_NY"],
+            pazi=params["ESGgrid_PAZI"],
+            halo_width=params["ESGgrid_WIDE_HALO_WIDTH"],
+            delx=params["ESGgrid_DELX"],
+            dely=params["ESGgrid_DELY"],
             constants=constants["constants"],
         )
 
-    NX = grid_params["NX"]
-    NY = grid_params["NY"]
-    cost = [DT_ATMOS, NX * NY]
+    else:
+        raise ValueError(
+            f"Unknown grid generation method GRID_GEN_METHOD = {params.get('GRID_GEN_METHOD')}"
+        )
+
+    params["NX"] = grid_params["NX"]
+    params["NY"] = grid_params["NY"]
+    return params
 
-    # reference grid (6-hour forecast on RRFS_CONUS_25km)
-    PREDEF_GRID_NAME = "RRFS_CONUS_25km"
 
-    params_dict = set_predef_grid_params(
-        USHdir=os.path.dirname(os.path.abspath(__file__)),
-        grid_name=PREDEF_GRID_NAME,
-        quilting=QUILTING,
-    )
-    for param, value in params_dict.items():
-        if param in IMPORTS and globals()[param] is not None:
-            params_dict[param] = globals()[param]
-    import_vars(dictionary=params_dict)
+def calculate_cost(config_fn):
+    """Gets the time step and number of grid points of the grid of a test and
+    of the reference grid. Settings of the grid given in the environment
+    (e.g. PREDEF_GRID_NAME, DT_ATMOS) take precedence over the config file,
+    which is only read if PREDEF_GRID_NAME is not set in the environment.
 
-    cost.extend([DT_ATMOS, ESGgrid_NX * ESGgrid_NY])
+    Args:
+        config_fn: config file containing grid params
+    Returns:
+        List [DT_ATMOS, NX*NY, reference DT_ATMOS, reference NX*NY]
+    """
+
+    IMPORTS = [
+        "PREDEF_GRID_NAME",
+        "QUILTING",
+        "GRID_GEN_METHOD",
+        "DT_ATMOS",
+        "LAYOUT_X",
+        "LAYOUT_Y",
+        "BLOCKSIZE",
+    ]
+    overrides = {}
+    for param in IMPORTS:
+        value = get_env_var(param)
+        if value is not None:
+            overrides[param] = value
+
+    cfg = dict(overrides)
+    if not cfg.get("PREDEF_GRID_NAME"):
+        cfg.update(flatten_dict(load_config_file(config_fn)))
+    grid = get_grid_params(cfg)
+    cost = [grid["DT_ATMOS"], grid["NX"] * grid["NY"]]
+
+    # reference grid (6-hour forecast on RRFS_CONUS_25km), with its own
+    # settings unless they are given in the environment
+    ref_cfg = dict(overrides)
+    ref_cfg["PREDEF_GRID_NAME"] = REF_GRID_NAME
+    ref_cfg.pop("GRID_GEN_METHOD", None)
+    ref_grid = get_grid_params(ref_cfg)
+    cost.extend([ref_grid["DT_ATMOS"], ref_grid["NX"] * ref_grid["NY"]])
 
     return cost
 
 
+def load_experiment_config(config_fn, ushdir=USHdir):
+    """Loads the configuration of an experiment for cost estimation
+
+    Args:
+        config_fn: a user config file (settings not in it are taken from
+            config_defaults.yaml), or the var_defns file of a generated
+            experiment
+    Returns:
+        Flattened experiment configuration
+    """
+
+    if os.path.splitext(config_fn)[1] == ".sh":
+        return flatten_dict(load_shell_config(config_fn))
+    cfg = load_config_file(os.path.join(ushdir, "config_defaults.yaml"))
+    update_dict(load_config_file(config_fn), cfg)
+    return flatten_dict(cfg)
+
+
+def workflow_jobs(cfg, grid=None):
+    """Counts the jobs of each kind of task in a workflow, and the work done
+    by each job. The work is a measure of the job's cost, in units that
+    depend on the task (grid points times time steps for the forecast,
+    grid points times output hours for post-processing, ...).
+
+    Args:
+        cfg: flattened experiment configuration
+        grid: grid parameters of the experiment (see get_grid_params)
+    Returns:
+        Dictionary of (number of jobs, work per job), keyed by task name
+        prefix. Only tasks that are turned on are included.
+    """
+
+    if grid is None:
+        grid = get_grid_params(cfg)
+
+    def date(value):
+        if isinstance(value, datetime):
+            return value
+        return datetime.strptime(str(value)[:10], "%Y%m%d%H")
+
+    first, last = date(cfg["DATE_FIRST_CYCL"]), date(cfg["DATE_LAST_CYCL"])
+    incr = timedelta(hours=int(cfg.get("INCR_CYCL_FREQ") or 24))
+    ncycles = (last - first) // incr + 1
+    nmems = int(cfg.get("NUM_ENS_MEMBERS") or 1) if cfg.get("DO_ENSEMBLE") else 1
+
+    fcst_len_hrs = int(cfg["FCST_LEN_HRS"])
+    points = grid["NX"] * grid["NY"]
+    nsteps = math.ceil(fcst_len_hrs * 3600 / float(grid["DT_ATMOS"]))
+    nlbcs = math.ceil(fcst_len_hrs / float(cfg.get("LBC_SPEC_INTVL_HRS") or 6))
+    nplots = fcst_len_hrs // int(cfg.get("PLOT_FCST_INC") or 3) + 1
+
+    def on(task):
+        return bool(cfg.get(f"RUN_TASK_{task}", False))
+
+    jobs = {}
+    for task in ["MAKE_GRID", "MAKE_OROG", "MAKE_SFC_CLIMO"]:
+        if on(task):
+            jobs[task.lower()] = (1, points)
+    for task in ["GET_EXTRN_ICS", "GET_EXTRN_LBCS"]:
+        if on(task):
+            jobs[task.lower()] = (ncycles, 1)
+    if on("MAKE_ICS"):
+        jobs["make_ics"] = (ncycles * nmems, points)
+    if on("MAKE_LBCS"):
+        jobs["make_lbcs"] = (ncycles * nmems, points * nlbcs)
+    if on("RUN_FCST"):
+        jobs["run_fcst"] = (ncycles * nmems, points * nsteps)
+    if on("RUN_POST") and not cfg.get("WRITE_DOPOST"):
+        # one job per output hour, or per batch of POST_BATCH_HRS hours
+        nouts = fcst_len_hrs + 1
+        batch_hrs = int(cfg.get("POST_BATCH_HRS") or 0)
+        nposts = math.ceil(nouts / batch_hrs) if batch_hrs > 0 else nouts
+        jobs["run_post"] = (ncycles * nmems * nposts, points * nouts / nposts)
+    if on("PLOT_ALLVARS"):
+        jobs["plot_allvars"] = (ncycles * nmems, points * nplots)
+    nobs = sum(on(f"GET_OBS_{obs}") for obs in ["CCPA", "MRMS", "NDAS"])
+    if nobs:
+        jobs["get_obs"] = (ncycles * nobs, 1)
+    # MET tasks, one per member (deterministic) or per cycle (ensemble)
+    nvx = ncycles * nmems * (on("VX_GRIDSTAT") + on("VX_POINTSTAT"))
+    nvx += ncycles * (on("VX_ENSGRID") + on("VX_ENSPOINT"))
+    if nvx:
+        jobs["run_MET"] = (nvx, points * fcst_len_hrs)
+    return jobs
+
+
+def fcst_cores(cfg, grid=None):
+    """Number of MPI tasks of the forecast"""
+    if grid is None:
+        grid = get_grid_params(cfg)
+    cores = int(grid["LAYOUT_X"]) * int(grid["LAYOUT_Y"])
+    if grid.get("QUILTING", True) and grid.get("WRTCMP_write_groups"):
+        cores += int(grid["WRTCMP_write_groups"]) * int(
+            grid["WRTCMP_write_tasks_per_group"]
+        )
+    return cores
+
+
+class CostModel:
+    """Model of the cost of each kind of workflow task, calibrated from rocoto
+    job histories
+
+    Args:
+        coefficients: dictionary of {"core_secs_per_work": ..., "cores": ...}
+            keyed by task name prefix (see workflow_jobs)
+    """
+
+    def __init__(self, coefficients=None):
+        self.coefficients = coefficients or {}
+
+    @classmethod
+    def load(cls, path):
+        """Load a calibrated model from a JSON file"""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        """Save the model to a JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.coefficients, f, indent=2, sort_keys=True)
+
+    def calibrate(self, expt_dirs):
+        """Fit the cost of each kind of task to the successful jobs of
+        experiments that were run. The work of each task is summed over all
+        experiments, so that the fit is dominated by the largest runs.
+
+        Args:
+            expt_dirs: list of experiment directories, each containing a
+                var_defns.sh and a FV3LAM_wflow.db file
+        Returns:
+            Number of experiments used
+        """
+
+        totals = {}
+        nexpts = 0
+        for expt_dir in expt_dirs:
+            db_path = os.path.join(expt_dir, "FV3LAM_wflow.db")
+            defns_path = os.path.join(expt_dir, "var_defns.sh")
+            if not (os.path.exists(db_path) and os.path.exists(defns_path)):
+                continue
+            cfg = load_experiment_config(defns_path)
+            grid = get_grid_params(cfg)
+            jobs = workflow_jobs(cfg, grid)
+            nexpts += 1
+            for row in job_stats(db_path, group_by=["task", "state"]):
+                if row["state"] != "SUCCEEDED":
+                    continue
+                prefix = task_prefix(row["task"], jobs)
+                if prefix is None:
+                    continue
+                total = totals.setdefault(prefix, [0.0, 0.0, 0.0])
+                total[0] += row["jobs"] * jobs[prefix][1]
+                total[1] += row["core_hours"] * 3600
+                total[2] += row["wall_time_mins"] * 60
+
+        for prefix, (work, core_secs, wall_secs) in totals.items():
+            if work > 0 and wall_secs > 0:
+                self.coefficients[prefix] = {
+                    "core_secs_per_work": core_secs / work,
+                    "cores": core_secs / wall_secs,
+                }
+        return nexpts
+
+    def predict(self, cfg):
+        """Predict the cost of the tasks of an experiment
+
+        Args:
+            cfg: flattened experiment configuration
+        Returns:
+            Dictionary of {"jobs", "work", "core_hours", "wall_time_hours"}
+            keyed by task name prefix, plus a "total". The wall time is the
+            sum of that of all jobs; core-hours and wall time are None for
+            tasks the model was not calibrated for.
+        """
+
+        grid = get_grid_params(cfg)
+        prediction = {}
+        total = {"jobs": 0, "core_hours": 0.0, "wall_time_hours": 0.0}
+        for prefix, (njobs, work) in workflow_jobs(cfg, grid).items():
+            task = {"jobs": njobs, "work": njobs * work}
+            coef = self.coefficients.get(prefix)
+            if coef:
+                task["core_hours"] = coef["core_secs_per_work"] * njobs * work / 3600
+                # the forecast is assumed to scale perfectly with its layout
+                cores = fcst_cores(cfg, grid) if prefix == "run_fcst" else coef["cores"]
+                task["wall_time_hours"] = task["core_hours"] / cores
+                total["core_hours"] += task["core_hours"]
+                total["wall_time_hours"] += task["wall_time_hours"]
+            else:
+                task["core_hours"] = task["wall_time_hours"] = None
+            total["jobs"] += njobs
+            prediction[prefix] = task
+        prediction["total"] = total
+        return prediction
+
+
+def task_prefix(taskname, prefixes):
+    """Longest of the given task name prefixes that a rocoto task name starts
+    with (None if there is none)"""
+    matches = [p for p in prefixes if taskname.startswith(p)]
+    return max(matches, key=len) if matches else None
+
+
 # interface
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -112,13 +373,48 @@ if __name__ == "__main__":
         "--cfg",
         "-c",
         dest="cfg",
-        required=True,
         help="config file containing grid params",
     )
+    parser.add_argument(
+        "--model",
+        "-m",
+        dest="model",
+        help="JSON file of a calibrated cost model. If given, the cost of all "
+        "tasks of the experiment configured in the config file is predicted.",
+    )
+    parser.add_argument(
+        "--calibrate",
+        dest="expt_dirs",
+        nargs="+",
+        help="Calibrate the cost model from these experiment directories, and "
+        "save it to the model file.",
+    )
     args = parser.parse_args()
 
-    params = calculate_cost(args.cfg)
-    print(" ".join(map(str, params)))
+    if args.expt_dirs:
+        if not args.model:
+            parser.error("--calibrate requires --model")
+        model = CostModel()
+        nexpts = model.calibrate(args.expt_dirs)
+        model.save(args.model)
+        print(f"Calibrated cost model from {nexpts} experiments: {args.model}")
+    if not args.cfg:
+        if not args.expt_dirs:
+            parser.error("a config file (--cfg) is required")
+        sys.exit(0)
+
+    if not args.model:
+        params = calculate_cost(args.cfg)
+        print(" ".join(map(str, params)))
+    else:
+        model = CostModel.load(args.model)
+        prediction = model.predict(load_experiment_config(args.cfg))
+        print(f"{'Task':<20s} {'Jobs':>8s} {'Core Hours':>12s} {'Wall Time (hrs)':>16s}")
+        for task, cost in prediction.items():
+            ch, wt = cost["core_hours"], cost["wall_time_hours"]
+            ch = "n/a" if ch is None else f"{ch:.2f}"
+            wt = "n/a" if wt is None else f"{wt:.2f}"
+            print(f"{task:<20s} {cost['jobs']:>8d} {ch:>12s} {wt:>16s}")
 
 
 class Testing(unittest.TestCase):
@@ -127,6 +423,54 @@ class Testing(unittest.TestCase):
         params = calculate_cost(None)
         self.assertCountEqual(params, [36, 1987440, 36, 28689])
 
+    def test_cost_model(self):
+        # a 6-hour, 2-cycle run of the reference grid
+        cfg = {
+            "workflow": {
+                "PREDEF_GRID_NAME": REF_GRID_NAME,
+                "DATE_FIRST_CYCL": "2019070100",
+                "DATE_LAST_CYCL": "2019070112",
+                "INCR_CYCL_FREQ": 12,
+                "FCST_LEN_HRS": 6,
+            },
+            "workflow_switches": {"RUN_TASK_RUN_FCST": True, "RUN_TASK_RUN_POST": True},
+        }
+        expt_dir = os.path.join(USHdir, "test_data", "cost_expt")
+        rm_vrfy("-rf", expt_dir)
+        mkdir_vrfy("-p", expt_dir)
+        with open(os.path.join(expt_dir, "var_defns.sh"), "w") as f:
+            f.write(cfg_to_shell_str(cfg))
+        con = sqlite3.connect(os.path.join(expt_dir, "FV3LAM_wflow.db"))
+        con.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY, taskname VARCHAR(64), "
+            "cycle DATETIME, cores INTEGER, state VARCHAR(64), tries INTEGER, duration REAL)"
+        )
+        jobs = [("run_fcst", 0, 100, "SUCCEEDED", 1, 360.0)] * 2
+        jobs += [(f"run_post_f{h:03d}", 0, 10, "SUCCEEDED", 1, 36.0) for h in range(14)]
+        con.executemany(
+            "INSERT INTO jobs (taskname, cycle, cores, state, tries, duration) VALUES (?,?,?,?,?,?)",
+            jobs,
+        )
+        con.commit()
+        con.close()
+
+        model = CostModel()
+        self.assertEqual(model.calibrate([expt_dir]), 1)
+        rm_vrfy("-rf", expt_dir)
+        prediction = model.predict(flatten_dict(cfg))
+        self.assertAlmostEqual(prediction["run_fcst"]["core_hours"], 20.0)
+        self.assertAlmostEqual(prediction["run_post"]["core_hours"], 1.4)
+        # twice as long a forecast costs twice as much
+        cfg["workflow"]["FCST_LEN_HRS"] = 12
+        prediction = model.predict(flatten_dict(cfg))
+        self.assertAlmostEqual(prediction["run_fcst"]["core_hours"], 40.0)
+        self.assertEqual(prediction["run_post"]["jobs"], 26)
+        # batched post-processing: fewer jobs doing the same work
+        cfg["task_run_post"] = {"POST_BATCH_HRS": 6}
+        prediction = model.predict(flatten_dict(cfg))
+        self.assertEqual(prediction["run_post"]["jobs"], 6)
+        self.assertAlmostEqual(prediction["run_post"]["core_hours"], 2.6)
+
     def setUp(self):
         set_env_var("DEBUG", False)
         set_env_var("VERBOSE", False)
@@ -30,6 +30,7 @@ from python_utils import (
     get_env_var,
     lowercase,
     flatten_dict,
+    Fingerprints,
 )
 
 from setup import setup
@@ -40,14 +41,20 @@ from set_namelist import set_namelist
 from check_python_version import check_python_version
 
 
-def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", debug: bool = False) -> str:
+def generate_FV3LAM_wflow(
+    ushdir,
+    logfile: str = "log.generate_FV3LAM_wflow",
+    debug: bool = False,
+    config_fn: str = "config.yaml",
+) -> str:
     """Function to setup a forecast experiment and create a workflow
     (according to the parameters specified in the config file)
 
     Args:
-        ushdir  (str) : The full path of the ush/ directory where this script is located
-        logfile (str) : The name of the file where logging is written
-        debug   (bool): Enable extra output for debugging
+        ushdir    (str) : The full path of the ush/ directory where this script is located
+        logfile   (str) : The name of the file where logging is written
+        debug     (bool): Enable extra output for debugging
+        config_fn (str) : The user config file, relative to ushdir or a full path
     Returns:
         EXPTDIR (str) : The full path of the directory where this experiment has been generated
     """
@@ -68,12 +75,26 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
 
     # The setup function reads the user configuration file and fills in
     # non-user-specified values from config_defaults.yaml
-    expt_config = setup(ushdir,debug=debug)
+    expt_config = setup(ushdir, user_config_fn=config_fn, debug=debug)
 
     verbose = expt_config["workflow"]["VERBOSE"]
     #
     # -----------------------------------------------------------------------
     #
+    # Record the inputs of each file generated below in the experiment
+    # directory.  With PREEXISTING_DIR_METHOD set to "update", a file is only
+    # regenerated if its inputs changed since the experiment was last
+    # generated.
+    #
+    # -----------------------------------------------------------------------
+    #
+    fingerprints = Fingerprints(
+        os.path.join(expt_config["workflow"]["EXPTDIR"], "wflow_fingerprints.json"),
+        reuse=expt_config["workflow"]["PREEXISTING_DIR_METHOD"] == "update",
+    )
+    #
+    # -----------------------------------------------------------------------
+    #
     # Set the full path to the experiment's rocoto workflow xml file.  This
     # file will be placed at the top level of the experiment directory and
     # then used by rocoto to run the workflow.
@@ -181,36 +202,49 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
         log_info(settings_str, verbose=verbose)
 
         #
-        # Call the python script to generate the experiment's actual XML file
-        # from the jinja template file.
+        # Leave the XML file alone if nothing it is made from has changed.
         #
-        try:
-            fill_jinja_template(
-                ["-q", "-u", settings_str, "-t", template_xml_fp, "-o", wflow_xml_fp]
+        if not fingerprints.changed(
+            "wflow_xml", settings_str, files=[template_xml_fp], outputs=[wflow_xml_fp]
+        ):
+            log_info(
+                f"""
+                Rocoto workflow XML file is up to date:
+                  WFLOW_XML_FP = '{wflow_xml_fp}'"""
             )
-        except:
-            logging.info(
-                dedent(
-                    f"""
-                      Variable settings specified on command line for
-                      fill_jinja_template.py:\n
-                        settings =\n\n"""
+        else:
+            #
+            # Call the python script to generate the experiment's actual XML file
+            # from the jinja template file.
+            #
+            try:
+                fill_jinja_template(
+                    ["-q", "-u", settings_str, "-t", template_xml_fp, "-o", wflow_xml_fp]
                 )
-                + settings_str
-            )
-            raise Exception(
-                dedent(
-                    f"""
-                    Call to python script fill_jinja_template.py to create a rocoto workflow
-                    XML file from a template file failed.  Parameters passed to this script
-                    are:
-                      Full path to template rocoto XML file:
-                        template_xml_fp = '{template_xml_fp}'
-                      Full path to output rocoto XML file:
-                        WFLOW_XML_FP = '{wflow_xml_fp}'
-                    """
+            except:
+                logging.info(
+                    dedent(
+                        f"""
+                          Variable settings specified on command line for
+                          fill_jinja_template.py:\n
+                            settings =\n\n"""
+                    )
+                    + settings_str
                 )
-            )
+                raise Exception(
+                    dedent(
+                        f"""
+                        Call to python script fill_jinja_template.py to create a rocoto workflow
+                        XML file from a template file failed.  Parameters passed to this script
+                        are:
+                          Full path to template rocoto XML file:
+                            template_xml_fp = '{template_xml_fp}'
+                          Full path to output rocoto XML file:
+                            WFLOW_XML_FP = '{wflow_xml_fp}'
+                        """
+                    )
+                )
+            fingerprints.record("wflow_xml")
     #
     # -----------------------------------------------------------------------
     #
@@ -256,7 +290,25 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
     #
     # Copy or symlink fix files
     #
-    if SYMLINK_FIX_FILES:
+    fixam_files = [os.path.join(FIXgsm, fn) for fn in FIXgsm_FILES_TO_COPY_TO_FIXam]
+    if not fingerprints.changed(
+        "fixam",
+        SYMLINK_FIX_FILES,
+        FIXgsm,
+        FIXam,
+        FIXgsm_FILES_TO_COPY_TO_FIXam,
+        files=[] if SYMLINK_FIX_FILES else fixam_files,
+        outputs=[FIXam],
+    ):
+
+        log_info(
+            f"""
+            Fixed files in FIXam are up to date:
+              FIXam = '{FIXam}'""",
+            verbose=verbose,
+        )
+
+    elif SYMLINK_FIX_FILES:
 
         log_info(
             f"""
@@ -266,6 +318,8 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
             verbose=verbose,
         )
 
+        # FIXam may be a directory of copies made by a previous generation
+        check_for_preexist_dir_file(FIXam, "delete")
         ln_vrfy(f"""-fsn '{FIXgsm}' '{FIXam}'""")
     else:
 
@@ -285,6 +339,8 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
         for i in range(num_files):
             fn = f"{FIXgsm_FILES_TO_COPY_TO_FIXam[i]}"
             cp_vrfy(os.path.join(FIXgsm, fn), os.path.join(FIXam, fn))
+
+    fingerprints.record("fixam")
     #
     # -----------------------------------------------------------------------
     #
@@ -292,7 +348,25 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
     #
     # -----------------------------------------------------------------------
     #
-    if USE_MERRA_CLIMO:
+    merra_files = [
+        os.path.join(FIXaer, "merra2.aerclim*.nc"),
+        os.path.join(FIXlut, "optics*.dat"),
+    ]
+    if USE_MERRA_CLIMO and not fingerprints.changed(
+        "fixclim",
+        SYMLINK_FIX_FILES,
+        FIXclim,
+        files=merra_files,
+        outputs=[FIXclim],
+    ):
+        log_info(
+            f"""
+            MERRA2 aerosol climatology data files in FIXclim are up to date:
+              FIXclim = '{FIXclim}'""",
+            verbose=verbose,
+        )
+
+    elif USE_MERRA_CLIMO:
         log_info(
             f"""
             Copying MERRA2 aerosol climatology data files from system directory
@@ -312,6 +386,8 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
         else:
             cp_vrfy(os.path.join(FIXaer, "merra2.aerclim*.nc"), FIXclim)
             cp_vrfy(os.path.join(FIXlut, "optics*.dat"), FIXclim)
+
+        fingerprints.record("fixclim")
     #
     # -----------------------------------------------------------------------
     #
@@ -319,56 +395,77 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
     #
     # -----------------------------------------------------------------------
     #
-    log_info(
-        f"""
-        Copying templates of various input files to the experiment directory...""",
-        verbose=verbose,
-    )
+    template_copies = [
+        (DATA_TABLE_TMPL_FP, DATA_TABLE_FP),
+        (FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP),
+        (NEMS_CONFIG_TMPL_FP, NEMS_CONFIG_FP),
+        (CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP),
+        (FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP),
+    ]
+    if not fingerprints.changed(
+        "templates",
+        template_copies,
+        files=[src for src, _ in template_copies],
+        outputs=[dst for _, dst in template_copies],
+    ):
+        log_info(
+            """
+            Templates of input files in the experiment directory are up to date.""",
+            verbose=verbose,
+        )
+    else:
+        log_info(
+            f"""
+            Copying templates of various input files to the experiment directory...""",
+            verbose=verbose,
+        )
 
-    log_info(
-        f"""
-        Copying the template data table file to the experiment directory...""",
-        verbose=verbose,
-    )
-    cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
+        log_info(
+            f"""
+            Copying the template data table file to the experiment directory...""",
+            verbose=verbose,
+        )
+        cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
 
-    log_info(
-        f"""
-        Copying the template field table file to the experiment directory...""",
-        verbose=verbose,
-    )
-    cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
+        log_info(
+            f"""
+            Copying the template field table file to the experiment directory...""",
+            verbose=verbose,
+        )
+        cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
 
-    log_info(
-        f"""
-        Copying the template NEMS configuration file to the experiment directory...""",
-        verbose=verbose,
-    )
-    cp_vrfy(NEMS_CONFIG_TMPL_FP, NEMS_CONFIG_FP)
-    #
-    # Copy the CCPP physics suite definition file from its location in the
-    # clone of the FV3 code repository to the experiment directory (EXPT-
-    # DIR).
-    #
-    log_info(
-        f"""
-        Copying the CCPP physics suite definition XML file from its location in
-        the forecast model directory structure to the experiment directory...""",
-        verbose=verbose,
-    )
-    cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
-    #
-    # Copy the field dictionary file from its location in the
-    # clone of the FV3 code repository to the experiment directory (EXPT-
-    # DIR).
-    #
-    log_info(
-        f"""
-        Copying the field dictionary file from its location in the forecast
-        model directory structure to the experiment directory...""",
-        verbose=verbose,
-    )
-    cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
+        log_info(
+            f"""
+            Copying the template NEMS configuration file to the experiment directory...""",
+            verbose=verbose,
+        )
+        cp_vrfy(NEMS_CONFIG_TMPL_FP, NEMS_CONFIG_FP)
+        #
+        # Copy the CCPP physics suite definition file from its location in the
+        # clone of the FV3 code repository to the experiment directory (EXPT-
+        # DIR).
+        #
+        log_info(
+            f"""
+            Copying the CCPP physics suite definition XML file from its location in
+            the forecast model directory structure to the experiment directory...""",
+            verbose=verbose,
+        )
+        cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
+        #
+        # Copy the field dictionary file from its location in the
+        # clone of the FV3 code repository to the experiment directory (EXPT-
+        # DIR).
+        #
+        log_info(
+            f"""
+            Copying the field dictionary file from its location in the forecast
+            model directory structure to the experiment directory...""",
+            verbose=verbose,
+        )
+        cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
+
+        fingerprints.record("templates")
     #
     # -----------------------------------------------------------------------
     #
@@ -689,55 +786,79 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
     #
     # -----------------------------------------------------------------------
     #
-    try:
-        set_namelist(
-            [
-                "-q",
-                "-n",
-                FV3_NML_BASE_SUITE_FP,
-                "-c",
-                FV3_NML_YAML_CONFIG_FP,
-                CCPP_PHYS_SUITE,
-                "-u",
-                settings_str,
-                "-o",
-                FV3_NML_FP,
-            ]
+    if not fingerprints.changed(
+        "fv3_nml",
+        settings_str,
+        CCPP_PHYS_SUITE,
+        FV3_NML_FP,
+        RUN_TASK_MAKE_GRID,
+        CRES,
+        FIXlam,
+        files=[FV3_NML_BASE_SUITE_FP, FV3_NML_YAML_CONFIG_FP],
+        outputs=[FV3_NML_FP],
+    ):
+        log_info(
+            f"""
+            Weather model's namelist file is up to date:
+              FV3_NML_FP = '{FV3_NML_FP}'"""
         )
-    except:
-        logging.exception(
-            dedent(
-                f"""
-                Call to python script set_namelist.py to generate an FV3 namelist file
-                failed.  Parameters passed to this script are:
-                  Full path to base namelist file:
-                    FV3_NML_BASE_SUITE_FP = '{FV3_NML_BASE_SUITE_FP}'
-                  Full path to yaml configuration file for various physics suites:
-                    FV3_NML_YAML_CONFIG_FP = '{FV3_NML_YAML_CONFIG_FP}'
-                  Physics suite to extract from yaml configuration file:
-                    CCPP_PHYS_SUITE = '{CCPP_PHYS_SUITE}'
-                  Full path to output namelist file:
-                    FV3_NML_FP = '{FV3_NML_FP}'
-                  Namelist settings specified on command line:\n
-                    settings =\n\n"""
+    else:
+        try:
+            set_namelist(
+                [
+                    "-q",
+                    "-n",
+                    FV3_NML_BASE_SUITE_FP,
+                    "-c",
+                    FV3_NML_YAML_CONFIG_FP,
+                    CCPP_PHYS_SUITE,
+                    "-u",
+                    settings_str,
+                    "-o",
+                    FV3_NML_FP,
+                ]
             )
-            + settings_str
-        )
-    #
-    # If not running the TN_MAKE_GRID task (which implies the workflow will
-    # use pregenerated grid files), set the namelist variables specifying
-    # the paths to surface climatology files.  These files are located in
-    # (or have symlinks that point to them) in the FIXlam directory.
-    #
-    # Note that if running the TN_MAKE_GRID task, this action usually cannot
-    # be performed here but must be performed in that task because the names
-    # of the surface climatology files depend on the CRES parameter (which is
-    # the C-resolution of the grid), and this parameter is in most workflow
-    # configurations is not known until the grid is created.
-    #
-    if not RUN_TASK_MAKE_GRID:
+        except:
+            logging.exception(
+                dedent(
+                    f"""
+                    Call to python script set_namelist.py to generate an FV3 namelist file
+                    failed.  Parameters passed to this script are:
+                      Full path to base namelist file:
+                        FV3_NML_BASE_SUITE_FP = '{FV3_NML_BASE_SUITE_FP}'
+                      Full path to yaml configuration file for various physics suites:
+                        FV3_NML_YAML_CONFIG_FP = '{FV3_NML_YAML_CONFIG_FP}'
+                      Physics suite to extract from yaml configuration file:
+                        CCPP_PHYS_SUITE = '{CCPP_PHYS_SUITE}'
+                      Full path to output namelist file:
+                        FV3_NML_FP = '{FV3_NML_FP}'
+                      Namelist settings specified on command line:\n
+                        settings =\n\n"""
+                )
+                + settings_str
+            )
+            # Do not record the namelist as up to date
+            raise
+        #
+        # If not running the TN_MAKE_GRID task (which implies the workflow will
+        # use pregenerated grid files), set the namelist variables specifying
+        # the paths to surface climatology files.  These files are located in
+        # (or have symlinks that point to them) in the FIXlam directory.
+        #
+        # Note that if running the TN_MAKE_GRID task, this action usually cannot
+        # be performed here but must be performed in that task because the names
+        # of the surface climatology files depend on the CRES parameter (which is
+        # the C-resolution of the grid), and this parameter is in most workflow
+        # configurations is not known until the grid is created.  When an 
+        # existing experiment whose grid was already created is updated, CRES 
+        # is known (see setup.py), and the namelist regenerated above must get
+        # the file names that task set.
+        #
+        if not RUN_TASK_MAKE_GRID or RES_IN_FIXLAM_FILENAMES:
+
+            set_FV3nml_sfc_climo_filenames()
 
-        set_FV3nml_sfc_climo_filenames()
+        fingerprints.record("fv3_nml")
 
     #
     # -----------------------------------------------------------------------
@@ -748,7 +869,7 @@ def generate_FV3LAM_wflow(ushdir, logfile: str = "log.generate_FV3LAM_wflow", de
     #
     # -----------------------------------------------------------------------
     #
-    cp_vrfy(os.path.join(ushdir, EXPT_CONFIG_FN), EXPTDIR)
+    cp_vrfy(os.path.join(ushdir, config_fn), os.path.join(EXPTDIR, EXPT_CONFIG_FN))
 
     #
     # -----------------------------------------------------------------------
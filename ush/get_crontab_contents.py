@@ -2,8 +2,11 @@
 
 import os
 import sys
+import fcntl
+import tempfile
 import unittest
 import argparse
+import contextlib
 from datetime import datetime
 from textwrap import dedent
 
@@ -89,6 +92,21 @@ def get_crontab_contents(called_from_cron):
     return __crontab_cmd__, __crontab_contents__
 
 
+@contextlib.contextmanager
+def crontab_lock():
+    """Keep other processes from changing the user's cron table (e.g. when
+    several experiments are being generated in parallel) until the
+    changes made in this block are done"""
+
+    lock_fp = os.path.join(tempfile.gettempdir(), f"srw_crontab.{os.getuid()}.lock")
+    with open(lock_fp, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def add_crontab_line():
     """Add crontab line to cron table"""
 
@@ -114,43 +132,44 @@ def add_crontab_line():
     except:
         called_from_cron = False
 
-    # Get crontab contents
-    crontab_cmd, crontab_contents = get_crontab_contents(
-        called_from_cron=called_from_cron
-    )
+    with crontab_lock():
+        # Get crontab contents
+        crontab_cmd, crontab_contents = get_crontab_contents(
+            called_from_cron=called_from_cron
+        )
 
-    # Create backup
-    run_command(f"""printf "%s" '{crontab_contents}' > '{crontab_backup_fp}'""")
+        # Create backup
+        run_command(f"""printf "%s" '{crontab_contents}' > '{crontab_backup_fp}'""")
 
-    # Add crontab line
-    if CRONTAB_LINE in crontab_contents:
+        # Add crontab line
+        if CRONTAB_LINE in crontab_contents:
 
-        log_info(
-            f"""
-            The following line already exists in the cron table and thus will not be
-            added:
-              CRONTAB_LINE = '{CRONTAB_LINE}'"""
-        )
+            log_info(
+                f"""
+                The following line already exists in the cron table and thus will not be
+                added:
+                  CRONTAB_LINE = '{CRONTAB_LINE}'"""
+            )
 
-    else:
+        else:
 
-        log_info(
-            f"""
-            Adding the following line to the user's cron table in order to automatically
-            resubmit SRW workflow:
-              CRONTAB_LINE = '{CRONTAB_LINE}'""",
-            verbose=VERBOSE,
-        )
+            log_info(
+                f"""
+                Adding the following line to the user's cron table in order to automatically
+                resubmit SRW workflow:
+                  CRONTAB_LINE = '{CRONTAB_LINE}'""",
+                verbose=VERBOSE,
+            )
 
-        # add new line to crontab contents if it doesn't have one
-        NEWLINE_CHAR = ""
-        if crontab_contents and crontab_contents[-1] != "\n":
-            NEWLINE_CHAR = "\n"
+            # add new line to crontab contents if it doesn't have one
+            NEWLINE_CHAR = ""
+            if crontab_contents and crontab_contents[-1] != "\n":
+                NEWLINE_CHAR = "\n"
 
-        # add the crontab line
-        run_command(
-            f"""printf "%s%b%s\n" '{crontab_contents}' '{NEWLINE_CHAR}' '{CRONTAB_LINE}' | {crontab_cmd}"""
-        )
+            # add the crontab line
+            run_command(
+                f"""printf "%s%b%s\n" '{crontab_contents}' '{NEWLINE_CHAR}' '{CRONTAB_LINE}' | {crontab_cmd}"""
+            )
 
 
 def delete_crontab_line(called_from_cron):
@@ -163,30 +182,31 @@ def delete_crontab_line(called_from_cron):
     IMPORTS = ["MACHINE", "CRONTAB_LINE", "DEBUG"]
     import_vars(env_vars=IMPORTS)
 
-    #
-    # Get the full contents of the user's cron table.
-    #
-    (crontab_cmd, crontab_contents) = get_crontab_contents(called_from_cron)
-    #
-    # Remove the line in the contents of the cron table corresponding to the
-    # current forecast experiment (if that line is part of the contents).
-    # Then record the results back into the user's cron table.
-    #
-    print_info_msg(
-        f"""
-        Crontab contents before delete:
-        =========================================================
-          {crontab_contents}
-        =========================================================""",
-        verbose=True,
-    )
+    with crontab_lock():
+        #
+        # Get the full contents of the user's cron table.
+        #
+        (crontab_cmd, crontab_contents) = get_crontab_contents(called_from_cron)
+        #
+        # Remove the line in the contents of the cron table corresponding to the
+        # current forecast experiment (if that line is part of the contents).
+        # Then record the results back into the user's cron table.
+        #
+        print_info_msg(
+            f"""
+            Crontab contents before delete:
+            =========================================================
+              {crontab_contents}
+            =========================================================""",
+            verbose=True,
+        )
 
-    if (CRONTAB_LINE + "\n") in crontab_contents:
-        crontab_contents = crontab_contents.replace(CRONTAB_LINE + "\n", "")
-    else:
-        crontab_contents = crontab_contents.replace(CRONTAB_LINE, "")
+        if (CRONTAB_LINE + "\n") in crontab_contents:
+            crontab_contents = crontab_contents.replace(CRONTAB_LINE + "\n", "")
+        else:
+            crontab_contents = crontab_contents.replace(CRONTAB_LINE, "")
 
-    run_command(f"""echo '{crontab_contents}' | {crontab_cmd}""")
+        run_command(f"""echo '{crontab_contents}' | {crontab_cmd}""")
 
     print_info_msg(
         f"""
@@ -0,0 +1,5 @@
+from .grib_reader import GribReader, Grid
+from .basemap import add_basemap, draw_basemap, natural_earth_features
+from .projection import native_crs
+from .image_output import ImageWriter, IMAGE_FORMATS
+from .derived import DerivedFields, barb_skip, rotate_wind, set_fft_workers, smooth
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""
+Map backgrounds for the plotting scripts.
+
+The map background (the Natural Earth shaded relief raster plus lakes,
+coastlines, and state and country borders) is the same for every plot of
+a domain, but drawing it is expensive: the raster has to be read and
+warped to the map projection, and the shapefiles read, clipped and
+projected. When given a cache directory, add_basemap() renders the
+background for a projection and extent once, saves it as an image, and
+afterwards only places that image on the axes. The image is reused by
+later forecast hours and cycles, and by other experiments sharing the
+cache directory.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import cartopy
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+# Increase when the look of the background changes, so that images
+# cached by earlier versions are not used
+BASEMAP_VERSION = 1
+
+# Width of cached background images in pixels; about twice the width of
+# the map in the output images
+BASEMAP_WIDTH = 2400
+
+# Background images read by this process, keyed by path
+_images = {}
+
+
+def natural_earth_features(back_res="50m"):
+    """Return the Natural Earth features drawn on the maps"""
+
+    fline_wd = 0.5  # line width
+    falpha = 0.3  # transparency
+
+    # natural_earth
+    #  land=cfeature.NaturalEarthFeature('physical','land',back_res,
+    #                    edgecolor='face',facecolor=cfeature.COLORS['land'],
+    #                    alpha=falpha)
+    lakes = cfeature.NaturalEarthFeature(
+        "physical",
+        "lakes",
+        back_res,
+        edgecolor="blue",
+        facecolor="none",
+        linewidth=fline_wd,
+        alpha=falpha,
+    )
+    coastline = cfeature.NaturalEarthFeature(
+        "physical",
+        "coastline",
+        back_res,
+        edgecolor="blue",
+        facecolor="none",
+        linewidth=fline_wd,
+        alpha=falpha,
+    )
+    states = cfeature.NaturalEarthFeature(
+        "cultural",
+        "admin_1_states_provinces",
+        back_res,
+        edgecolor="black",
+        facecolor="none",
+        linewidth=fline_wd,
+        linestyle=":",
+        alpha=falpha,
+    )
+    borders = cfeature.NaturalEarthFeature(
+        "cultural",
+        "admin_0_countries",
+        back_res,
+        edgecolor="red",
+        facecolor="none",
+        linewidth=fline_wd,
+        alpha=falpha,
+    )
+    return [lakes, states, borders, coastline]
+
+
+def draw_basemap(ax, cartopy_dir, back_img="on"):
+    """Draw the map background on cartopy axes from the raster and
+    shapefiles in cartopy_dir"""
+
+    # Define where Cartopy Maps are located
+    cartopy.config["data_dir"] = cartopy_dir
+
+    # high-resolution background images
+    if back_img == "on":
+        img = plt.imread(cartopy_dir + "/raster_files/NE1_50M_SR_W.tif")
+        ax.imshow(img, origin="upper", transform=ccrs.PlateCarree())
+
+    for feature in natural_earth_features():
+        ax.add_feature(feature)
+
+
+def basemap_key(projection, extent, cartopy_dir):
+    """Return the key identifying the background image for a projection
+    and extent (in projection coordinates)"""
+
+    raster = os.path.join(cartopy_dir, "raster_files", "NE1_50M_SR_W.tif")
+    desc = {
+        "version": BASEMAP_VERSION,
+        "width": BASEMAP_WIDTH,
+        "projection": projection.proj4_init,
+        "extent": [round(float(v), 1) for v in extent],
+        "cartopy_dir": os.path.abspath(cartopy_dir),
+        "raster_mtime": os.path.getmtime(raster) if os.path.exists(raster) else None,
+    }
+    return hashlib.sha256(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+
+def render_basemap(projection, extent, cartopy_dir, path):
+    """Render the map background for a projection and extent (in
+    projection coordinates) to a PNG image that exactly covers the
+    extent"""
+
+    x0, x1, y0, y1 = extent
+    width = 10.0
+    dpi = BASEMAP_WIDTH / width
+
+    # Use a figure outside of pyplot so the caller's current figure and
+    # axes are left alone
+    fig = Figure(figsize=(width, width * (y1 - y0) / (x1 - x0)), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1], projection=projection)
+    ax.set_extent(extent, crs=projection)
+    ax.set_axis_off()
+    draw_basemap(ax, cartopy_dir)
+    ax.set_extent(extent, crs=projection)
+
+    # Write to a temporary file first, since other processes may be
+    # reading or rendering the same image
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".png")
+    os.close(fd)
+    try:
+        fig.savefig(tmp, format="png", dpi=dpi)
+        # mkstemp creates the file readable by its owner only, and the
+        # cache may be shared with other users' experiments
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def add_basemap(ax, cartopy_dir, cache_dir=None):
+    """Add the map background to cartopy axes whose extent has been set.
+
+    Args:
+        ax: the cartopy GeoAxes
+        cartopy_dir: base directory of the cartopy shapefiles and rasters
+        cache_dir: directory for background images, or None to draw the
+            background directly
+    Returns:
+        Path to the background image used, or None
+    """
+
+    if not cache_dir:
+        draw_basemap(ax, cartopy_dir)
+        return None
+
+    extent = ax.get_extent(crs=ax.projection)
+    key = basemap_key(ax.projection, extent, cartopy_dir)
+    path = os.path.join(cache_dir, f"basemap_{key[:16]}.png")
+
+    if path not in _images:
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            render_basemap(ax.projection, extent, cartopy_dir, path)
+        _images[path] = plt.imread(path)
+
+    # The image is already in the map projection, so it is placed without
+    # being warped
+    ax.imshow(
+        _images[path], origin="upper", extent=extent, transform=ax.projection
+    )
+    ax.set_extent(extent, crs=ax.projection)
+    return path
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+"""
+Fields derived from the post output for the plotting scripts.
+
+DerivedFields reads fields from a post file and derives the plotted
+quantities from them (unit conversions, Earth-relative winds, wind
+speeds, smoothed height and pressure fields), each one only once and as
+float32. Smoothing uses precomputed kernels. The large kernels are
+applied with FFTs, whose kernel transforms are computed once per grid
+shape; for the ~14 grid point sigma used on sea level pressure, this is
+much faster than ndimage.gaussian_filter. The wind rotation angles are
+computed once per grid. When given a cache directory, the fields are
+also saved there, so that later runs on the same post file (reruns, or
+the difference plots against a baseline) read them instead of computing
+them again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from scipy import fft, ndimage
+
+# Increase when derived fields change, so that fields cached by earlier
+# versions are not used
+DERIVED_VERSION = 1
+
+# Smoothing kernels with a radius up to this many grid points are applied
+# directly (separably); larger ones with FFTs
+FFT_MIN_RADIUS = 16
+
+# Unit conversions
+MS_TO_KTS = 1.94384
+MM_TO_IN = 0.0393701
+
+# Smoothing kernels (by sigma) and FFT smoothers (by grid shape and sigma)
+_weights = {}
+_smoothers = {}
+
+# Threads used by each FFT (see set_fft_workers)
+_fft_workers = 1
+
+# Wind rotation angles computed so far, keyed by grid
+_rotations = {}
+
+
+def set_fft_workers(workers):
+    """Set the number of threads used by each FFT of the smoothing. This
+    is 1 by default, since the plotting scripts usually run one process
+    per core; a process plotting alone can use all cores."""
+
+    global _fft_workers
+    _fft_workers = max(1, int(workers))
+
+
+def gaussian_weights(sigma, truncate=4.0):
+    """Return the 1-d Gaussian kernel used by ndimage.gaussian_filter()"""
+
+    if sigma not in _weights:
+        radius = int(truncate * float(sigma) + 0.5)
+        x = np.arange(-radius, radius + 1)
+        weights = np.exp(-0.5 / sigma**2 * x**2)
+        _weights[sigma] = weights / weights.sum()
+    return _weights[sigma]
+
+
+class _FFTSmoother:
+    """Gaussian smoothing of fields of one shape with FFTs. The field is
+    padded by reflection (like ndimage's default "reflect" mode) by at
+    least the kernel radius, so that the circular convolution matches
+    ndimage.gaussian_filter() away from the padding."""
+
+    def __init__(self, shape, sigma):
+        weights = gaussian_weights(sigma)
+        self.radius = r = len(weights) // 2
+        self.shape = shape
+        self.padded_shape = tuple(
+            fft.next_fast_len(n + 2 * r, real=True) for n in shape
+        )
+
+        # The kernel is symmetric, so its transform is real. It is separable,
+        # so its 2-d transform is the outer product of the 1-d transforms.
+        transforms = []
+        for n in self.padded_shape:
+            kernel = np.zeros(n)
+            kernel[: r + 1] = weights[r:]
+            kernel[n - r :] = weights[:r]
+            transforms.append(fft.fft(kernel).real)
+        ny_padded, nx_padded = self.padded_shape
+        self.transform = np.outer(
+            transforms[0], transforms[1][: nx_padded // 2 + 1]
+        ).astype(np.float32)
+
+    def __call__(self, field):
+        r = self.radius
+        ny, nx = self.shape
+        ny_padded, nx_padded = self.padded_shape
+        padded = np.pad(
+            np.asarray(field, dtype=np.float32),
+            ((r, ny_padded - ny - r), (r, nx_padded - nx - r)),
+            mode="symmetric",
+        )
+        smoothed = fft.irfft2(
+            fft.rfft2(padded, workers=_fft_workers) * self.transform,
+            s=self.padded_shape,
+            workers=_fft_workers,
+        )
+        return np.ascontiguousarray(smoothed[r : r + ny, r : r + nx])
+
+
+def smooth(field, sigma):
+    """Smooth a 2-d field like ndimage.gaussian_filter(field, sigma), and
+    return it as float32"""
+
+    field = np.asarray(field, dtype=np.float32)
+    weights = gaussian_weights(sigma)
+    if len(weights) // 2 <= FFT_MIN_RADIUS:
+        smoothed = ndimage.correlate1d(field, weights, axis=0, mode="reflect")
+        return ndimage.correlate1d(smoothed, weights, axis=1, mode="reflect")
+
+    key = (field.shape, sigma)
+    if key not in _smoothers:
+        _smoothers[key] = _FFTSmoother(field.shape, sigma)
+    return _smoothers[key](field)
+
+
+def barb_skip(dx):
+    """Return the number of grid points between wind barbs, which places a
+    barb about every 180 km (optimized for the CONUS domain)"""
+
+    return round(177.28 * (dx / 1000.0) ** -0.97)
+
+
+def wind_rotation(true_lat, lov_lon, earth_lons, proj):
+    """Return the sine and cosine of the angles by which to rotate grid
+    relative winds to Earth relative winds (see rotate_wind)"""
+
+    if lov_lon > 0.0:
+        lov_lon = lov_lon - 360.0
+    dtr = np.pi / 180.0  # Degrees to radians
+
+    # Compute rotation constant which is also
+    # known as the Lambert cone constant.  In the case
+    # of a polar stereographic projection, this is one.
+    # See the following pdf for excellent documentation
+    # http://www.dtcenter.org/met/users/docs/write_ups/velocity.pdf
+    if proj.lower() == "lcc":
+        rotcon_p = np.sin(true_lat * dtr)
+    elif proj.lower() in ["stere", "spstere", "npstere"]:
+        rotcon_p = 1.0
+    else:
+        raise SystemExit(
+            "Unsupported map projection: " + proj.lower() + " for wind rotation."
+        )
+
+    angles = rotcon_p * (earth_lons - lov_lon) * dtr
+    return np.sin(angles), np.cos(angles)
+
+
+def rotate_wind(true_lat, lov_lon, earth_lons, uin, vin, proj, inverse=False):
+    #  Rotate winds from LCC relative to earth relative (or vice-versa if inverse==true)
+    #   This routine is vectorized and *should* work on any size 2D vg and ug arrays.
+    #   Program will quit if dimensions are too large.
+    #
+    # Input args:
+    #  true_lat = True latitidue for LCC projection (single value in degrees)
+    #  lov_lon  = The LOV value from grib (e.g. - -95.0) (single value in degrees)
+    #              Grib doc says: "Lov = orientation of the grid; i.e. the east longitude value of
+    #                              the meridian which is parallel to the Y-axis (or columns of the grid)
+    #                              along which latitude increases as the Y-coordinate increases (the
+    #                              orientation longitude may or may not appear on a particular grid).
+    #
+    #  earth_lons = Earth relative longitudes (can be an array, in degrees)
+    #  uin, vin     = Input winds to rotate
+    #
+    # Returns:
+    #  uout, vout = Output, rotated winds
+    # -----------------------------------------------------------------------------------------------------
+
+    # Get size and length of input u winds, if not 2d, raise an error
+    q = np.shape(uin)
+    ndims = len(q)
+    if ndims > 2:
+        # Raise error and quit!
+        raise SystemExit("Input winds for rotation have greater than 2 dimensions!")
+
+    if not isinstance(inverse, bool):
+        raise TypeError("**kwarg inverse must be of type bool.")
+
+    sinx2, cosx2 = wind_rotation(true_lat, lov_lon, earth_lons, proj)
+
+    # Steps below are elementwise products, not matrix mutliplies
+    if inverse == False:
+        # Return the earth relative winds
+        uout = cosx2 * uin + sinx2 * vin
+        vout = -sinx2 * uin + cosx2 * vin
+    elif inverse == True:
+        # Return the grid relative winds
+        uout = cosx2 * uin - sinx2 * vin
+        vout = sinx2 * uin + cosx2 * vin
+
+    return uout, vout
+
+
+def _grid_rotation(grid):
+    """Return the sine and cosine of the wind rotation angles of a grid as
+    float32, computing them only the first time"""
+
+    key = id(grid)
+    if key not in _rotations:
+        sinx2, cosx2 = wind_rotation(grid.lat_0, grid.lon_0, grid.lon, "lcc")
+        # The grid is kept so that its id is not reused
+        _rotations[key] = (grid, sinx2.astype(np.float32), cosx2.astype(np.float32))
+    return _rotations[key][1:]
+
+
+def _winds(u_keys, v_keys):
+    """Return a function reading wind components (in knots) selected by
+    the given GribReader keys"""
+
+    def winds(fields):
+        u = fields.read(**u_keys) * MS_TO_KTS
+        v = fields.read(**v_keys) * MS_TO_KTS
+        if fields.earth_relative:
+            # Rotate winds from grid relative to Earth relative
+            sinx2, cosx2 = _grid_rotation(fields.grid)
+            u, v = cosx2 * u + sinx2 * v, -sinx2 * u + cosx2 * v
+        return u, v
+
+    return winds
+
+
+def _uh25(fields):
+    maxuh25 = fields.read(
+        stepType="max", parameterName="199", topLevel=5000, bottomLevel=2000
+    )
+    minuh25 = fields.read(
+        stepType="min", parameterName="200", topLevel=5000, bottomLevel=2000
+    )
+    maxuh25[maxuh25 < 10] = 0
+    minuh25[minuh25 > -10] = 0
+    return maxuh25 + minuh25
+
+
+def _vort500(fields):
+    vort500 = smooth(fields.read(name="Absolute vorticity", level=500) * 100000, 1.7225)
+    vort500[vort500 > 1000] = 0  # Mask out undefined values on domain edge
+    return vort500
+
+
+def _wspd(u, v):
+    return lambda fields: np.sqrt(fields[u] ** 2 + fields[v] ** 2)
+
+
+# Functions computing each field from a DerivedFields object. Functions
+# computing several fields (winds) return a tuple.
+FIELDS = {
+    "slp": lambda f: f.read(name="Pressure reduced to MSL") * 0.01,
+    "slpsmooth": lambda f: smooth(f["slp"], 13.78),
+    "tmp2m": lambda f: (f.read(name="2 metre temperature") - 273.15) * 1.8 + 32.0,
+    "dew2m": lambda f: (f.read(name="2 metre dewpoint temperature") - 273.15) * 1.8
+    + 32.0,
+    ("uwind", "vwind"): _winds(
+        {"name": "10 metre U wind component"}, {"name": "10 metre V wind component"}
+    ),
+    "wspd10m": _wspd("uwind", "vwind"),
+    "cape": lambda f: f.read(
+        name="Convective available potential energy", typeOfLevel="surface"
+    ),
+    "cin": lambda f: f.read(name="Convective inhibition", typeOfLevel="surface"),
+    "z500": lambda f: smooth(f.read(name="Geopotential Height", level=500) * 0.1, 6.89),
+    "vort500": _vort500,
+    ("u500", "v500"): _winds(
+        {"name": "U component of wind", "level": 500},
+        {"name": "V component of wind", "level": 500},
+    ),
+    ("u250", "v250"): _winds(
+        {"name": "U component of wind", "level": 250},
+        {"name": "V component of wind", "level": 250},
+    ),
+    "wspd250": _wspd("u250", "v250"),
+    "qpf": lambda f: f.read(name="Total Precipitation", lengthOfTimeRange=f.fhr)
+    * MM_TO_IN,
+    "refc": lambda f: f.read(name="Maximum/Composite radar reflectivity"),
+    "uh25": _uh25,
+}
+
+# Fields whose values depend on whether winds are Earth relative
+ROTATED_FIELDS = ["uwind", "vwind", "u500", "v500", "u250", "v250"]
+
+# Key in FIELDS of each field
+_FIELD_KEYS = {
+    name: key
+    for key in FIELDS
+    for name in (key if isinstance(key, tuple) else (key,))
+}
+
+
+class DerivedFields:
+    """Fields of one post file, each read or derived on first use.
+
+    Usage:
+        fields = DerivedFields(GribReader(path), fhr)
+        slpsmooth = fields["slpsmooth"]
+        u, v = fields.barbs("uwind", "vwind")
+
+    Args:
+        reader: GribReader of the post file
+        fhr: forecast hour of the post file
+        earth_relative: rotate wind components from grid relative to Earth
+            relative
+        cache_dir: directory in which to save the fields, and from which
+            to read those saved by earlier runs, or None
+    """
+
+    def __init__(self, reader, fhr, earth_relative=True, cache_dir=None):
+        self.reader = reader
+        self.fhr = fhr
+        self.earth_relative = earth_relative
+        self.grid = reader.grid()
+        self._values = {}
+        self._barbs = {}
+
+        self.cache_dir = None
+        if cache_dir:
+            st = os.stat(reader.path)
+            desc = {
+                "version": DERIVED_VERSION,
+                "path": os.path.realpath(reader.path),
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "fhr": int(fhr),
+            }
+            key = hashlib.sha256(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+            self.cache_dir = os.path.join(cache_dir, key[:16])
+
+    def read(self, **kwargs):
+        """Return the values of the first message matching the given keys
+        (see GribReader.select) as float32"""
+
+        return self.reader.values(**kwargs).astype(np.float32)
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            key = _FIELD_KEYS[name]
+            names = key if isinstance(key, tuple) else (key,)
+            values = [self._load(n) for n in names]
+            if any(v is None for v in values):
+                values = FIELDS[key](self)
+                if not isinstance(key, tuple):
+                    values = (values,)
+                values = [v.astype(np.float32, copy=False) for v in values]
+                for n, v in zip(names, values):
+                    self._save(n, v)
+            self._values.update(zip(names, values))
+        return self._values[name]
+
+    def barbs(self, u, v, skip=None):
+        """Return the wind components u and v at every skip-th grid point in
+        each direction (by default, at the wind barbs' spacing)"""
+
+        if skip is None:
+            skip = barb_skip(self.grid.dx)
+        key = (u, v, skip)
+        if key not in self._barbs:
+            self._barbs[key] = (
+                np.ascontiguousarray(self[u][::skip, ::skip]),
+                np.ascontiguousarray(self[v][::skip, ::skip]),
+            )
+        return self._barbs[key]
+
+    def _path(self, name):
+        if name in ROTATED_FIELDS:
+            name += "_earth" if self.earth_relative else "_grid"
+        return os.path.join(self.cache_dir, name + ".npy")
+
+    def _load(self, name):
+        """Return a field saved in the cache directory, or None"""
+
+        if not self.cache_dir:
+            return None
+        try:
+            values = np.load(self._path(name))
+        except (OSError, ValueError):
+            return None
+        if np.isnan(values).any():
+            values = np.ma.masked_invalid(values)
+        return values
+
+    def _save(self, name, values):
+        """Save a field in the cache directory"""
+
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file first, since other processes may be
+        # reading or saving the same field
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ma.filled(values, np.nan))
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self._path(name))
+        except BaseException:
+            os.remove(tmp)
+            raise
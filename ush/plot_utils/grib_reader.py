@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+"""
+Read fields from UPP GRIB2 output for the plotting scripts.
+
+pygrib's select() scans every message in the file on each call. Instead,
+GribReader scans the file once, records the header keys used to pick out
+fields along with each message's byte offset, and afterwards reads and
+decodes only the messages that are asked for. The lat/lon arrays and the
+shifted projection grid used by pcolormesh are the same for every
+forecast hour, so they are computed once per grid and cached, along with
+the grid's coordinates in its own (native) projection.
+"""
+
+import collections
+
+import numpy as np
+import pygrib
+import pyproj
+
+# Header keys recorded for each message and available to select()
+INVENTORY_KEYS = (
+    "name",
+    "shortName",
+    "parameterName",
+    "level",
+    "typeOfLevel",
+    "topLevel",
+    "bottomLevel",
+    "stepType",
+    "lengthOfTimeRange",
+)
+
+# x/y are the projected coordinates of the grid points, and x_edges/y_edges
+# those of the cell edges, in the projection described by projparams
+Grid = collections.namedtuple(
+    "Grid",
+    [
+        "lat",
+        "lon",
+        "lat_shift",
+        "lon_shift",
+        "lat_0",
+        "lon_0",
+        "dx",
+        "dy",
+        "projparams",
+        "x",
+        "y",
+        "x_edges",
+        "y_edges",
+    ],
+)
+
+# Grids computed so far, keyed by grid definition
+_grid_cache = {}
+
+
+def _grid_key(grb):
+    """Return a hashable key that identifies the grid of a message"""
+
+    try:
+        nx, ny = grb["Nx"], grb["Ny"]
+    except Exception:
+        nx, ny = grb["Ni"], grb["Nj"]
+    return (
+        tuple(sorted((k, str(v)) for k, v in grb.projparams.items())),
+        nx,
+        ny,
+        grb["latitudeOfFirstGridPointInDegrees"],
+        grb["longitudeOfFirstGridPointInDegrees"],
+        grb["DxInMetres"],
+        grb["DyInMetres"],
+    )
+
+
+def _compute_grid(grb, key):
+    """Compute the lat/lon arrays of a message's grid, along with the grid
+    shifted by half a grid cell for pcolormesh"""
+
+    _, nx, ny, lat1, lon1, dx, dy = key
+
+    # Unshifted grid for contours and wind barbs
+    lat, lon = grb.latlons()
+
+    # Shift grid for pcolormesh
+    pj = pyproj.Proj(grb.projparams)
+    x0, y0 = pj(lon1, lat1)
+    llcrnrx = x0 - (dx / 2.0)
+    llcrnry = y0 - (dy / 2.0)
+    x = llcrnrx + dx * np.arange(nx)
+    y = llcrnry + dy * np.arange(ny)
+    x, y = np.meshgrid(x, y)
+    lon_shift, lat_shift = pj(x, y, inverse=True)
+
+    return Grid(
+        lat=lat,
+        lon=lon,
+        lat_shift=lat_shift,
+        lon_shift=lon_shift,
+        lat_0=grb["LaDInDegrees"],
+        lon_0=grb["LoVInDegrees"],
+        dx=dx,
+        dy=dy,
+        projparams=dict(grb.projparams),
+        x=x0 + dx * np.arange(nx),
+        y=y0 + dy * np.arange(ny),
+        x_edges=llcrnrx + dx * np.arange(nx + 1),
+        y_edges=llcrnry + dy * np.arange(ny + 1),
+    )
+
+
+class GribReader:
+    """Index a GRIB2 file once and read only the messages that are needed.
+
+    Usage:
+        data = GribReader(path)
+        slp = data.values(name="Pressure reduced to MSL")
+        grid = data.grid()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.inventory = []
+        self._file = open(path, "rb")
+
+        grbs = pygrib.open(path)
+        try:
+            for grb in grbs:
+                entry = {
+                    key: grb[key] if grb.has_key(key) else None
+                    for key in INVENTORY_KEYS
+                }
+                entry["offset"] = grb["offset"]
+                entry["totalLength"] = grb["totalLength"]
+                self.inventory.append(entry)
+        finally:
+            grbs.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, entry):
+        """Decode the message described by an inventory entry"""
+
+        self._file.seek(entry["offset"])
+        return pygrib.fromstring(self._file.read(entry["totalLength"]))
+
+    def find(self, **kwargs):
+        """Return the inventory entries matching all given keys. Values are
+        compared for equality, or may be functions returning True for a
+        match, like pygrib's select()."""
+
+        unknown = set(kwargs) - set(INVENTORY_KEYS)
+        if unknown:
+            raise KeyError(f"Cannot select on keys {sorted(unknown)}")
+
+        def matches(entry):
+            for key, want in kwargs.items():
+                have = entry[key]
+                if callable(want):
+                    if have is None or not want(have):
+                        return False
+                elif have is None or str(have) != str(want):
+                    return False
+            return True
+
+        return [entry for entry in self.inventory if matches(entry)]
+
+    def select(self, **kwargs):
+        """Return the decoded messages matching the given keys. Like pygrib,
+        raises ValueError when nothing matches."""
+
+        entries = self.find(**kwargs)
+        if not entries:
+            raise ValueError(f"No matches found in {self.path} for {kwargs}")
+        return [self._read(entry) for entry in entries]
+
+    def values(self, **kwargs):
+        """Return the data of the first message matching the given keys"""
+
+        return self.select(**kwargs)[0].values
+
+    def grid(self):
+        """Return the Grid of the first message, computing it only the first
+        time a file on this grid is read"""
+
+        grb = self._read(self.inventory[0])
+        key = _grid_key(grb)
+        if key not in _grid_cache:
+            _grid_cache[key] = _compute_grid(grb, key)
+        return _grid_cache[key]
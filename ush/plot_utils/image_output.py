@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+Output of the plot images.
+
+Saving a figure as PNG and then re-encoding it with PIL (to drop the
+alpha channel) encodes every image twice and decodes it once. An
+ImageWriter instead renders the figure to raw pixels and encodes them a
+single time, either as an RGB PNG, as a palette PNG, or in another
+format (see IMAGE_FORMATS). A palette PNG is a fraction of the size for
+plots made of a few filled levels. The encoding no longer needs the
+figure, so it can run on a background thread while the next plot is
+drawn.
+"""
+
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Output formats: PIL format, file extension, and options of the encoder
+IMAGE_FORMATS = {
+    "png": ("PNG", ".png", {}),
+    "webp": ("WEBP", ".webp", {"lossless": True}),
+    "jpeg": ("JPEG", ".jpg", {"quality": 90}),
+}
+
+
+def render_rgba(fig, dpi=150, bbox_inches="tight"):
+    """Render a figure to an RGBA image, cropped and scaled as savefig()
+    would"""
+
+    # The size of the raw output is that of the renderer of the last draw,
+    # which savefig() makes after cropping the figure
+    sizes = []
+    cid = fig.canvas.mpl_connect(
+        "draw_event",
+        lambda event: sizes.append((int(event.renderer.width), int(event.renderer.height))),
+    )
+    ram = io.BytesIO()
+    try:
+        fig.savefig(ram, format="rgba", bbox_inches=bbox_inches, dpi=dpi)
+    finally:
+        fig.canvas.mpl_disconnect(cid)
+
+    data = ram.getvalue()
+    if sizes and len(data) == 4 * sizes[-1][0] * sizes[-1][1]:
+        return Image.frombuffer("RGBA", sizes[-1], data, "raw", "RGBA", 0, 1)
+
+    # Size not known, e.g. with another backend than Agg
+    logging.debug("Could not render figure to raw pixels; rendering to PNG")
+    ram = io.BytesIO()
+    fig.savefig(ram, format="png", bbox_inches=bbox_inches, dpi=dpi)
+    ram.seek(0)
+    return Image.open(ram)
+
+
+class ImageWriter:
+    """Writes figures to image files, encoding each image once.
+
+    Args:
+        image_format: key of IMAGE_FORMATS
+        palette_colors: number of colors of palette PNGs, or 0 to write
+            RGB PNGs; only used for the "png" format
+        dpi: resolution of the images
+        threads: number of threads encoding and writing images, or 0 to
+            do it in the calling thread
+    """
+
+    def __init__(self, image_format="png", palette_colors=0, dpi=150, threads=1):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(
+                f"Unknown image format {image_format}; valid formats are {list(IMAGE_FORMATS)}"
+            )
+        if not 0 <= palette_colors <= 256:
+            raise ValueError("The number of palette colors must be between 0 and 256")
+        self.image_format = image_format
+        self.palette_colors = palette_colors
+        self.dpi = dpi
+        self._executor = ThreadPoolExecutor(threads) if threads > 0 else None
+        # Limits the images held in memory when drawing is faster than encoding
+        self._max_pending = 2 * threads
+        self._pending = []
+
+    def path(self, filename):
+        """Return the path of the image written for filename, whose extension
+        is replaced by that of the image format"""
+
+        return os.path.splitext(filename)[0] + IMAGE_FORMATS[self.image_format][1]
+
+    def save(self, fig, filename):
+        """Save a figure. The figure can be changed once this returns, but the
+        image may be written later; call wait() to make sure it was.
+
+        Returns:
+            Path of the image
+        """
+
+        path = self.path(filename)
+        image = render_rgba(fig, self.dpi)
+        if self._executor is None:
+            self._write(image, path)
+            return path
+
+        while len(self._pending) >= self._max_pending:
+            self._pending.pop(0).result()
+        self._pending.append(self._executor.submit(self._write, image, path))
+        return path
+
+    def wait(self):
+        """Wait until all images are written, raising the first error met
+        writing them"""
+
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        """Wait until all images are written, and stop the threads"""
+
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _write(self, image, path):
+        """Encode an image and write it to path"""
+
+        pil_format, _, options = IMAGE_FORMATS[self.image_format]
+        if self.image_format == "png" and self.palette_colors:
+            image = image.convert("RGB").convert(
+                "P", palette=Image.ADAPTIVE, colors=self.palette_colors
+            )
+        else:
+            image = image.convert("RGB")
+
+        # Write to a temporary file first, so that an image is never seen
+        # partly written
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format=pil_format, **options)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
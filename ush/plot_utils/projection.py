@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Cartopy projections of the post output grids.
+
+When fields are drawn with their lat/lon arrays and a PlateCarree
+transform, cartopy projects every grid point to the map projection for
+every plot. Fields can instead be drawn in the projected coordinates of
+their own grid (see Grid.x/y in grib_reader) on a map in that same
+projection; cartopy then has nothing to reproject. native_crs() gives
+that projection, built once per grid and shared by all maps and plots.
+"""
+
+import cartopy.crs as ccrs
+
+# Projections built so far, keyed by the grid's proj parameters
+_crs_cache = {}
+
+
+def native_crs(projparams):
+    """Return the cartopy projection described by a GRIB message's proj
+    parameters (pygrib's projparams), or None if the projection is not
+    supported (only Lambert conformal is)"""
+
+    key = tuple(sorted((k, str(v)) for k, v in projparams.items()))
+    if key not in _crs_cache:
+        _crs_cache[key] = _make_crs(projparams)
+    return _crs_cache[key]
+
+
+def _make_crs(projparams):
+    if projparams.get("proj") != "lcc":
+        return None
+
+    if "a" in projparams:
+        globe = ccrs.Globe(
+            ellipse=None,
+            semimajor_axis=projparams["a"],
+            semiminor_axis=projparams.get("b", projparams["a"]),
+        )
+    else:
+        globe = ccrs.Globe(ellipse=projparams.get("ellps", "WGS84"))
+
+    lat_1 = projparams.get("lat_1", projparams.get("lat_0"))
+    lat_2 = projparams.get("lat_2", lat_1)
+    return ccrs.LambertConformal(
+        central_longitude=projparams["lon_0"],
+        central_latitude=projparams.get("lat_0", lat_1),
+        false_easting=projparams.get("x_0", 0.0),
+        false_northing=projparams.get("y_0", 0.0),
+        standard_parallels=(lat_1, lat_2),
+        globe=globe,
+    )
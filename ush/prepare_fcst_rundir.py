@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+"""
+Prepare the run directory (or directories) of a forecast.
+
+The forecast task needs several files rendered into its run directory
+before the model is launched: aqm.rc (for AQM runs), the namelist with
+the member's stochastic seeds (for stochastic ensembles), model_configure,
+diag_table and nems.configure. Each of these has its own script, but
+calling them one after the other starts a new interpreter and reloads
+the experiment's var_defns file every time. This script loads the
+configuration once and creates all of the files in one process, and for
+an ensemble it can prepare the run directories of all members of a cycle
+in one call.
+"""
+
+import os
+import sys
+import argparse
+import unittest
+from datetime import datetime
+
+from python_utils import (
+    import_vars,
+    set_env_var,
+    print_input_args,
+    print_info_msg,
+    print_err_msg_exit,
+    str_to_type,
+    mkdir_vrfy,
+    rm_vrfy,
+    load_shell_config,
+    flatten_dict,
+)
+
+import create_aqm_rc_file
+import create_diag_table_file
+import create_model_configure_file
+import create_nems_configure_file
+import set_FV3nml_ens_stoch_seeds
+
+# Modules whose functions are called here. The functions read the
+# experiment variables from their own module's globals.
+MODULES = [
+    create_aqm_rc_file,
+    create_diag_table_file,
+    create_model_configure_file,
+    create_nems_configure_file,
+    set_FV3nml_ens_stoch_seeds,
+]
+
+
+def import_config(cfg):
+    """Import the experiment variables into this module and into the
+    modules whose functions are called from it
+
+    Args:
+        cfg: flattened experiment configuration
+    Returns:
+        None
+    """
+
+    import_vars(dictionary=cfg)
+    for module in MODULES:
+        import_vars(dictionary=cfg, target_dict=vars(module))
+
+
+def prepare_fcst_rundir(
+    cdate,
+    run_dirs,
+    ensmem_indxs=None,
+    init_concentrations=False,
+    fcst_len_hrs=None,
+    sub_hourly_post=None,
+    dt_subhourly_post_mnts=None,
+    dt_atmos=None,
+):
+    """Creates the per-cycle files of the forecast in each of the given
+    run directories
+
+    Args:
+        cdate: cycle date
+        run_dirs: list of run directories, one per ensemble member
+        ensmem_indxs: list of ensemble member indices matching run_dirs,
+            or None to use ENSMEM_INDX
+        init_concentrations: flag for initial AQM concentrations
+        fcst_len_hrs: forecast length in hours (default=FCST_LEN_HRS)
+        sub_hourly_post: (default=SUB_HOURLY_POST)
+        dt_subhourly_post_mnts: (default=DT_SUBHOURLY_POST_MNTS)
+        dt_atmos: forecast model's main time step (default=DT_ATMOS)
+    Returns:
+        Boolean
+    """
+
+    print_input_args(locals())
+
+    # import all environment variables
+    import_vars()
+
+    if fcst_len_hrs is None:
+        fcst_len_hrs = FCST_LEN_HRS
+    if sub_hourly_post is None:
+        sub_hourly_post = SUB_HOURLY_POST
+    if dt_subhourly_post_mnts is None:
+        dt_subhourly_post_mnts = DT_SUBHOURLY_POST_MNTS
+    if dt_atmos is None:
+        dt_atmos = DT_ATMOS
+
+    if ensmem_indxs is None:
+        ensmem_indxs = [None] * len(run_dirs)
+    elif len(ensmem_indxs) != len(run_dirs):
+        print_err_msg_exit(
+            f"""
+            The number of ensemble member indices (ensmem_indxs) does not match
+            the number of run directories (run_dirs):
+              ensmem_indxs = {ensmem_indxs}
+              run_dirs = {run_dirs}"""
+        )
+
+    do_stoch_seeds = DO_ENSEMBLE and (
+        DO_SPP or DO_SPPT or DO_SHUM or DO_SKEB or DO_LSM_SPP
+    )
+
+    for run_dir, ensmem_indx in zip(run_dirs, ensmem_indxs):
+        print_info_msg(
+            f"""
+            Preparing forecast run directory (run_dir):
+              run_dir = '{run_dir}'""",
+            verbose=VERBOSE,
+        )
+
+        if CPL_AQM and not create_aqm_rc_file.create_aqm_rc_file(
+            cdate=cdate, run_dir=run_dir, init_concentrations=init_concentrations
+        ):
+            return False
+
+        if do_stoch_seeds:
+            set_FV3nml_ens_stoch_seeds.set_FV3nml_ens_stoch_seeds(
+                cdate, ensmem_indx=ensmem_indx, run_dir=run_dir
+            )
+
+        if not create_model_configure_file.create_model_configure_file(
+            cdate=cdate,
+            fcst_len_hrs=fcst_len_hrs,
+            run_dir=run_dir,
+            sub_hourly_post=sub_hourly_post,
+            dt_subhourly_post_mnts=dt_subhourly_post_mnts,
+            dt_atmos=dt_atmos,
+        ):
+            return False
+
+        if not create_diag_table_file.create_diag_table_file(run_dir=run_dir):
+            return False
+
+        if not create_nems_configure_file.create_nems_configure_file(run_dir=run_dir):
+            return False
+
+    return True
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Creates the per-cycle files in forecast run directories."
+    )
+
+    parser.add_argument(
+        "-r",
+        "--run-dir",
+        dest="run_dirs",
+        required=True,
+        nargs="+",
+        help="Run directory, or one run directory per ensemble member.",
+    )
+
+    parser.add_argument(
+        "-e",
+        "--ensmem-indx",
+        dest="ensmem_indxs",
+        nargs="+",
+        help="Ensemble member index of each run directory (default=ENSMEM_INDX).",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--cdate",
+        dest="cdate",
+        required=True,
+        help="Date string in YYYYMMDDHH format.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--init-concentrations",
+        dest="init_concentrations",
+        default="false",
+        help="Flag for initial concentrations.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--fcst_len_hrs",
+        dest="fcst_len_hrs",
+        help="Forecast length in hours (default=FCST_LEN_HRS).",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--sub-hourly-post",
+        dest="sub_hourly_post",
+        help="Set sub hourly post to either TRUE/FALSE (default=SUB_HOURLY_POST).",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--dt-subhourly-post-mnts",
+        dest="dt_subhourly_post_mnts",
+        help="Subhourly post minutes (default=DT_SUBHOURLY_POST_MNTS).",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--dt-atmos",
+        dest="dt_atmos",
+        help="Forecast model's main time step (default=DT_ATMOS).",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--path-to-defns",
+        dest="path_to_defns",
+        required=True,
+        help="Path to var_defns file.",
+    )
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    cfg = load_shell_config(args.path_to_defns)
+    cfg = flatten_dict(cfg)
+    import_config(cfg)
+    ok = prepare_fcst_rundir(
+        cdate=str_to_type(args.cdate),
+        run_dirs=args.run_dirs,
+        ensmem_indxs=args.ensmem_indxs,
+        init_concentrations=str_to_type(args.init_concentrations),
+        fcst_len_hrs=str_to_type(args.fcst_len_hrs),
+        sub_hourly_post=str_to_type(args.sub_hourly_post),
+        dt_subhourly_post_mnts=str_to_type(args.dt_subhourly_post_mnts),
+        dt_atmos=str_to_type(args.dt_atmos),
+    )
+    sys.exit(0 if ok else 1)
+
+
+class Testing(unittest.TestCase):
+    def test_prepare_fcst_rundir(self):
+        self.assertTrue(
+            prepare_fcst_rundir(
+                cdate=datetime(2021, 1, 1, 6),
+                run_dirs=self.run_dirs,
+                fcst_len_hrs=72,
+                sub_hourly_post=True,
+                dt_subhourly_post_mnts=4,
+                dt_atmos=1,
+            )
+        )
+        for run_dir in self.run_dirs:
+            for fn in ["model_configure", "diag_table", "nems.configure"]:
+                self.assertTrue(os.path.exists(os.path.join(run_dir, fn)))
+
+    def setUp(self):
+        USHdir = os.path.dirname(os.path.abspath(__file__))
+        PARMdir = os.path.join(USHdir, "..", "parm")
+        self.rundir = os.path.join(USHdir, "test_data", "fcst_rundir")
+        self.run_dirs = [os.path.join(self.rundir, f"mem{i+1}") for i in range(2)]
+        for run_dir in self.run_dirs:
+            mkdir_vrfy("-p", run_dir)
+
+        set_env_var("DEBUG", True)
+        set_env_var("VERBOSE", True)
+        set_env_var("USHdir", USHdir)
+        set_env_var("CPL_AQM", False)
+        set_env_var("DO_ENSEMBLE", False)
+        for v in ["DO_SPP", "DO_SPPT", "DO_SHUM", "DO_SKEB", "DO_LSM_SPP"]:
+            set_env_var(v, False)
+        set_env_var("QUILTING", True)
+        set_env_var("WRITE_DOPOST", True)
+        set_env_var("PRINT_ESMF", False)
+        set_env_var("PE_MEMBER01", 24)
+        set_env_var("CRES", "C48")
+        set_env_var("CDATE", "2021010106")
+        set_env_var("FCST_LEN_HRS", 72)
+        set_env_var("DT_ATMOS", 1)
+        set_env_var("OMP_NUM_THREADS_RUN_FCST", 1)
+        set_env_var("RESTART_INTERVAL", 4)
+        set_env_var("WRTCMP_write_groups", 1)
+        set_env_var("WRTCMP_write_tasks_per_group", 2)
+        set_env_var("WRTCMP_output_grid", "lambert_conformal")
+        set_env_var("WRTCMP_cen_lon", -97.5)
+        set_env_var("WRTCMP_cen_lat", 35.0)
+        set_env_var("WRTCMP_stdlat1", 35.0)
+        set_env_var("WRTCMP_stdlat2", 35.0)
+        set_env_var("WRTCMP_nx", 199)
+        set_env_var("WRTCMP_ny", 111)
+        set_env_var("WRTCMP_lon_lwr_left", -121.23349066)
+        set_env_var("WRTCMP_lat_lwr_left", 23.41731593)
+        set_env_var("WRTCMP_dx", 3000.0)
+        set_env_var("WRTCMP_dy", 3000.0)
+        set_env_var("MODEL_CONFIG_FN", "model_configure")
+        set_env_var("MODEL_CONFIG_TMPL_FP", os.path.join(PARMdir, "model_configure"))
+        set_env_var("DIAG_TABLE_FN", "diag_table")
+        set_env_var(
+            "DIAG_TABLE_TMPL_FP", os.path.join(PARMdir, "diag_table.FV3_GFS_v15p2")
+        )
+        set_env_var("NEMS_CONFIG_FN", "nems.configure")
+        set_env_var("NEMS_CONFIG_TMPL_FP", os.path.join(PARMdir, "nems.configure"))
+
+    def tearDown(self):
+        rm_vrfy("-rf", self.rundir)
@@ -24,9 +24,12 @@ from .filesys_cmds_vrfy import (
     mkdir_vrfy,
     cd_vrfy,
 )
+from .stage_files import expand_paths, copy_file, link_file, stage_files
+from .fingerprint import files_fingerprint, Fingerprints
 from .print_input_args import print_input_args
 from .print_msg import print_info_msg, print_err_msg_exit, log_info
 from .run_command import run_command
+from .rocoto_db import job_stats, experiments_job_stats, write_job_stats_csv
 from .xml_parser import load_xml_file, has_tag_with_value
 from .config_parser import (
     load_json_config,
@@ -37,6 +40,8 @@ from .config_parser import (
     load_config_file,
     load_shell_config,
     cfg_to_shell_str,
+    cfg_to_shell_files,
+    shell_sections_dir,
     load_xml_config,
     cfg_to_xml_str,
     flatten_dict,
@@ -15,6 +15,7 @@ returnded by load_config to make queries.
 """
 
 import argparse
+import collections
 
 #
 # Note: Yaml maynot be available in which case we suppress
@@ -27,6 +28,7 @@ except ModuleNotFoundError:
     pass
 # The rest of the formats: JSON/SHELL/INI/XML do not need
 # external packages
+import copy
 import json
 import os
 import re
@@ -36,6 +38,7 @@ import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
 import jinja2
+import jinja2.meta
 
 from .environment import list_to_str, str_to_list
 from .run_command import run_command
@@ -97,11 +100,94 @@ def path_join(arg):
     return os.path.join(*arg)
 
 
+# Shared jinja2 environment and the templates compiled with it, keyed
+# by template source
+_j2env = None
+_j2templates = {}
+
+
+def jinja_env():
+    """Return the jinja2 environment used to fill in config templates"""
+
+    global _j2env
+    if _j2env is None:
+        _j2env = jinja2.Environment(
+            loader=jinja2.BaseLoader, undefined=jinja2.StrictUndefined
+        )
+        _j2env.filters["path_join"] = path_join
+    return _j2env
+
+
+def _compile_template(source):
+    """Compile a template, along with the variables it refers to. Each
+    reference is a tuple: ("workflow", "EXPTDIR") for workflow.EXPTDIR."""
+
+    if source not in _j2templates:
+        j2env = jinja_env()
+        ast = j2env.parse(source)
+        undeclared = jinja2.meta.find_undeclared_variables(ast)
+
+        def find_refs(node):
+            path = []
+            while isinstance(node, (jinja2.nodes.Getattr, jinja2.nodes.Getitem)):
+                if isinstance(node, jinja2.nodes.Getattr):
+                    path.insert(0, node.attr)
+                elif isinstance(node.arg, jinja2.nodes.Const):
+                    path.insert(0, node.arg.value)
+                else:
+                    break
+                node = node.node
+            if isinstance(node, jinja2.nodes.Name):
+                if node.name in undeclared:
+                    yield (node.name, *path)
+                return
+            for child in node.iter_child_nodes():
+                yield from find_refs(child)
+
+        _j2templates[source] = (j2env.from_string(ast), set(find_refs(ast)))
+    return _j2templates[source]
+
+
+def _render_template(source, context):
+    """Fill in a template string. Each double curly brace expression is
+    filled in separately, so that any that can not be (for example,
+    cycle-dependent templates that are filled in at run time) are left
+    as-is. Strings with jinja statements are filled in as a whole."""
+
+    if "{%" in source:
+        templates = [source]
+    else:
+        templates = re.split(r"({{[^}]*}})", source)
+
+    data = []
+    for template in templates:
+        if "{{" in template or "{%" in template:
+            j2tmpl, _ = _compile_template(template)
+            try:
+                # Render against the config itself rather than a copy
+                ctx = j2tmpl.new_context(context, shared=True)
+                template = j2tmpl.environment.concat(j2tmpl.root_render_func(ctx))
+            except jinja2.exceptions.UndefinedError:
+                # Leave a templated field as-is in the resulting dict
+                pass
+            except TypeError:
+                pass
+            except ZeroDivisionError:
+                pass
+        data.append(template)
+    return "".join(data)
+
+
 def extend_yaml(yaml_dict, full_dict=None):
 
     """
     Updates yaml_dict inplace by rendering any existing Jinja2 templates
     that exist in a value.
+
+    Templates are filled in a single pass, in an order such that values
+    referred to by a template are filled in before it (otherwise in the
+    order of the dict). Values in the same section as a template are
+    referred to by name, others by section: workflow.EXPTDIR.
     """
 
     if full_dict is None:
@@ -110,60 +196,97 @@ def extend_yaml(yaml_dict, full_dict=None):
     if not isinstance(yaml_dict, dict):
         return
 
-    for k, v in yaml_dict.items():
-
-        if isinstance(v, dict):
-            extend_yaml(v, full_dict)
-        else:
+    # Find the templated values, keyed by their path in yaml_dict
+    leaves = {}
 
+    def find_leaves(d, path):
+        for k, v in d.items():
+            if isinstance(v, dict):
+                find_leaves(v, path + (k,))
+                continue
             # Save a bit of compute and only do this part for strings that
             # contain the jinja double brackets.
             v_str = str(v.text) if isinstance(v, ET.Element) else str(v)
-            is_a_template = any((ele for ele in ["{{", "{%"] if ele in v_str))
-            if is_a_template:
-
-                # Find expressions first, and process them as a single template
-                # if they exist
-                # Find individual double curly brace template in the string
-                # otherwise. We need one substitution template at a time so that
-                # we can opt to leave some un-filled when they are not yet set.
-                # For example, we can save cycle-dependent templates to fill in
-                # at run time.
-                if "{%" in v:
-                    templates = [v_str]
-                else:
-                    # Separates out all the double curly bracket pairs
-                    templates = re.findall(r"{{[^}]*}}|\S", v_str)
-                data = []
-                for template in templates:
-                    j2env = jinja2.Environment(
-                        loader=jinja2.BaseLoader, undefined=jinja2.StrictUndefined
-                    )
-                    j2env.filters["path_join"] = path_join
-                    j2tmpl = j2env.from_string(template)
-                    try:
-                        # Fill in a template that has the appropriate variables
-                        # set.
-                        template = j2tmpl.render(**yaml_dict, **full_dict)
-                    except jinja2.exceptions.UndefinedError as e:
-                        # Leave a templated field as-is in the resulting dict
-                        pass
-                    except TypeError:
-                        pass
-                    except ZeroDivisionError:
-                        pass
-                    except:
-                        print(f"{k}: {template}")
-                        raise
-
-                    data.append(template)
-
-                if isinstance(v, ET.Element):
-                    v.text = "".join(data)
-                else:
-                    # Put the full template line back together as it was,
-                    # filled or not
-                    yaml_dict[k] = "".join(data)
+            if "{{" in v_str or "{%" in v_str:
+                leaves[path + (k,)] = (d, k, v_str, path)
+
+    find_leaves(yaml_dict, ())
+
+    def lookup(path):
+        d = yaml_dict
+        for k in path:
+            if not isinstance(d, dict) or k not in d:
+                return None
+            d = d[k]
+        return d
+
+    def dependencies(leaf):
+        """Paths of the templated values a template refers to"""
+
+        d, _, v_str, section = leaves[leaf]
+        try:
+            _, refs = _compile_template(v_str)
+        except jinja2.exceptions.TemplateSyntaxError:
+            refs = set()
+            for template in re.findall(r"{{[^}]*}}", v_str):
+                try:
+                    refs |= _compile_template(template)[1]
+                except jinja2.exceptions.TemplateSyntaxError:
+                    pass
+
+        deps = []
+        for ref in refs:
+            if ref[0] in d:
+                ref = section + ref
+            elif full_dict is not yaml_dict:
+                continue
+            # A templated value, or an attribute of one
+            for i in range(len(ref), 0, -1):
+                if ref[:i] in leaves:
+                    deps.append(ref[:i])
+                    break
+            else:
+                # A section containing templated values
+                if isinstance(lookup(ref), dict):
+                    deps.extend(p for p in leaves if p[: len(ref)] == ref)
+        return deps
+
+    # Order the templates so that the ones each refers to come first.
+    # References that form a cycle are left to the order of the dict.
+    order = []
+    visited = set()
+    for leaf in leaves:
+        if leaf in visited:
+            continue
+        visited.add(leaf)
+        stack = [(leaf, iter(dependencies(leaf)))]
+        while stack:
+            node, deps = stack[-1]
+            for dep in deps:
+                if dep not in visited:
+                    visited.add(dep)
+                    stack.append((dep, iter(dependencies(dep))))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+
+    j2globals = jinja_env().globals
+    for leaf in order:
+        d, k, v_str, _ = leaves[leaf]
+        context = collections.ChainMap(d, full_dict, j2globals)
+        try:
+            rendered = _render_template(v_str, context)
+        except:
+            print(f"{k}: {v_str}")
+            raise
+        v = d[k]
+        if isinstance(v, ET.Element):
+            v.text = rendered
+        else:
+            # Put the full template line back together as it was,
+            # filled or not
+            d[k] = rendered
 
 
 ##########
@@ -213,9 +336,58 @@ def load_shell_as_ini_config(file_name, return_string=1):
     return cfg
 
 
+# Regular expressions for the lines written by cfg_to_shell_str
+_SHELL_SECTION_RE = re.compile(r"^# \[(?P<name>[^\]]+)\]$")
+_SHELL_VAR_RE = re.compile(r"^(?P<key>[A-Za-z_][A-Za-z0-9_]*)=(?P<value>.*)$")
+
+# Shell config files loaded so far, keyed by path and return_string
+_shell_config_cache = {}
+
+
+def load_shell_as_sections_config(file_name, return_string=0):
+    """Load a shell config file written by cfg_to_shell_str, where each
+    section starts with a '# [name]' comment and every other line sets a
+    single variable to a quoted scalar or a ( ... ) array.
+
+    Gives the same result as load_shell_as_ini_config without writing a
+    temporary file. Raises ValueError for any line outside of that format.
+    """
+
+    with open(file_name, "r") as file:
+        contents = file.read().replace("\\\n", " ")
+
+    cfg = {}
+    section = None
+    for line in contents.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = _SHELL_SECTION_RE.match(line)
+        if match:
+            name = match.group("name")
+            if name in cfg:
+                raise ValueError(f"Duplicate section [{name}] in {file_name}")
+            section = cfg[name] = {}
+            continue
+        if line[0] in "#;":
+            continue
+        match = _SHELL_VAR_RE.match(line)
+        if not match or section is None:
+            raise ValueError(f"Unexpected line in {file_name}: {line}")
+        key = match.group("key")
+        if key in section:
+            raise ValueError(f"Duplicate variable {key} in {file_name}")
+        section[key] = str_to_list(match.group("value"), return_string)
+
+    return cfg
+
+
 def load_shell_config(config_file, return_string=0):
     """Loads old style shell config files.
-    We source the config script in a subshell and gets the variables it sets
+    Files written by cfg_to_shell_str are parsed directly. Otherwise,
+    we source the config script in a subshell and gets the variables it sets.
+    Results are cached as long as the file's modification time and size
+    do not change.
 
     Args:
          config_file: path to config file script
@@ -223,7 +395,27 @@ def load_shell_config(config_file, return_string=0):
          dictionary that should be equivalent to one obtained from parsing a yaml file.
     """
 
-    # First try to load it as a structured shell config file
+    stat = os.stat(config_file)
+    key = (os.path.abspath(config_file), return_string)
+    cached = _shell_config_cache.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return copy.deepcopy(cached[1])
+
+    cfg = _load_shell_config(config_file, return_string)
+    _shell_config_cache[key] = ((stat.st_mtime_ns, stat.st_size), cfg)
+    return copy.deepcopy(cfg)
+
+
+def _load_shell_config(config_file, return_string):
+    """Load a shell config file, trying the fastest method first"""
+
+    # First try to load it as a file written by cfg_to_shell_str
+    try:
+        return load_shell_as_sections_config(config_file, return_string)
+    except ValueError:
+        pass
+
+    # Then as a structured shell config file
     try:
         cfg = load_shell_as_ini_config(config_file, return_string)
         return cfg
@@ -285,6 +477,35 @@ def cfg_to_shell_str(cfg, kname=None):
     return shell_str
 
 
+def shell_sections_dir(config_file):
+    """Directory in which the sections of a shell config file are stored
+    by cfg_to_shell_files"""
+
+    return os.path.splitext(config_file)[0] + "_sections"
+
+
+def cfg_to_shell_files(cfg, output_dir):
+    """Write each top-level section of a config to its own shell file in
+    output_dir, plus an index file listing the sections in order. Shell
+    scripts can then source only the sections they need without starting
+    Python (see source_config_for_task in bash_utils/source_config.sh).
+    The index is written last, so its modification time tells when the
+    set of files was complete."""
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write_file(name, contents):
+        # Other jobs may be reading these files, so replace them atomically
+        temp_file = os.path.join(output_dir, f".{name}.{os.getpid()}")
+        with open(temp_file, "w") as file:
+            file.write(contents)
+        os.replace(temp_file, os.path.join(output_dir, name))
+
+    for k, v in cfg.items():
+        write_file(f"{k}.sh", cfg_to_shell_str({k: v}))
+    write_file("index", "".join(f"{k}\n" for k in cfg))
+
+
 ##########
 # INI
 ##########
@@ -565,6 +786,14 @@ def cfg_main():
         help="Include only these keys of dictionary for processing.\
                               Keys can be python regex expression.",
     )
+    parser.add_argument(
+        "--output-dir",
+        "-d",
+        dest="output_dir",
+        required=False,
+        help="Write each section of the dictionary to its own shell file\
+                              in this directory instead of printing it.",
+    )
     parser.add_argument(
         "--validate-cfg",
         "-v",
@@ -597,8 +826,10 @@ def cfg_main():
         if args.flatten:
             cfg = flatten_dict(cfg)
 
-        # convert to string and print
-        if args.out_type in ["shell", "sh"]:
+        # write sections to files, or convert to string and print
+        if args.output_dir:
+            cfg_to_shell_files(cfg, args.output_dir)
+        elif args.out_type in ["shell", "sh"]:
             print(cfg_to_shell_str(cfg), end="")
         elif args.out_type == "ini":
             print(cfg_to_ini_str(cfg), end="")
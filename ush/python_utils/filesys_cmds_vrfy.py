@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
 import os
+import shlex
 from .print_msg import print_err_msg_exit
+from .stage_files import expand_paths, copy_file, link_file
+
+# Characters that need a real shell to interpret; commands that use
+# them are passed to the shell rather than run natively.
+SHELL_SPECIAL_CHARS = set("$`|;&<>(){}~\\")
 
 
 def cmd_vrfy(cmd, *args):
@@ -21,8 +27,89 @@ def cmd_vrfy(cmd, *args):
     return ret
 
 
+def split_cmd_args(*args):
+    """Split the arguments of a cp/ln style command into options and
+    paths the way the shell would, expanding wildcards in Python.
+
+    Args:
+        *args: the arguments, possibly several per string
+    Returns:
+        Tuple of (options, paths), or None if the arguments use shell
+        features that are not emulated
+    """
+
+    arg_str = " ".join([str(a) for a in args])
+    if SHELL_SPECIAL_CHARS & set(arg_str):
+        return None
+    try:
+        tokens = shlex.split(arg_str)
+    except ValueError:
+        return None
+
+    options = [t for t in tokens if t.startswith("-") and len(t) > 1]
+    paths = expand_paths([t for t in tokens if not (t.startswith("-") and len(t) > 1)])
+    return options, paths
+
+
+def _run_native(cmd, args, func):
+    """Run func(options, paths) in place of a cp/ln system call. Fall back
+    to the system call when func does not support the options given (it
+    returns False). Exits with an error message on failure, like
+    cmd_vrfy."""
+
+    split = split_cmd_args(*args)
+    if split is None:
+        return cmd_vrfy(cmd, *args)
+
+    options, paths = split
+    try:
+        if func(options, paths) is False:
+            return cmd_vrfy(cmd, *args)
+    except OSError as err:
+        cmd_str = " ".join([cmd] + [str(a) for a in args])
+        print_err_msg_exit(f"Command '{cmd_str}' failed:\n  {err}")
+    return 0
+
+
+def _cp(options, paths):
+    if any(opt not in ("-f",) for opt in options) or len(paths) < 2:
+        return False
+    *sources, dest = paths
+    if len(sources) > 1 and not os.path.isdir(dest):
+        raise NotADirectoryError(f"Target '{dest}' is not a directory")
+    for src in sources:
+        copy_file(src, dest)
+    return True
+
+
+def _ln(options, paths):
+    flags = set()
+    for opt in options:
+        if opt in ("--relative", "-r"):
+            flags.add("r")
+        elif opt.startswith("--") or set(opt[1:]) - set("sfnr"):
+            return False
+        else:
+            flags.update(opt[1:])
+    # Without -f, ln refuses to replace an existing file
+    if "f" not in flags or len(paths) < 2:
+        return False
+    *targets, link = paths
+    if len(targets) > 1 and not os.path.isdir(link):
+        raise NotADirectoryError(f"Target '{link}' is not a directory")
+    for target in targets:
+        link_file(
+            target,
+            link,
+            symbolic="s" in flags,
+            relative="r" in flags,
+            no_dereference="n" in flags,
+        )
+    return True
+
+
 def cp_vrfy(*args):
-    return cmd_vrfy("cp", *args)
+    return _run_native("cp", args, _cp)
 
 
 def mv_vrfy(*args):
@@ -34,7 +121,7 @@ def rm_vrfy(*args):
 
 
 def ln_vrfy(*args):
-    return cmd_vrfy("ln", *args)
+    return _run_native("ln", args, _ln)
 
 
 def mkdir_vrfy(*args):
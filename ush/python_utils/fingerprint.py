@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+
+from .stage_files import expand_paths
+
+
+def files_fingerprint(paths):
+    """Describe files by path, size and modification time, without
+    reading them. Directories are described by their entries (not
+    recursively), and missing files are described as missing.
+
+    Args:
+        paths: a path/pattern or a list of them
+    Returns:
+        List that changes when any of the files changes
+    """
+
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return [os.fspath(path), None]
+        return [os.fspath(path), st.st_size, st.st_mtime_ns]
+
+    desc = []
+    for path in expand_paths(paths):
+        desc.append(stat(path))
+        if os.path.isdir(path):
+            desc.append(sorted(stat(os.path.join(path, fn)) for fn in os.listdir(path)))
+    return desc
+
+
+class Fingerprints:
+    """Record what each generated file (or set of files) was made from, so
+    that it is only remade when that changes.
+
+    Usage:
+        fingerprints = Fingerprints(path, reuse=True)
+        if fingerprints.changed("namelist", settings, files=[template], outputs=[nml]):
+            ... create nml ...
+            fingerprints.record("namelist")
+
+    Args:
+        path: JSON file in which the fingerprints are stored
+        reuse: if False, changed() always returns True, but fingerprints are
+            still recorded for later runs
+    """
+
+    def __init__(self, path, reuse=True):
+        self.path = path
+        self.reuse = reuse
+        self.stored = {}
+        self.pending = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.stored = json.load(f)
+            except (OSError, ValueError):
+                self.stored = {}
+
+    def changed(self, name, *inputs, files=(), outputs=()):
+        """Check whether the inputs of an artifact changed since it was last
+        recorded, or any of its outputs is missing.
+
+        Args:
+            name: name of the artifact
+            inputs: JSON-serializable values the artifact depends on
+            files: input files/directories, compared by size and mtime
+            outputs: files the artifact consists of
+        Returns:
+            True if the artifact needs to be remade
+        """
+
+        desc = json.dumps(
+            [list(inputs), files_fingerprint(list(files))], sort_keys=True, default=str
+        )
+        self.pending[name] = hashlib.sha256(desc.encode()).hexdigest()
+        if not self.reuse or self.stored.get(name) != self.pending[name]:
+            return True
+        return not all(os.path.lexists(p) for p in outputs)
+
+    def record(self, name):
+        """Store the fingerprint computed by the last call to changed() for
+        an artifact, once it has been remade"""
+
+        self.stored[name] = self.pending.pop(name)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_file = f"{self.path}.{os.getpid()}"
+        with open(temp_file, "w") as f:
+            json.dump(self.stored, f, indent=2, sort_keys=True)
+        os.replace(temp_file, self.path)
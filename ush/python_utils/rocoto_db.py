@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+
+# Columns of the rocoto "jobs" table that job statistics can be grouped by.
+# The table holds one row per task and cycle, describing its last try:
+# (id INTEGER PRIMARY KEY, jobid VARCHAR(64), taskname VARCHAR(64), cycle
+# DATETIME, cores INTEGER, state VARCHAR(64), native_state VARCHAR[64],
+# exit_status INTEGER, tries INTEGER, nunknowns INTEGER, duration REAL)
+JOB_GROUPS = {"task": "taskname", "cycle": "cycle", "tries": "tries", "state": "state"}
+
+JOB_STATS = [
+    "jobs",
+    "core_hours",
+    "wall_time_mins",
+    "mean_duration_secs",
+    "max_duration_secs",
+    "total_tries",
+    "dead",
+]
+
+_JOB_STATS_SQL = """
+    COUNT(*),
+    TOTAL(cores * duration) / 3600.0,
+    TOTAL(duration) / 60.0,
+    AVG(duration),
+    MAX(duration),
+    TOTAL(tries),
+    TOTAL(state = 'DEAD')
+"""
+
+
+def job_stats(db_path, group_by=()):
+    """Compute statistics of the jobs in a rocoto database
+
+    Args:
+        db_path: path to the rocoto database
+        group_by: list of keys of JOB_GROUPS to break the statistics down by
+    Returns:
+        List of dictionaries with the group_by keys and the JOB_STATS of
+        each group. Cycles are given as YYYYMMDDHHmm strings. Without
+        group_by, the list always holds one dictionary, with zero jobs if
+        the database has no jobs (or no jobs table); otherwise it only
+        holds the groups that have jobs.
+    """
+
+    columns = [JOB_GROUPS[key] for key in group_by]
+    query = f"SELECT {', '.join(columns + [_JOB_STATS_SQL])} FROM jobs"
+    if columns:
+        query += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}"
+
+    # read-only, so that rocotorun is not blocked by the query
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    with closing(sqlite3.connect(uri, uri=True)) as con:
+        try:
+            rows = con.execute(query).fetchall()
+        except sqlite3.OperationalError:
+            rows = [] if columns else [(0, 0.0, 0.0, None, None, 0, 0)]
+
+    stats = []
+    for row in rows:
+        group = dict(zip(group_by, row[: len(columns)]))
+        if group.get("cycle") is not None:
+            group["cycle"] = datetime.utcfromtimestamp(group["cycle"]).strftime(
+                "%Y%m%d%H%M"
+            )
+        values = row[len(columns) :]
+        group.update(zip(JOB_STATS, values))
+        group["total_tries"] = int(group["total_tries"])
+        group["dead"] = int(group["dead"])
+        stats.append(group)
+    return stats
+
+
+def experiments_job_stats(db_paths, group_by=(), max_workers=8):
+    """Compute statistics of the jobs of several experiments, reading their
+    rocoto databases concurrently
+
+    Args:
+        db_paths: dictionary of rocoto database paths, keyed by experiment name
+        group_by: list of keys of JOB_GROUPS to break the statistics down by
+        max_workers: number of databases to read at the same time
+    Returns:
+        List of dictionaries with the experiment name, the group_by keys and
+        the JOB_STATS of each group, sorted by experiment name
+    """
+
+    names = sorted(db_paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda name: job_stats(db_paths[name], group_by), names
+        )
+        stats = []
+        for name, expt_stats in zip(names, results):
+            for group in expt_stats:
+                stats.append({"experiment": name, **group})
+    return stats
+
+
+def write_job_stats_csv(stats, csv_file, extra_columns=None):
+    """Write job statistics to a CSV file, one row per group
+
+    Args:
+        stats: list of dictionaries as returned by experiments_job_stats
+        csv_file: path to the CSV file
+        extra_columns: dictionary of columns with the same value in every
+            row, e.g. a release tag or date, so that files can be combined
+    Returns:
+        None
+    """
+
+    extra_columns = extra_columns or {}
+    fieldnames = list(extra_columns)
+    for row in stats:
+        fieldnames += [k for k in row if k not in fieldnames]
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in stats:
+            writer.writerow({**extra_columns, **row})
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import errno
+import glob
+import os
+import shutil
+import tempfile
+
+# Errors from os.copy_file_range meaning it can't be used for this pair
+# of files, in which case we fall back to shutil (sendfile on Linux)
+COPY_FILE_RANGE_UNSUPPORTED = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+    errno.EPERM,
+)
+
+
+def expand_paths(patterns):
+    """Expand shell-style wildcards in a path or list of paths, in Python.
+    Like the shell, a pattern with no matches is kept as-is.
+
+    Args:
+        patterns: a path/pattern or a list of them
+    Returns:
+        List of paths
+    """
+
+    if isinstance(patterns, (str, os.PathLike)):
+        patterns = [patterns]
+
+    paths = []
+    for pattern in patterns:
+        pattern = os.fspath(pattern)
+        if glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def _copy_file_range(src, dst):
+    """Copy the contents of src to dst with os.copy_file_range, which lets
+    the kernel (or file system, e.g. via reflinks) do the copy.
+
+    Returns:
+        False if copy_file_range is not usable for these files
+    """
+
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        copied = 0
+        while True:
+            try:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30)
+            except OSError as err:
+                if copied == 0 and err.errno in COPY_FILE_RANGE_UNSUPPORTED:
+                    return False
+                raise
+            if n == 0:
+                return True
+            copied += n
+
+
+def copy_file(src, dst):
+    """Copy a file like 'cp src dst' does, without starting a process.
+    If dst is a directory, the file is copied into it. The permission bits
+    of src are given to a newly created dst. The copy is written to a
+    temporary file that then replaces dst, so a failed copy never leaves a
+    truncated dst.
+
+    Args:
+        src: source file
+        dst: destination file or directory
+    Returns:
+        Path to the copy
+    Raises:
+        shutil.SameFileError: if src and dst are the same file
+    """
+
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.isdir(src):
+        raise IsADirectoryError(errno.EISDIR, "Source is a directory", src)
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+
+    # Like cp, write through a symbolic link at dst
+    target = os.path.realpath(dst) if os.path.islink(dst) else dst
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(target)),
+        prefix=f".{os.path.basename(target)}.",
+    )
+    os.close(fd)
+    try:
+        if not _copy_file_range(src, tmp):
+            shutil.copyfile(src, tmp)
+        shutil.copymode(target if os.path.exists(target) else src, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return dst
+
+
+def link_file(target, link, symbolic=True, relative=False, no_dereference=False):
+    """Create a link like 'ln -f[s][n] target link' does, without starting a
+    process. An existing file at link is replaced atomically. If link is a
+    directory, the link is created inside it, unless no_dereference is set
+    and link is itself a symbolic link to a directory.
+
+    Args:
+        target: file the link points to
+        link: path of the link, or directory in which to create it
+        symbolic: create a symbolic link instead of a hard link
+        relative: make a symbolic link relative to the link's location
+        no_dereference: treat a link that is a symlink to a directory as
+            a file
+    Returns:
+        Path to the link
+    """
+
+    if os.path.isdir(link) and not (no_dereference and os.path.islink(link)):
+        link = os.path.join(link, os.path.basename(os.path.normpath(target)))
+
+    tmp = f"{link}.tmp.{os.getpid()}"
+    if symbolic:
+        if relative:
+            target_dir = os.path.realpath(os.path.dirname(os.path.abspath(target)))
+            link_dir = os.path.realpath(os.path.dirname(os.path.abspath(link)))
+            target = os.path.relpath(
+                os.path.join(target_dir, os.path.basename(target)), link_dir
+            )
+        os.symlink(target, tmp)
+    else:
+        os.link(target, tmp)
+
+    try:
+        os.replace(tmp, link)
+    except OSError:
+        os.remove(tmp)
+        raise
+    return link
+
+
+def stage_files(sources, destination, method="copy", relative=False):
+    """Copy or link many files into a destination directory in this
+    process, e.g. fix files for an experiment.
+
+    Args:
+        sources: a path, glob pattern, or list of them
+        destination: existing directory to stage the files in
+        method: one of "copy", "symlink" or "hardlink"
+        relative: make symbolic links relative to the destination
+    Returns:
+        List of staged file paths
+    """
+
+    if method not in ("copy", "symlink", "hardlink"):
+        raise ValueError(f"Unknown staging method: {method}")
+
+    staged = []
+    for src in expand_paths(sources):
+        if method == "copy":
+            staged.append(copy_file(src, destination))
+        else:
+            if not os.path.lexists(src):
+                raise FileNotFoundError(errno.ENOENT, "No such file", src)
+            staged.append(
+                link_file(
+                    src,
+                    destination,
+                    symbolic=method == "symlink",
+                    relative=relative,
+                )
+            )
+    return staged
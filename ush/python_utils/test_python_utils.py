@@ -13,7 +13,9 @@ loaded first before executing unit tests.
 
 import unittest
 import glob
+import sqlite3
 import os
+import shutil
 
 from python_utils import *
 
@@ -58,6 +60,90 @@ class Testing(unittest.TestCase):
         cmd_vrfy(f"rm -rf {dPATH}")
         self.assertFalse(os.path.exists("tt.py"))
 
+    def test_stage_files(self):
+        dPATH = f"{self.PATH}/test_data/stage"
+        mkdir_vrfy("-p", dPATH)
+        # native cp with a glob
+        cp_vrfy(f"{self.PATH}/mis*.py", dPATH)
+        self.assertTrue(os.path.exists(f"{dPATH}/misc.py"))
+        # native ln -fsn replaces an existing link
+        ln_vrfy("-fsn", f"{self.PATH}/misc.py", f"{dPATH}/link.py")
+        ln_vrfy("-fsn", f"{self.PATH}/xml_parser.py", f"{dPATH}/link.py")
+        self.assertEqual(os.readlink(f"{dPATH}/link.py"), f"{self.PATH}/xml_parser.py")
+        # copying a file onto itself fails and leaves it intact
+        size = os.path.getsize(f"{dPATH}/misc.py")
+        ln_vrfy("-fs", f"{dPATH}/misc.py", f"{dPATH}/same.py")
+        with self.assertRaises(shutil.SameFileError):
+            copy_file(f"{dPATH}/misc.py", f"{dPATH}/same.py")
+        self.assertEqual(os.path.getsize(f"{dPATH}/misc.py"), size)
+        # batch staging
+        staged = stage_files(
+            [f"{self.PATH}/misc.py", f"{self.PATH}/xml_*.py"],
+            dPATH,
+            method="symlink",
+            relative=True,
+        )
+        self.assertEqual(len(staged), 2)
+        self.assertEqual(os.readlink(f"{dPATH}/misc.py"), "../../misc.py")
+        rm_vrfy(f"-rf {dPATH}")
+
+    def test_fingerprints(self):
+        dPATH = f"{self.PATH}/test_data/fingerprints"
+        mkdir_vrfy("-p", dPATH)
+        FILE = f"{dPATH}/fingerprints.json"
+        fingerprints = Fingerprints(FILE)
+        self.assertTrue(fingerprints.changed("misc", "A", files=[f"{self.PATH}/misc.py"]))
+        fingerprints.record("misc")
+        # unchanged inputs are found in a later run
+        fingerprints = Fingerprints(FILE)
+        self.assertFalse(fingerprints.changed("misc", "A", files=[f"{self.PATH}/misc.py"]))
+        self.assertTrue(fingerprints.changed("misc", "B", files=[f"{self.PATH}/misc.py"]))
+        self.assertTrue(
+            fingerprints.changed("misc", "A", files=[f"{self.PATH}/misc.py"], outputs=[f"{dPATH}/out"])
+        )
+        # not reused
+        fingerprints = Fingerprints(FILE, reuse=False)
+        self.assertTrue(fingerprints.changed("misc", "A", files=[f"{self.PATH}/misc.py"]))
+        rm_vrfy(f"-rf {dPATH}")
+
+    def test_job_stats(self):
+        dPATH = f"{self.PATH}/test_data/rocoto_db"
+        mkdir_vrfy("-p", dPATH)
+        DB = f"{dPATH}/FV3LAM_wflow.db"
+        con = sqlite3.connect(DB)
+        con.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY, taskname VARCHAR(64), "
+            "cycle DATETIME, cores INTEGER, state VARCHAR(64), tries INTEGER, duration REAL)"
+        )
+        con.executemany(
+            "INSERT INTO jobs (taskname, cycle, cores, state, tries, duration) VALUES (?,?,?,?,?,?)",
+            [
+                ("make_grid", 1597017600, 48, "SUCCEEDED", 1, 75.0),
+                ("run_fcst", 1597017600, 96, "SUCCEEDED", 2, 600.0),
+                ("run_fcst", 1597039200, 96, "DEAD", 3, 60.0),
+            ],
+        )
+        con.commit()
+        con.close()
+        stats = job_stats(DB)
+        self.assertEqual(stats[0]["jobs"], 3)
+        self.assertEqual(stats[0]["core_hours"], 18.6)
+        stats = experiments_job_stats({"expt": DB}, group_by=["task"])
+        self.assertEqual([s["task"] for s in stats], ["make_grid", "run_fcst"])
+        self.assertEqual(stats[1]["total_tries"], 5)
+        self.assertEqual(stats[1]["dead"], 1)
+        stats = job_stats(DB, group_by=["cycle"])
+        self.assertEqual(stats[1]["cycle"], "202008100600")
+        # experiments without jobs are still reported when not grouped
+        EMPTY = f"{dPATH}/empty.db"
+        sqlite3.connect(EMPTY).close()
+        stats = experiments_job_stats({"expt": DB, "empty": EMPTY})
+        self.assertEqual([s["experiment"] for s in stats], ["empty", "expt"])
+        self.assertEqual(stats[0]["jobs"], 0)
+        self.assertEqual(stats[0]["core_hours"], 0.0)
+        self.assertEqual(job_stats(EMPTY, group_by=["task"]), [])
+        rm_vrfy(f"-rf {dPATH}")
+
     def test_run_command(self):
         self.assertEqual(run_command("echo hello"), (0, "hello", ""))
 
@@ -106,12 +192,53 @@ class Testing(unittest.TestCase):
         cfg = {"HRS": ["1", "2"]}
         shell_str = cfg_to_shell_str(cfg)
         self.assertIn('HRS=( "1" "2" )\n', shell_str)
+        # shell file per section
+        cfg = {"workflow": {"EXPTDIR": "/path"}, "task_run_fcst": {"HRS": ["1", "2"]}}
+        dPATH = f"{self.PATH}/test_data/var_defns_sections"
+        cfg_to_shell_files(cfg, dPATH)
+        with open(f"{dPATH}/index") as f:
+            self.assertEqual(f.read(), "workflow\ntask_run_fcst\n")
+        with open(f"{dPATH}/task_run_fcst.sh") as f:
+            self.assertEqual(f.read(), cfg_to_shell_str({"task_run_fcst": cfg["task_run_fcst"]}))
+        self.assertEqual(shell_sections_dir(f"{self.PATH}/test_data/var_defns.sh"), dPATH)
+        rm_vrfy(f"-rf {dPATH}")
+        # load shell file written by cfg_to_shell_str
+        cfg["task_run_fcst"]["HRS"] = [str(i) for i in range(8)]
+        FILE = f"{self.PATH}/test_data/var_defns_load.sh"
+        with open(FILE, "w") as f:
+            f.write(cfg_to_shell_str(cfg))
+        cfg_loaded = load_shell_config(FILE)
+        self.assertEqual(cfg_loaded["task_run_fcst"]["HRS"], list(range(8)))
+        self.assertEqual(cfg_loaded["workflow"], {"EXPTDIR": "/path"})
+        # reloaded once the file changes
+        cfg_loaded["workflow"]["EXPTDIR"] = "/changed"
+        self.assertEqual(load_shell_config(FILE)["workflow"], {"EXPTDIR": "/path"})
+        with open(FILE, "a") as f:
+            f.write("# [task_run_post]\nSUB_HOURLY_POST='FALSE'\n")
+        self.assertFalse(load_shell_config(FILE)["task_run_post"]["SUB_HOURLY_POST"])
+        rm_vrfy(FILE)
         # ini file
         cfg = load_ini_config(f"{self.PATH}/test_data/Externals.cfg")
         self.assertIn(
             "regional_workflow", get_ini_value(cfg, "regional_workflow", "repo_url")
         )
 
+    def test_extend_yaml(self):
+        cfg = {
+            "user": {"HOMEdir": "/home", "PARMdir": '{{ [HOMEdir, "parm"]|path_join }}'},
+            "workflow": {
+                # refers to a template defined after it
+                "FV3_NML_FP": "{{ [EXPTDIR, 'input.nml']|path_join }}",
+                "EXPTDIR": "{{ [user.HOMEdir, 'expt'] | path_join }}",
+                "LOG": "{{ user.PARMdir }}/log {{ cdate }}",
+            },
+        }
+        extend_yaml(cfg)
+        self.assertEqual(cfg["user"]["PARMdir"], "/home/parm")
+        self.assertEqual(cfg["workflow"]["FV3_NML_FP"], "/home/expt/input.nml")
+        # cycle-dependent templates are left for later
+        self.assertEqual(cfg["workflow"]["LOG"], "/home/parm/log {{ cdate }}")
+
     def test_print_msg(self):
         self.assertEqual(print_info_msg("Hello World!", verbose=False), False)
 
@@ -27,29 +27,341 @@ Also see the parse_args function below.
 
 import argparse
 import datetime as dt
+import errno
+import fcntl
+import hashlib
+import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
 import glob
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from textwrap import dedent
 import time
-from copy import deepcopy
+from copy import copy, deepcopy
+from urllib.parse import urlparse
+import urllib.request
 
 import yaml
 
 
-def clean_up_output_dir(expected_subdir, local_archive, output_path, source_paths):
+def file_checksum(path):
+
+    """Return the sha256 checksum of the file at path as a hex string."""
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as data:
+        for chunk in iter(lambda: data.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class RetrievalManifest:
+
+    """
+    A record of every file retrieved into each output directory.
+
+    For each output directory, a JSON manifest named file_name is kept
+    next to the summary file. It maps each retrieved file name to its
+    source, destination, size, sha256 checksum, start time, elapsed
+    time and transfer rate. Files retrieved by one HPSS extraction share
+    that extraction's timing.
+
+    The manifest is rewritten after every recorded file, so a task that
+    fails part way through can be rerun and will skip every file that is
+    still on disk and matches its recorded size and checksum.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._manifests = {}
+
+    def _entries(self, output_dir):
+        """Return the entries for output_dir, loading them on first use.
+        Must be called with the lock held."""
+
+        if output_dir not in self._manifests:
+            entries = {}
+            path = os.path.join(output_dir, self.file_name)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as manifest_file:
+                        entries = json.load(manifest_file).get("files", {})
+                except (OSError, ValueError):
+                    logging.warning(f"Ignoring unreadable manifest {path}")
+            self._manifests[output_dir] = entries
+        return self._manifests[output_dir]
+
+    def verified(self, source, output_dir, file_name):
+        """Return True if file_name was previously retrieved from source
+        into output_dir and is still there intact."""
+
+        with self._lock:
+            entry = self._entries(output_dir).get(file_name)
+        if entry is None or entry.get("source") != source:
+            return False
+
+        destination = os.path.join(output_dir, file_name)
+        try:
+            if os.path.getsize(destination) != entry["size"]:
+                return False
+        except OSError:
+            return False
+        if file_checksum(destination) != entry["sha256"]:
+            logging.info(f"Checksum mismatch for {destination}")
+            return False
+
+        logging.info(f"Already retrieved and verified: {destination}")
+        return True
+
+    def record(self, source, output_dir, file_name, started, elapsed, nbytes=None):
+        """Add a retrieved file to the manifest of output_dir and save it.
+        nbytes is the total size of the transfer the file was part of,
+        used for the transfer rate; it defaults to the file's size."""
+
+        destination = os.path.join(output_dir, file_name)
+        if not os.path.isfile(destination):
+            return
+        size = os.path.getsize(destination)
+        nbytes = size if nbytes is None else nbytes
+        entry = {
+            "source": source,
+            "destination": destination,
+            "size": size,
+            "sha256": file_checksum(destination),
+            "started": dt.datetime.fromtimestamp(started, dt.timezone.utc).isoformat(),
+            "elapsed_s": round(elapsed, 3),
+            "bytes_per_s": round(nbytes / elapsed) if elapsed > 0 else None,
+        }
+
+        with self._lock:
+            entries = self._entries(output_dir)
+            entries[file_name] = entry
+            path = os.path.join(output_dir, self.file_name)
+            tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w") as manifest_file:
+                json.dump({"files": entries}, manifest_file, indent=2)
+            os.replace(tmp, path)
+
+
+class DataCache:
+
+    """
+    A content-addressed on-disk cache of retrieved files that can be
+    shared by many experiments and concurrent tasks.
+
+    Files are stored once under objects/, named by the sha256 checksum
+    of their contents, and made read-only. The index/ directory maps a
+    source key (a url with its remote size and ETag, a disk path with its
+    size and modification time, or an HPSS archive and member path) to
+    the object holding that source's contents. Files are placed in the
+    output location as hard links to the cached object, or copied when
+    the cache is on another file system, so files placed from the cache
+    are read-only and share their inode with the cached object. Newly
+    retrieved files are copied into the cache, so they stay writable.
+
+    Every write goes to a temporary file first and is then renamed into
+    place, so concurrent readers and writers never see partial files.
+    Least recently used objects are evicted once the cache grows past
+    max_size bytes.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_dir = os.path.join(cache_dir, "index")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    @staticmethod
+    def disk_key(source):
+        """Return the key for a file on disk, which changes whenever the
+        file itself does."""
+        stat = os.stat(source)
+        return f"{os.path.realpath(source)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    @staticmethod
+    def url_key(url, timeout=30):
+        """Return the key for a file to download, which includes its size
+        and ETag as reported by the server, or None if the server does
+        not report either."""
+        request = urllib.request.Request(url, method="HEAD")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                etag = response.headers.get("ETag", "")
+                size = response.headers.get("Content-Length", "")
+        except (OSError, ValueError) as err:
+            logging.debug(f"Could not get size or ETag of {url}: {err}")
+            return None
+        if not etag and not size:
+            return None
+        return f"{url}:{size}:{etag}"
+
+    @staticmethod
+    def _touch(path):
+        """Mark an object as recently used for LRU eviction. Objects of a
+        cache shared by several users may not be ours to touch, which
+        only makes them look older."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            raise
+        except OSError as err:
+            logging.debug(f"Could not update the access time of {path}: {err}")
+
+    @staticmethod
+    def _tmp_name(path):
+        return f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+
+    def _index_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, f"{digest}.json")
+
+    def _object_path(self, checksum):
+        return os.path.join(self.objects_dir, checksum[:2], checksum)
+
+    @staticmethod
+    def _place(source, destination):
+        """Atomically put source at destination, preferring a hard link."""
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            return
+        tmp = DataCache._tmp_name(destination)
+        try:
+            os.link(source, tmp)
+        except OSError as err:
+            if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+
+    def fetch(self, key, target_dir, file_name):
+        """Place the cached copy of key in target_dir/file_name. Return
+        True on a cache hit, False otherwise."""
+
+        index_path = self._index_path(key)
+        try:
+            with open(index_path, "r") as index_file:
+                entry = json.load(index_file)
+        except (OSError, ValueError):
+            return False
+
+        object_path = self._object_path(entry["checksum"])
+        try:
+            if os.path.getsize(object_path) != entry["size"]:
+                raise FileNotFoundError(object_path)
+            self._touch(object_path)
+            self._place(object_path, os.path.join(target_dir, file_name))
+        except FileNotFoundError:
+            # The object was evicted since the index entry was written
+            logging.debug(f"Stale cache entry for {key}")
+            return False
+
+        logging.info(f"Using cached copy of {key}")
+        return True
+
+    def store(self, key, path):
+        """Add the file at path to the cache as the contents of key."""
+
+        if not os.path.isfile(path):
+            return
+
+        checksum = file_checksum(path)
+        size = os.path.getsize(path)
+
+        object_path = self._object_path(checksum)
+        if os.path.exists(object_path):
+            self._touch(object_path)
+        else:
+            # Copy rather than link, so that making the object read-only
+            # does not make the retrieved file read-only as well
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp = self._tmp_name(object_path)
+            try:
+                shutil.copyfile(path, tmp)
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, object_path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+        index_path = self._index_path(key)
+        tmp = self._tmp_name(index_path)
+        with open(tmp, "w") as index_file:
+            json.dump({"key": key, "checksum": checksum, "size": size}, index_file)
+        os.replace(tmp, index_path)
+        logging.debug(f"Cached {key} as {checksum}")
+
+    def evict(self):
+        """Remove least recently used objects until the cache fits in
+        max_size, along with any index entries left without an object."""
+
+        with open(os.path.join(self.cache_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            objects = []
+            for root, _, files in os.walk(self.objects_dir):
+                for name in files:
+                    if ".tmp." in name:
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    objects.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in objects)
+            for _, size, name in sorted(objects):
+                if total <= self.max_size:
+                    break
+                logging.info(f"Evicting {name} from cache")
+                try:
+                    os.remove(self._object_path(name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+            for name in os.listdir(self.index_dir):
+                index_path = os.path.join(self.index_dir, name)
+                try:
+                    with open(index_path, "r") as index_file:
+                        checksum = json.load(index_file)["checksum"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                if not os.path.exists(self._object_path(checksum)):
+                    try:
+                        os.remove(index_path)
+                    except FileNotFoundError:
+                        pass
+
+
+def clean_up_output_dir(
+    expected_subdir, local_archive, output_path, source_paths, staging_dir=None
+):
 
     """Remove expected sub-directories and existing_archive files on
     disk once all files have been extracted and put into the specified
-    output location."""
+    output location.
+
+    Extracted files and archives are looked for relative to
+    staging_dir, which defaults to the current working directory."""
+
+    staging_dir = os.path.normpath(
+        staging_dir if staging_dir is not None else os.getcwd()
+    )
+    local_archive = os.path.join(staging_dir, local_archive)
 
     unavailable = {}
     # Check to make sure the files exist on disk
     for file_path in source_paths:
-        local_file_path = os.path.join(os.getcwd(), file_path.lstrip("/"))
+        local_file_path = os.path.join(staging_dir, file_path.lstrip("/"))
         if not os.path.exists(local_file_path):
             logging.info(f"File does not exist: {local_file_path}")
             unavailable["hpss"] = source_paths
@@ -61,9 +373,10 @@ def clean_up_output_dir(expected_subdir, local_archive, output_path, source_path
                 shutil.move(local_file_path, expected_output_loc)
 
     # Clean up directories from inside archive, if they exist
-    if os.path.exists(expected_subdir) and expected_subdir != "./":
+    subdir = os.path.normpath(os.path.join(staging_dir, expected_subdir))
+    if os.path.exists(subdir) and subdir != staging_dir:
         logging.info(f"Removing {expected_subdir}")
-        os.removedirs(expected_subdir)
+        remove_empty_dirs(expected_subdir, staging_dir)
 
     # If an archive exists on disk, remove it
     if os.path.exists(local_archive):
@@ -72,11 +385,30 @@ def clean_up_output_dir(expected_subdir, local_archive, output_path, source_path
     return unavailable
 
 
-def copy_file(source, destination, copy_cmd):
+def remove_empty_dirs(subdir, top):
+
+    """Remove the directory subdir, given relative to top, and then each
+    of its parents that is left empty, like os.removedirs does for a
+    relative path. Never removes top itself or anything above it."""
+
+    top = os.path.normpath(top)
+    path = os.path.normpath(os.path.join(top, subdir))
+    os.rmdir(path)
+    path = os.path.dirname(path)
+    while path.startswith(top + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        path = os.path.dirname(path)
+
+
+def copy_file(source, destination, symlink=False):
 
     """
-    Copy a file from a source and place it in the destination location.
-    Return a boolean value reflecting the state of the copy.
+    Copy a file from a source and place it in the destination location,
+    or symlink it there when symlink is True. Return a boolean value
+    reflecting the state of the copy.
 
     Assumes destination exists.
     """
@@ -85,23 +417,92 @@ def copy_file(source, destination, copy_cmd):
         logging.info(f"File does not exist on disk \n {source} \n try using: --input_file_path <your_path>")
         return False
 
-    # Using subprocess here because system copy is much faster than
-    # python copy options.
-    cmd = f"{copy_cmd} {source} {destination}"
-    logging.info(f"Running command: \n {cmd}")
+    # Done in this process rather than with cp/ln; shutil.copyfile uses
+    # the kernel's sendfile on Linux, which is as fast as cp.
+    target = os.path.join(destination, os.path.basename(source))
+    if symlink:
+        logging.info(f"Linking {source} to {target}")
+    else:
+        logging.info(f"Copying {source} to {target}")
+    tmp = f"{target}.tmp.{os.getpid()}.{threading.get_ident()}"
     try:
-        subprocess.run(
-            cmd,
-            check=True,
-            shell=True,
-        )
-    except subprocess.CalledProcessError as err:
+        if symlink:
+            os.symlink(source, tmp)
+        else:
+            shutil.copyfile(source, tmp)
+            shutil.copymode(source, tmp)
+        os.replace(tmp, target)
+    except OSError as err:
         logging.info(err)
+        if os.path.lexists(tmp):
+            os.remove(tmp)
         return False
     return True
 
 
-def download_file(url):
+class HostThrottle:
+
+    """
+    Coordinate downloads that share a remote host.
+
+    Limits the number of simultaneous transfers from any one host and
+    spaces out requests to a host that has recently reported network
+    errors. The delay before the next request to a host doubles with
+    every failed attempt and is halved with every successful one, so a
+    healthy host is not slowed down at all.
+    """
+
+    def __init__(self, max_per_host=4, max_delay=120.0):
+        self.max_per_host = max(1, max_per_host)
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._delays = {}
+        self._next_start = {}
+
+    @staticmethod
+    def host(url):
+        """Return the host portion of a url."""
+        return urlparse(url).netloc
+
+    @contextmanager
+    def slot(self, url):
+        """Context manager that holds one transfer slot for the url's
+        host, waiting out any backoff period first."""
+
+        host = self.host(url)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(
+                host, threading.BoundedSemaphore(self.max_per_host)
+            )
+        with semaphore:
+            with self._lock:
+                wait = self._next_start.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                logging.debug(f"Backing off {host} for {wait:.1f} s")
+                time.sleep(wait)
+            yield
+
+    def record(self, url, success):
+        """Update the backoff delay for the url's host after an attempt."""
+
+        host = self.host(url)
+        with self._lock:
+            delay = self._delays.get(host, 0.0)
+            if success:
+                delay = delay / 2 if delay > 1.0 else 0.0
+            else:
+                delay = min(self.max_delay, max(1.0, delay * 2))
+            self._delays[host] = delay
+            self._next_start[host] = time.monotonic() + delay
+
+
+# wget exit statuses that indicate a transient problem talking to the
+# server, as opposed to a file that does not exist there (8).
+WGET_TRANSIENT_ERRORS = (4, 7)
+
+
+def download_file(url, output_dir=None, throttle=None, retries=3):
 
     """
     Download a file from a url source, and place it in a target location
@@ -109,31 +510,52 @@ def download_file(url):
 
     Arguments:
       url          url to file to be downloaded
+      output_dir   directory in which to place the file. Defaults to the
+                   current working directory.
+      throttle     a HostThrottle shared by all downloads in this run
+      retries      number of attempts to make when the host reports a
+                   transient network error
 
     Return:
       boolean value reflecting state of download.
     """
 
+    throttle = throttle if throttle is not None else HostThrottle(max_per_host=1)
+
     # wget flags:
     # -c continue previous attempt
     # -T timeout seconds
     # -t number of tries
+    # -P directory prefix for the downloaded file
     cmd = f"wget -q -c -T 30 -t 3 {url}"
-    logging.info(f"Running command: \n {cmd}")
-    try:
-        subprocess.run(
-            cmd,
-            check=True,
-            shell=True,
-        )
-    except subprocess.CalledProcessError as err:
-        logging.info(err)
-        return False
-    except:
-        logging.error("Command failed!")
-        raise
+    if output_dir is not None:
+        cmd = f"wget -q -c -T 30 -t 3 -P {output_dir} {url}"
 
-    return True
+    for attempt in range(1, retries + 1):
+        with throttle.slot(url):
+            logging.info(f"Running command: \n {cmd}")
+            try:
+                subprocess.run(
+                    cmd,
+                    check=True,
+                    shell=True,
+                )
+            except subprocess.CalledProcessError as err:
+                logging.info(err)
+                transient = err.returncode in WGET_TRANSIENT_ERRORS
+                throttle.record(url, success=not transient)
+                if transient and attempt < retries:
+                    logging.info(f"Retrying {url} (attempt {attempt + 1} of {retries})")
+                    continue
+                return False
+            except:
+                logging.error("Command failed!")
+                raise
+
+        throttle.record(url, success=True)
+        return True
+
+    return False
 
 
 def arg_list_to_range(args):
@@ -237,12 +659,37 @@ def create_target_path(target_path):
     return target_path
 
 
-def find_archive_files(paths, file_names, cycle_date, ens_group):
+def archive_candidates(paths, file_names, cycle_dates, ens_groups):
+
+    """Given an equal-length set of archive paths and archive file names,
+    return the list of every archive file path they describe for each of
+    the cycle dates and ensemble groups provided."""
+
+    candidates = []
+    for cycle_date in cycle_dates:
+        for ens_group in ens_groups:
+            for archive_path, archive_file_names in zip(paths, file_names):
+                if not isinstance(archive_file_names, list):
+                    archive_file_names = [archive_file_names]
+                for archive_file_name in archive_file_names:
+                    file_path = os.path.join(archive_path, archive_file_name)
+                    file_path = fill_template(
+                        file_path, cycle_date, ens_group=ens_group
+                    )
+                    if file_path not in candidates:
+                        candidates.append(file_path)
+    return candidates
+
+
+def find_archive_files(paths, file_names, cycle_date, ens_group, archive_index=None):
 
     """Given an equal-length set of archive paths and archive file
     names, and a cycle date, check HPSS via hsi to make sure at least
     one set exists. Return a dict of the paths of the existing archive, along with
-    the item in set of paths that was found."""
+    the item in set of paths that was found.
+
+    When an HpssArchiveIndex is provided, existence is looked up in the
+    index instead of calling hsi once per archive file."""
 
     zipped_archive_file_paths = zip(paths, file_names)
 
@@ -260,7 +707,10 @@ def find_archive_files(paths, file_names, cycle_date, ens_group):
             # set exists at this date.
             file_path = os.path.join(archive_path, archive_file_name)
             file_path = fill_template(file_path, cycle_date, ens_group=ens_group)
-            file_path = hsi_single_file(file_path)
+            if archive_index is not None:
+                file_path = file_path if archive_index.exists(file_path) else ""
+            else:
+                file_path = hsi_single_file(file_path)
 
             if file_path:
                 existing_archives[n_fp] = file_path
@@ -326,6 +776,10 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     This function expects that the output directory exists and is
     writeable.
 
+    When cla.max_workers is greater than one, the files for each
+    ensemble member and forecast hour are retrieved concurrently by a
+    pool of that many workers.
+
     Arguments:
 
     cla            Namespace object containing command line arguments
@@ -339,6 +793,10 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     members        a list integers corresponding to the ensemble members
     check_all      boolean flag that indicates all urls should be
                    checked for all files
+    cache          a DataCache to consult before retrieving each file,
+                   and to populate afterward
+    manifest       a RetrievalManifest recording each retrieved file;
+                   files it has already verified are not retrieved again
 
     Returns:
     unavailable  a list of locations/files that were unretrievable
@@ -348,6 +806,8 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     members = cla.members if isinstance(cla.members, list) else [members]
 
     check_all = kwargs.get("check_all", False)
+    cache = kwargs.get("cache")
+    manifest = kwargs.get("manifest")
 
     logging.info(f"Getting files named like {file_templates}")
 
@@ -359,71 +819,225 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
 
     input_locs = input_locs if isinstance(input_locs, list) else [input_locs]
 
-    orig_path = os.getcwd()
-    unavailable = []
-
     locs_files = pair_locs_with_files(input_locs, file_templates, check_all)
+
+    max_workers = max(1, cla.max_workers)
+    throttle = HostThrottle(max_per_host=min(max_workers, cla.max_per_host))
+
+    requests = []
     for mem in members:
         target_path = fill_template(cla.output_path, cla.cycle_date, mem=mem)
         target_path = create_target_path(target_path)
-
         logging.info(f"Retrieved files will be placed here: \n {target_path}")
-        os.chdir(target_path)
-
-        for fcst_hr in cla.fcst_hrs:
-            logging.debug(f"Looking for fhr = {fcst_hr}")
-            for loc, templates in locs_files:
-
-                templates = templates if isinstance(templates, list) else [templates]
-
-                logging.debug(f"Looking for files like {templates}")
-                logging.debug(f"They should be here: {loc}")
-
-                template_loc = loc
-                for tmpl_num, template in enumerate(templates):
-                    if isinstance(loc, list) and len(loc) == len(templates):
-                        template_loc = loc[tmpl_num]
-                    input_loc = os.path.join(template_loc, template)
-                    input_loc = fill_template(
-                        input_loc,
-                        cla.cycle_date,
-                        fcst_hr=fcst_hr,
-                        mem=mem,
-                    )
-                    logging.debug(f"Full file path: {input_loc}")
-
-                    if method == "disk":
-                        if cla.symlink:
-                            retrieved = copy_file(input_loc, target_path, "ln -sf")
-                        else:
-                            retrieved = copy_file(input_loc, target_path, "cp")
-
-                    if method == "download":
-                        retrieved = download_file(input_loc)
-                        # Wait a bit before trying the next download.
-                        # Seems to reduce the occurrence of timeouts
-                        # when downloading from AWS
-                        time.sleep(15)
-
-                    logging.debug(f"Retrieved status: {retrieved}")
-                    if not retrieved:
-                        unavailable.append(input_loc)
-                        # Go on to the next location if the first file
-                        # isn't found here.
-                        break
-
-                    # If retrieved, reset unavailable
-                    unavailable = []
-                if not unavailable:
-                    # Start on the next fcst hour if all files were
-                    # found from a loc/template combo
-                    break
+        requests.extend([(mem, fcst_hr, target_path) for fcst_hr in cla.fcst_hrs])
+
+    def retrieve(request):
+        mem, fcst_hr, target_path = request
+        return retrieve_fcst_hr_files(
+            cla,
+            locs_files,
+            mem,
+            fcst_hr,
+            target_path,
+            method,
+            throttle,
+            cache=cache,
+            manifest=manifest,
+        )
+
+    if max_workers > 1:
+        logging.info(f"Retrieving files with {max_workers} workers")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(retrieve, requests))
+    else:
+        results = [retrieve(request) for request in requests]
 
-    os.chdir(orig_path)
+    unavailable = []
+    for result in results:
+        unavailable.extend(result)
     return unavailable
 
 
-def hsi_single_file(file_path, mode="ls"):
+def retrieve_fcst_hr_files(
+    cla,
+    locs_files,
+    mem,
+    fcst_hr,
+    target_path,
+    method,
+    throttle,
+    cache=None,
+    manifest=None,
+):
+
+    """Retrieve all the files for a single ensemble member and forecast
+    hour, trying each location/template combination in priority order
+    until one of them provides every file.
+
+    Arguments:
+
+    cla            Namespace object containing command line arguments
+    locs_files     list of (location, templates) pairs from
+                   pair_locs_with_files
+    mem            ensemble member
+    fcst_hr        forecast hour
+    target_path    directory in which to place the retrieved files
+    method         Choice of disk or download to indicate protocol for
+                   retrieval
+    throttle       HostThrottle shared by all downloads in this run
+    cache          optional DataCache shared by all retrievals
+    manifest       optional RetrievalManifest shared by all retrievals
+
+    Returns:
+    unavailable  a list of locations/files that were unretrievable
+    """
+
+    logging.debug(f"Looking for fhr = {fcst_hr}")
+    unavailable = []
+    for loc, templates in locs_files:
+
+        templates = templates if isinstance(templates, list) else [templates]
+
+        logging.debug(f"Looking for files like {templates}")
+        logging.debug(f"They should be here: {loc}")
+
+        template_loc = loc
+        for tmpl_num, template in enumerate(templates):
+            if isinstance(loc, list) and len(loc) == len(templates):
+                template_loc = loc[tmpl_num]
+            input_loc = os.path.join(template_loc, template)
+            input_loc = fill_template(
+                input_loc,
+                cla.cycle_date,
+                fcst_hr=fcst_hr,
+                mem=mem,
+            )
+            logging.debug(f"Full file path: {input_loc}")
+
+            # Symlinked disk files are never cached or recorded; they
+            # are not copies.
+            source_key = None
+            if method == "download":
+                source_key = input_loc
+            elif not cla.symlink and os.path.isfile(input_loc):
+                source_key = DataCache.disk_key(input_loc)
+            cache_key = source_key if cache is not None else None
+            if cache_key and method == "download":
+                cache_key = DataCache.url_key(input_loc)
+            file_name = os.path.basename(input_loc)
+            started = time.time()
+
+            if (
+                manifest is not None
+                and source_key
+                and manifest.verified(source_key, target_path, file_name)
+            ):
+                retrieved = True
+                source_key = None
+
+            elif cache_key and cache.fetch(cache_key, target_path, file_name):
+                retrieved = True
+                source_key = cache_key = None
+
+            elif method == "disk":
+                retrieved = copy_file(input_loc, target_path, symlink=cla.symlink)
+
+            elif method == "download":
+                retrieved = download_file(
+                    input_loc, output_dir=target_path, throttle=throttle
+                )
+
+            if retrieved and cache_key:
+                cache.store(cache_key, os.path.join(target_path, file_name))
+
+            if retrieved and source_key and manifest is not None:
+                manifest.record(
+                    source_key, target_path, file_name, started, time.time() - started
+                )
+
+            logging.debug(f"Retrieved status: {retrieved}")
+            if not retrieved:
+                unavailable.append(input_loc)
+                # Go on to the next location if the first file
+                # isn't found here.
+                break
+
+            # If retrieved, reset unavailable
+            unavailable = []
+        if not unavailable:
+            # Start on the next fcst hour if all files were
+            # found from a loc/template combo
+            break
+
+    return unavailable
+
+
+class HpssArchiveIndex:
+
+    """
+    An in-memory index of which archive files exist on HPSS.
+
+    Paths are probed in batches with a single "hsi ls -P" call, and the
+    result for each path is remembered for the rest of the run so that
+    no path is ever listed twice.
+    """
+
+    def __init__(self):
+        self._probed = set()
+        self._existing = set()
+
+    def probe(self, file_paths):
+        """List every file path not yet probed in one hsi call and record
+        which of them exist."""
+
+        new_paths = [path for path in file_paths if path not in self._probed]
+        if not new_paths:
+            return
+
+        cmd = f'hsi -q ls -P {" ".join(new_paths)}'
+        logging.info(f"Running command \n {cmd}")
+
+        # hsi writes listings to stderr and exits with a non-zero status
+        # when any one of the paths is missing, so don't check the return
+        # code; just parse the listing. Each existing file is reported on
+        # a line like: FILE <path> <size> ...
+        result = subprocess.run(
+            cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        listed = set()
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) > 1 and fields[0] == "FILE":
+                listed.add(fields[1])
+
+        # A failure with nothing listed is a failure of hsi itself (e.g. of
+        # the authentication, or HPSS being down) rather than missing files;
+        # leave the paths unprobed so that they are tried again
+        if result.returncode != 0 and not listed:
+            logging.error(
+                f"hsi failed with exit status {result.returncode}:\n{result.stdout}"
+            )
+            return
+
+        for path in new_paths:
+            self._probed.add(path)
+            if path in listed:
+                self._existing.add(path)
+            else:
+                logging.warning(f"{path} is not available!")
+
+    def exists(self, file_path):
+        """Return whether file_path exists on HPSS, probing it if needed."""
+
+        self.probe([file_path])
+        return file_path in self._existing
+
+
+def hsi_single_file(file_path, mode="ls", cwd=None):
 
     """Call hsi as a subprocess for Python and return information about
     whether the file_path was found.
@@ -432,6 +1046,8 @@ def hsi_single_file(file_path, mode="ls"):
         file_path    path on HPSS
         mode         the hsi command to run. ls is default. may also
                      pass "get" to retrieve the file path
+        cwd          directory in which to run hsi. Defaults to the
+                     current working directory.
 
     """
     cmd = f"hsi {mode} {file_path}"
@@ -442,6 +1058,7 @@ def hsi_single_file(file_path, mode="ls"):
             cmd,
             check=True,
             shell=True,
+            cwd=cwd,
         )
     except subprocess.CalledProcessError:
         logging.warning(f"{file_path} is not available!")
@@ -450,23 +1067,21 @@ def hsi_single_file(file_path, mode="ls"):
     return file_path
 
 
-def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1):
+def already_retrieved(source, output_dir, file_name, cache=None, manifest=None):
 
-    # pylint: disable=too-many-locals
+    """Return True if the file from source is already in place in
+    output_dir, either because the manifest verifies a previous
+    retrieval or because it could be linked from the cache."""
 
-    """This function interacts with the "hpss" protocol in a provided
-    data store specs file to download a set of files requested by the
-    user. Depending on the type of archive file (zip or tar), it will
-    either pull the entire file and unzip it, or attempt to pull
-    individual files from a tar file.
+    if manifest is not None and manifest.verified(source, output_dir, file_name):
+        return True
+    return cache is not None and cache.fetch(source, output_dir, file_name)
 
-    It cleans up local disk after files are deemed available to remove
-    any empty subdirectories that may still be present.
 
-    This function exepcts that the output directory exists and is
-    writable.
-    """
-    members = [-1] if members == -1 else members
+def get_archive_names(cla, store_specs):
+
+    """Return the list of candidate archive paths and the matching list
+    of archive file names for the requested file type and set."""
 
     archive_paths = store_specs["archive_path"]
     archive_paths = (
@@ -481,6 +1096,49 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
     if isinstance(archive_file_names, dict):
         archive_file_names = archive_file_names[cla.file_set]
 
+    return archive_paths, archive_file_names
+
+
+def hpss_requested_files(
+    cla,
+    file_names,
+    store_specs,
+    members=-1,
+    ens_group=-1,
+    cache=None,
+    archive_index=None,
+    staging_dir=None,
+    manifest=None,
+):
+
+    # pylint: disable=too-many-locals
+
+    """This function interacts with the "hpss" protocol in a provided
+    data store specs file to download a set of files requested by the
+    user. Depending on the type of archive file (zip or tar), it will
+    either pull the entire file and unzip it, or attempt to pull
+    individual files from a tar file.
+
+    It cleans up local disk after files are deemed available to remove
+    any empty subdirectories that may still be present.
+
+    This function exepcts that the output directory exists and is
+    writable.
+
+    When a DataCache is provided, files previously extracted from the
+    same archive are taken from the cache, and only the remaining files
+    are pulled from HPSS. Likewise, files a RetrievalManifest shows are
+    already in place and intact are not extracted again.
+
+    Archives are fetched and extracted in staging_dir, which defaults to
+    the current working directory. Give each concurrent caller its own
+    staging_dir so their extracted files do not collide.
+    """
+    members = [-1] if members == -1 else members
+    staging_dir = staging_dir if staging_dir is not None else os.getcwd()
+
+    archive_paths, archive_file_names = get_archive_names(cla, store_specs)
+
     unavailable = {}
     existing_archives = {}
 
@@ -493,6 +1151,7 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
         archive_file_names,
         cla.cycle_date,
         ens_group=ens_group,
+        archive_index=archive_index,
     )
 
     logging.debug(f"Found existing archives: {existing_archives}")
@@ -550,22 +1209,55 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
             expected = set(source_paths)
             unavailable = {}
             for existing_archive in existing_archives.values():
+                needed_paths = source_paths
+                if cache is not None or manifest is not None:
+                    needed_paths = [
+                        path
+                        for path in source_paths
+                        if not already_retrieved(
+                            f"{existing_archive}:{path}",
+                            output_path,
+                            os.path.basename(path),
+                            cache,
+                            manifest,
+                        )
+                    ]
+                    if not needed_paths:
+                        unavailable[existing_archive] = set()
+                        continue
+                archive_key = existing_archive
+                started = time.time()
+
                 if store_specs.get("archive_format", "tar") == "zip":
 
                     # Get the entire file from HPSS
-                    existing_archive = hsi_single_file(existing_archive, mode="get")
+                    existing_archive = hsi_single_file(
+                        existing_archive, mode="get", cwd=staging_dir
+                    )
 
                     # Grab only the necessary files from the archive
-                    cmd = f'unzip -o {os.path.basename(existing_archive)} {" ".join(source_paths)}'
+                    cmd = f'unzip -o {os.path.basename(existing_archive)} {" ".join(needed_paths)}'
 
                 else:
-                    cmd = f'htar -xvf {existing_archive} {" ".join(source_paths)}'
+                    cmd = f'htar -xvf {existing_archive} {" ".join(needed_paths)}'
 
                 logging.info(f"Running command \n {cmd}")
                 subprocess.run(
                     cmd,
                     check=True,
                     shell=True,
+                    cwd=staging_dir,
+                )
+
+                elapsed = time.time() - started
+                extracted_paths = [
+                    path
+                    for path in needed_paths
+                    if os.path.exists(os.path.join(staging_dir, path.lstrip("/")))
+                ]
+                nbytes = sum(
+                    os.path.getsize(os.path.join(staging_dir, path.lstrip("/")))
+                    for path in extracted_paths
                 )
 
                 # Check that files exist and Remove any data transfer artifacts.
@@ -576,10 +1268,27 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
                         expected_subdir=archive_internal_dir,
                         local_archive=os.path.basename(existing_archive),
                         output_path=output_path,
-                        source_paths=source_paths,
+                        source_paths=needed_paths,
+                        staging_dir=staging_dir,
                     ).get("hpss", [])
                 )
 
+                for path in extracted_paths:
+                    if cache is not None:
+                        cache.store(
+                            f"{archive_key}:{path}",
+                            os.path.join(output_path, os.path.basename(path)),
+                        )
+                    if manifest is not None:
+                        manifest.record(
+                            f"{archive_key}:{path}",
+                            output_path,
+                            os.path.basename(path),
+                            started,
+                            elapsed,
+                            nbytes=nbytes,
+                        )
+
             # Once we go through all the archives, the union of all
             # "unavailable" files should equal the "expected" list of
             # files since clean_up_output_dir only reports on those that
@@ -595,6 +1304,262 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
     return {}
 
 
+def plan_hpss_retrieval(cla, file_names, store_specs, cycle_dates, archive_index):
+
+    # pylint: disable=too-many-locals
+
+    """Resolve every file requested for all cycle dates, ensemble groups,
+    members and forecast hours into a single retrieval plan grouped by
+    HPSS archive.
+
+    Arguments:
+      cla            Namespace object containing command line arguments
+      file_names     a list of file templates for files in the archives
+      store_specs    dict describing the hpss data store
+      cycle_dates    list of datetime objects to retrieve files for
+      archive_index  an HpssArchiveIndex that has already probed the
+                     candidate archives
+
+    Returns:
+      plan           dict whose keys are archive paths, in the order they
+                     should be extracted, and whose values are dicts
+                     mapping each path inside the archive to the list of
+                     targets it satisfies
+      targets        dict mapping each target, a (cycle_date, output_path,
+                     file_name) tuple, to the list of archive internal
+                     paths it may be extracted from
+    """
+
+    archive_paths, archive_file_names = get_archive_names(cla, store_specs)
+
+    archive_internal_dirs = store_specs.get("archive_internal_dir", [""])
+    if isinstance(archive_internal_dirs, dict):
+        archive_internal_dirs = archive_internal_dirs.get(cla.file_set, [""])
+
+    plan = {}
+    targets = {}
+    for cycle_date in cycle_dates:
+        for ens_group, members in get_ens_groups(cla.members).items():
+            existing_archives, _ = find_archive_files(
+                archive_paths,
+                archive_file_names,
+                cycle_date,
+                ens_group=ens_group,
+                archive_index=archive_index,
+            )
+            for mem in members:
+                output_path = fill_template(cla.output_path, cycle_date, mem=mem)
+                for fcst_hr in cla.fcst_hrs:
+                    for file_name in file_names:
+                        sources = []
+                        for archive_internal_dir_tmpl in archive_internal_dirs:
+                            sources.append(
+                                fill_template(
+                                    os.path.join(archive_internal_dir_tmpl, file_name),
+                                    cycle_date,
+                                    fcst_hr=fcst_hr,
+                                    mem=mem,
+                                    ens_group=ens_group,
+                                )
+                            )
+                        target = (cycle_date, output_path, os.path.basename(sources[0]))
+                        targets.setdefault(target, [])
+                        if not existing_archives:
+                            continue
+                        for existing_archive in existing_archives.values():
+                            archive_plan = plan.setdefault(existing_archive, {})
+                            for source in sources:
+                                archive_plan.setdefault(source, [])
+                                if target not in archive_plan[source]:
+                                    archive_plan[source].append(target)
+                                if source not in targets[target]:
+                                    targets[target].append(source)
+
+    n_files = sum(len(sources) for sources in plan.values())
+    logging.info(
+        f"Planned retrieval of {len(targets)} files for {len(cycle_dates)} "
+        f"cycles from {len(plan)} archives ({n_files} archive members)"
+    )
+    return plan, targets
+
+
+@contextmanager
+def staging_area(isolated):
+
+    """Context manager yielding the directory in which to fetch and
+    extract archives. When isolated is True, that is a new temporary
+    directory under the current working directory, removed on exit, so
+    that concurrent extractions cannot collide. Otherwise it is the
+    current working directory itself."""
+
+    if not isolated:
+        yield os.getcwd()
+        return
+    with tempfile.TemporaryDirectory(prefix="hpss_", dir=os.getcwd()) as staging_dir:
+        yield staging_dir
+
+
+def execute_hpss_plan(
+    plan, targets, store_specs, cache=None, max_workers=1, manifest=None
+):
+
+    # pylint: disable=too-many-locals
+
+    """Extract the files in a plan made by plan_hpss_retrieval, running
+    one htar (or hsi get and unzip) per archive for all the cycles and
+    members it serves, and copy each extracted file to every output
+    location that needs it.
+
+    With max_workers greater than one, that many archives are extracted
+    at once, each in its own staging directory. Files found in the cache,
+    or verified in place by the manifest, are not extracted again.
+
+    Returns a dict mapping each cycle date to the list of targets that
+    could not be retrieved for it."""
+
+    retrieved = set()
+    lock = threading.Lock()
+
+    def claim(target):
+        """Mark a target as being provided. Return False if some other
+        archive has already claimed it."""
+        with lock:
+            if target in retrieved:
+                return False
+            retrieved.add(target)
+            return True
+
+    def release(target):
+        with lock:
+            retrieved.discard(target)
+
+    def extract(item):
+        existing_archive, archive_plan = item
+
+        # Skip anything already provided by another archive or by the
+        # cache.
+        needed_paths = []
+        for source, source_targets in archive_plan.items():
+            pending = False
+            for target in source_targets:
+                if target in retrieved:
+                    continue
+                _, output_path, file_name = target
+                if (cache is not None or manifest is not None) and claim(target):
+                    create_target_path(output_path)
+                    if already_retrieved(
+                        f"{existing_archive}:{source}",
+                        output_path,
+                        file_name,
+                        cache,
+                        manifest,
+                    ):
+                        continue
+                    release(target)
+                pending = True
+            if pending:
+                needed_paths.append(source)
+
+        if not needed_paths:
+            return
+
+        with staging_area(max_workers > 1) as staging_dir:
+            archive_key = existing_archive
+            if store_specs.get("archive_format", "tar") == "zip":
+                existing_archive = hsi_single_file(
+                    existing_archive, mode="get", cwd=staging_dir
+                )
+                cmd = f'unzip -o {os.path.basename(existing_archive)} {" ".join(needed_paths)}'
+            else:
+                cmd = f'htar -xvf {existing_archive} {" ".join(needed_paths)}'
+
+            # A batched extraction may legitimately miss some members (e.g.
+            # paths under an alternate archive_internal_dir), so the result
+            # is judged by which files land on disk.
+            logging.info(f"Running command \n {cmd}")
+            started = time.time()
+            try:
+                subprocess.run(
+                    cmd,
+                    check=True,
+                    shell=True,
+                    cwd=staging_dir,
+                )
+            except subprocess.CalledProcessError as err:
+                logging.warning(err)
+            elapsed = time.time() - started
+
+            local_paths = [
+                os.path.join(staging_dir, source.lstrip("/")) for source in needed_paths
+            ]
+            nbytes = sum(
+                os.path.getsize(path) for path in local_paths if os.path.exists(path)
+            )
+
+            for source in needed_paths:
+                local_file_path = os.path.join(staging_dir, source.lstrip("/"))
+                if not os.path.exists(local_file_path):
+                    continue
+                in_place = False
+                for target in archive_plan[source]:
+                    _, output_path, file_name = target
+                    expected_output_loc = os.path.join(output_path, file_name)
+                    if not claim(target):
+                        continue
+                    if local_file_path == expected_output_loc:
+                        # Extracted straight into its output location
+                        in_place = True
+                    else:
+                        output_path = create_target_path(output_path)
+                        logging.info(
+                            f"Copying {local_file_path} to {expected_output_loc}"
+                        )
+                        shutil.copy2(local_file_path, expected_output_loc)
+                    if cache is not None:
+                        cache.store(f"{archive_key}:{source}", expected_output_loc)
+                    if manifest is not None:
+                        manifest.record(
+                            f"{archive_key}:{source}",
+                            output_path,
+                            file_name,
+                            started,
+                            elapsed,
+                            nbytes=nbytes,
+                        )
+                if not in_place:
+                    os.remove(local_file_path)
+
+            # Clean up directories from inside archive, if they exist
+            for source in needed_paths:
+                subdir = os.path.dirname(source.lstrip("/"))
+                if subdir and os.path.isdir(os.path.join(staging_dir, subdir)):
+                    try:
+                        remove_empty_dirs(subdir, staging_dir)
+                    except OSError:
+                        pass
+
+            local_archive = os.path.join(staging_dir, os.path.basename(existing_archive))
+            if os.path.exists(local_archive):
+                os.remove(local_archive)
+
+    if max_workers > 1:
+        logging.info(f"Extracting up to {max_workers} archives at once")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(extract, plan.items()))
+    else:
+        for item in plan.items():
+            extract(item)
+
+    unavailable = {}
+    for target in targets:
+        cycle_date = target[0]
+        unavailable.setdefault(cycle_date, [])
+        if target not in retrieved:
+            logging.info(f"File was not retrieved: {os.path.join(*target[1:])}")
+            unavailable[cycle_date].append(target)
+    return unavailable
+
+
 def load_str(arg):
 
     """Load a dict string safely using YAML. Return the resulting dict."""
@@ -793,11 +1758,26 @@ def main(argv):
             raise KeyError(msg)
         logging.info(msg)
 
-    unavailable = {}
+    cache = None
+    if cla.cache_dir:
+        cache = DataCache(cla.cache_dir, int(cla.cache_max_size * 1024**3))
+
+    manifest = None
+    if cla.summary_file:
+        manifest = RetrievalManifest(f"{cla.summary_file}.manifest.json")
+
+    cycle_dates = [cla.cycle_date]
+    if cla.cycle_range:
+        cycle_dates = cycle_date_range(cla.cycle_range)
+
+    # Cycles for which some files are still missing. Each data store is
+    # only asked for the cycles that earlier stores could not provide.
+    pending = cycle_dates
     for data_store in cla.data_stores:
         logging.info(f"Checking {data_store} for {cla.external_model}")
         store_specs = known_data_info.get(data_store, {})
 
+        unavailable = {}
         if data_store == "disk":
             file_templates = get_file_templates(
                 cla,
@@ -807,13 +1787,16 @@ def main(argv):
             )
 
             logging.debug(f"User supplied file names are: {file_templates}")
-            unavailable = get_requested_files(
-                cla,
-                check_all=known_data_info.get("check_all", False),
-                file_templates=file_templates,
-                input_locs=cla.input_file_path,
-                method="disk",
-            )
+            for cycle_date in pending:
+                unavailable[cycle_date] = get_requested_files(
+                    for_cycle(cla, cycle_date),
+                    check_all=known_data_info.get("check_all", False),
+                    file_templates=file_templates,
+                    input_locs=cla.input_file_path,
+                    method="disk",
+                    cache=cache,
+                    manifest=manifest,
+                )
 
         elif not store_specs:
             msg = f"No information is available for {data_store}."
@@ -828,41 +1811,133 @@ def main(argv):
             )
 
             if store_specs.get("protocol") == "download":
-                unavailable = get_requested_files(
-                    cla,
-                    check_all=known_data_info.get("check_all", False),
-                    file_templates=file_templates,
-                    input_locs=store_specs["url"],
-                    method="download",
-                    members=cla.members,
-                )
+                for cycle_date in pending:
+                    unavailable[cycle_date] = get_requested_files(
+                        for_cycle(cla, cycle_date),
+                        check_all=known_data_info.get("check_all", False),
+                        file_templates=file_templates,
+                        input_locs=store_specs["url"],
+                        method="download",
+                        members=cla.members,
+                        cache=cache,
+                        manifest=manifest,
+                    )
 
             if store_specs.get("protocol") == "htar":
                 ens_groups = get_ens_groups(cla.members)
-                for ens_group, members in ens_groups.items():
-                    unavailable = hpss_requested_files(
-                        cla,
-                        file_templates,
+
+                # Check for every candidate archive of every ensemble
+                # group and cycle in a single HPSS session.
+                archive_index = HpssArchiveIndex()
+                archive_index.probe(
+                    archive_candidates(
+                        *get_archive_names(cla, store_specs),
+                        cycle_dates=pending,
+                        ens_groups=list(ens_groups),
+                    )
+                )
+
+                if cla.cycle_range:
+                    plan, targets = plan_hpss_retrieval(
+                        cla, file_templates, store_specs, pending, archive_index
+                    )
+                    unavailable = execute_hpss_plan(
+                        plan,
+                        targets,
                         store_specs,
-                        members=members,
-                        ens_group=ens_group,
+                        cache=cache,
+                        max_workers=cla.max_workers,
+                        manifest=manifest,
                     )
+                else:
+                    isolated = cla.max_workers > 1 and len(ens_groups) > 1
+
+                    def retrieve_group(item):
+                        ens_group, members = item
+                        with staging_area(isolated) as staging_dir:
+                            return hpss_requested_files(
+                                cla,
+                                file_templates,
+                                store_specs,
+                                members=members,
+                                ens_group=ens_group,
+                                cache=cache,
+                                archive_index=archive_index,
+                                staging_dir=staging_dir,
+                                manifest=manifest,
+                            )
+
+                    if isolated:
+                        logging.info(
+                            f"Extracting up to {cla.max_workers} ensemble groups at once"
+                        )
+                        with ThreadPoolExecutor(max_workers=cla.max_workers) as executor:
+                            results = list(executor.map(retrieve_group, ens_groups.items()))
+                    else:
+                        results = [retrieve_group(item) for item in ens_groups.items()]
+
+                    # Files missing from any ensemble group leave the cycle
+                    # incomplete.
+                    unavailable[cla.cycle_date] = set().union(*results)
+
+        if cache is not None:
+            cache.evict()
+
+        # Write a variable definitions file for the data of each cycle
+        # now complete, if requested
+        for cycle_date in pending:
+            if not unavailable.get(cycle_date) and cla.summary_file:
+                write_summary_file(
+                    for_cycle(cla, cycle_date), data_store, file_templates
+                )
 
-        if not unavailable:
+        pending = [cycle_date for cycle_date in pending if unavailable.get(cycle_date)]
+        if not pending:
             # All files are found. Stop looking!
-            # Write a variable definitions file for the data, if requested
-            if cla.summary_file:
-                write_summary_file(cla, data_store, file_templates)
             break
 
         logging.debug(f"Some unavailable files: {unavailable}")
         logging.warning(f"Requested files are unavailable from {data_store}")
 
-    if unavailable:
+    if pending:
         logging.error("Could not find any of the requested files.")
         sys.exit(1)
 
 
+def cycle_date_range(args):
+
+    """
+    Given the --cycle_range argument, return the list of cycle dates to
+    process. The list holds a start and end cycle date in YYYYMMDDHH
+    format, both inclusive, and an optional increment in hours that
+    defaults to 24.
+    """
+
+    start, end = to_datetime(args[0]), to_datetime(args[1])
+    increment = dt.timedelta(hours=int(args[2]) if len(args) > 2 else 24)
+    if len(args) > 3 or increment <= dt.timedelta(0) or end < start:
+        raise argparse.ArgumentTypeError(
+            f"Invalid --cycle_range {' '.join(args)}. Expected START END [INCR_HRS]."
+        )
+
+    cycle_dates = []
+    cycle_date = start
+    while cycle_date <= end:
+        cycle_dates.append(cycle_date)
+        cycle_date += increment
+    return cycle_dates
+
+
+def for_cycle(cla, cycle_date):
+
+    """Return a copy of the command line arguments set up to retrieve
+    files for a single cycle date."""
+
+    cycle_cla = copy(cla)
+    cycle_cla.cycle_date = cycle_date
+    return cycle_cla
+
+
 def get_ens_groups(members):
 
     """Given a list of ensemble members, return a dict with keys for
@@ -925,6 +2000,16 @@ def parse_args(argv):
         default="1999123100",
         type=to_datetime,
     )
+    parser.add_argument(
+        "--cycle_range",
+        help="Start and end cycle dates in YYYYMMDDHH format and an \
+        optional increment in hours (default 24) describing several \
+        cycles to retrieve in one run. Overrides --cycle_date. All \
+        files for all cycles are planned up front so that each HPSS \
+        archive is only extracted from once. Templates in \
+        --output_path are filled in for each cycle.",
+        nargs="+",
+    )
     parser.add_argument(
         "--data_stores",
         help="List of priority data_stores. Tries first list item \
@@ -1024,7 +2109,39 @@ def parse_args(argv):
     parser.add_argument(
         "--summary_file",
         help="Name of the summary file to be written to the output \
-        directory",
+        directory. A JSON manifest of the retrieved files, named like \
+        the summary file with .manifest.json appended, is written next \
+        to it, and files it shows are already retrieved and intact are \
+        skipped when the script is rerun.",
+    )
+    parser.add_argument(
+        "--max_workers",
+        help="Number of files to retrieve concurrently when the data \
+        store protocol is download or the data are on disk, or number \
+        of HPSS archives to extract concurrently. default=1",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Path to a directory holding a cache of retrieved files \
+        that may be shared between experiments. Files found in the \
+        cache are linked into the output path instead of being \
+        retrieved again.",
+    )
+    parser.add_argument(
+        "--cache_max_size",
+        help="Size in GB at which least recently used files are evicted \
+        from the cache. default=100",
+        default=100.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--max_per_host",
+        help="Maximum number of concurrent downloads from a single \
+        host when --max_workers is greater than 1. default=4",
+        default=4,
+        type=int,
     )
     return parser.parse_args(argv)
 
@@ -27,7 +27,7 @@ from python_utils import (
 from set_namelist import set_namelist
 
 
-def set_FV3nml_ens_stoch_seeds(cdate):
+def set_FV3nml_ens_stoch_seeds(cdate, ensmem_indx=None, run_dir=None):
     """
     This function, for an ensemble-enabled experiment
     (i.e. for an experiment for which the workflow configuration variable
@@ -41,6 +41,8 @@ def set_FV3nml_ens_stoch_seeds(cdate):
 
     Args:
         cdate
+        ensmem_indx: ensemble member index (default=ENSMEM_INDX)
+        run_dir: member run directory (default=current directory)
     Returns:
         None
     """
@@ -58,9 +60,11 @@ def set_FV3nml_ens_stoch_seeds(cdate):
     #
     # -----------------------------------------------------------------------
     #
-    fv3_nml_ensmem_fp = f"{os.getcwd()}{os.sep}{FV3_NML_FN}"
+    if run_dir is None:
+        run_dir = os.getcwd()
+    fv3_nml_ensmem_fp = f"{run_dir}{os.sep}{FV3_NML_FN}"
 
-    ensmem_num = ENSMEM_INDX
+    ensmem_num = ENSMEM_INDX if ensmem_indx is None else int(ensmem_indx)
 
     cdate_i = int(cdate.strftime("%Y%m%d%H"))
 
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
+import glob
 import datetime
 import traceback
 import logging
@@ -24,6 +26,8 @@ from python_utils import (
     get_env_var,
     load_config_file,
     cfg_to_shell_str,
+    cfg_to_shell_files,
+    shell_sections_dir,
     cfg_to_yaml_str,
     load_ini_config,
     get_ini_value,
@@ -372,7 +376,10 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     extend_yaml(expt_config)
     preexisting_dir_method = workflow_config.get("PREEXISTING_DIR_METHOD", "")
     try:
-        check_for_preexist_dir_file(exptdir, preexisting_dir_method)
+        # With "update", the existing experiment directory is kept and only
+        # the files whose inputs changed are regenerated
+        if preexisting_dir_method != "update":
+            check_for_preexist_dir_file(exptdir, preexisting_dir_method)
     except ValueError:
         logger.exception(
             f"""
@@ -1220,6 +1227,27 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
                       {dir_key} = \"{task_dir}\"'''
                 )
 
+    # When an existing experiment is updated after its TN_MAKE_GRID task ran,
+    # take the resolution from the grid files that task linked into FIXlam,
+    # so that the values of CRES that task set in var_defns.sh and in the
+    # namelist are kept.
+    if (
+        workflow_switches["RUN_TASK_MAKE_GRID"]
+        and not res_in_fixlam_filenames
+        and preexisting_dir_method == "update"
+    ):
+        grid_links = glob.glob(
+            os.path.join(
+                workflow_config["FIXlam"],
+                f"C*{workflow_config['DOT_OR_USCORE']}grid.tile"
+                f"{expt_config['constants']['TILE_RGNL']}.nc",
+            )
+        )
+        if grid_links:
+            res_in_fixlam_filenames = re.match(
+                r"C(\d+)", os.path.basename(grid_links[0])
+            ).group(1)
+
     workflow_config["RES_IN_FIXLAM_FILENAMES"] = res_in_fixlam_filenames
     workflow_config["CRES"] = f"C{res_in_fixlam_filenames}"
 
@@ -1345,9 +1373,20 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
         configuration file ('{user_config_fn}')."""
     )
 
-    with open(global_var_defns_fp, "a") as f:
+    # Overwrite rather than append, since the file is already there when
+    # an existing experiment is updated (PREEXISTING_DIR_METHOD = "update")
+    with open(global_var_defns_fp, "w") as f:
         f.write(cfg_to_shell_str(expt_config))
 
+    # Also store each section of var_defns.sh in its own file, so that tasks
+    # can source the sections they need without starting Python. They are
+    # written from the file as read back by load_config_file, which is what
+    # tasks used to source, so the variables are the same.
+    cfg_to_shell_files(
+        load_config_file(global_var_defns_fp, 2),
+        shell_sections_dir(global_var_defns_fp),
+    )
+
     #
     # -----------------------------------------------------------------------
     #
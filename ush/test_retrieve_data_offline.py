@@ -0,0 +1,361 @@
+"""
+Unit tests for the parts of retrieve_data.py that need neither network
+nor HPSS access: the retrieval planning, the HPSS listing parser, the
+download throttling, the retrieval manifest and the data cache.
+
+To run them, issue the following command from the ush directory:
+
+    python3 -m unittest -b test_retrieve_data_offline.py
+"""
+import argparse
+import datetime as dt
+import errno
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import unittest
+from contextlib import ExitStack
+from unittest import mock
+
+import retrieve_data
+
+
+class StubArchiveIndex:
+
+    """An archive index that knows which archives exist without hsi"""
+
+    def __init__(self, existing):
+        self.existing = set(existing)
+
+    def exists(self, file_path):
+        return file_path in self.existing
+
+
+class PlanningTesting(unittest.TestCase):
+
+    """Tests of the multi-cycle retrieval planning"""
+
+    def test_cycle_date_range(self):
+        self.assertEqual(
+            retrieve_data.cycle_date_range(["2022101800", "2022101900", "12"]),
+            [
+                dt.datetime(2022, 10, 18, 0),
+                dt.datetime(2022, 10, 18, 12),
+                dt.datetime(2022, 10, 19, 0),
+            ],
+        )
+        # The increment defaults to a day, and the end is inclusive only
+        # when it falls on an increment
+        self.assertEqual(
+            retrieve_data.cycle_date_range(["2022101800", "2022102006"]),
+            [dt.datetime(2022, 10, d, 0) for d in (18, 19, 20)],
+        )
+        self.assertEqual(
+            retrieve_data.cycle_date_range(["2022101806", "2022101806"]),
+            [dt.datetime(2022, 10, 18, 6)],
+        )
+
+    def test_cycle_date_range_invalid(self):
+        for args in [
+            ["2022101900", "2022101800"],
+            ["2022101800", "2022101900", "0"],
+            ["2022101800", "2022101900", "-6"],
+            ["2022101800", "2022101900", "6", "6"],
+        ]:
+            with self.subTest(args=args):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    retrieve_data.cycle_date_range(args)
+
+    def test_plan_hpss_retrieval(self):
+        cla = argparse.Namespace(
+            file_set="fcst",
+            file_type=None,
+            fcst_hrs=[0, 6],
+            members=[1, 2, 11],
+            output_path="/out/{yyyymmddhh}/mem{mem:03d}",
+        )
+        store_specs = {
+            "archive_path": ["/BMC/gefs/{yyyy}"],
+            "archive_file_names": ["{yyyymmdd}_grp{ens_group}.tar"],
+        }
+        # The same file requested twice is only extracted once
+        file_names = ["{hh}/mem{mem:03d}/f{fcst_hr:03d}.grib2"] * 2
+        cycle_dates = retrieve_data.cycle_date_range(
+            ["2022101800", "2022101900", "12"]
+        )
+        # The archives of the 19th are missing
+        archive_index = StubArchiveIndex(
+            ["/BMC/gefs/2022/20221018_grp1.tar", "/BMC/gefs/2022/20221018_grp2.tar"]
+        )
+
+        plan, targets = retrieve_data.plan_hpss_retrieval(
+            cla, file_names, store_specs, cycle_dates, archive_index
+        )
+
+        # Each archive appears once, whatever the cycles and members it serves
+        self.assertEqual(
+            list(plan),
+            ["/BMC/gefs/2022/20221018_grp1.tar", "/BMC/gefs/2022/20221018_grp2.tar"],
+        )
+        group1 = plan["/BMC/gefs/2022/20221018_grp1.tar"]
+        self.assertEqual(
+            sorted(group1),
+            sorted(
+                f"{hh}/mem{mem:03d}/f{fcst_hr:03d}.grib2"
+                for hh in ("00", "12")
+                for mem in (1, 2)
+                for fcst_hr in (0, 6)
+            ),
+        )
+        self.assertEqual(
+            group1["12/mem002/f006.grib2"],
+            [(cycle_dates[1], "/out/2022101812/mem002", "f006.grib2")],
+        )
+        self.assertEqual(
+            sorted(plan["/BMC/gefs/2022/20221018_grp2.tar"]),
+            [
+                "00/mem011/f000.grib2",
+                "00/mem011/f006.grib2",
+                "12/mem011/f000.grib2",
+                "12/mem011/f006.grib2",
+            ],
+        )
+
+        # Every file of every cycle is a target, even when no archive has it
+        self.assertEqual(len(targets), 3 * 3 * 2)
+        self.assertEqual(
+            targets[(cycle_dates[0], "/out/2022101800/mem011", "f000.grib2")],
+            ["00/mem011/f000.grib2"],
+        )
+        self.assertEqual(
+            targets[(cycle_dates[2], "/out/2022101900/mem001", "f000.grib2")], []
+        )
+
+
+class HpssArchiveIndexTesting(unittest.TestCase):
+
+    """Tests of the batched HPSS listing"""
+
+    LISTING = (
+        "FILE /BMC/fdr/a.tar 1048576 1048576 2 TAPE 0 0 10/18/2022 12:00:00\n"
+        "*** hpss_Lstat: No such file or directory [-2: HPSS_ENOENT]\n"
+        "    /BMC/fdr/b.tar\n"
+    )
+
+    def run_hsi(self, returncode, stdout):
+        return mock.patch(
+            "subprocess.run",
+            return_value=subprocess.CompletedProcess("hsi", returncode, stdout),
+        )
+
+    def test_probe(self):
+        index = retrieve_data.HpssArchiveIndex()
+        with self.run_hsi(64, self.LISTING) as run:
+            index.probe(["/BMC/fdr/a.tar", "/BMC/fdr/b.tar"])
+            self.assertTrue(index.exists("/BMC/fdr/a.tar"))
+            self.assertFalse(index.exists("/BMC/fdr/b.tar"))
+        # All paths were listed in one call, and never listed again
+        self.assertEqual(run.call_count, 1)
+        self.assertIn("/BMC/fdr/a.tar /BMC/fdr/b.tar", run.call_args[0][0])
+
+    def test_probe_hsi_failure(self):
+        index = retrieve_data.HpssArchiveIndex()
+        with self.run_hsi(72, "hsi: Authentication failed\n"):
+            with self.assertLogs(level="ERROR"):
+                self.assertFalse(index.exists("/BMC/fdr/a.tar"))
+        # The path is tried again once hsi works
+        with self.run_hsi(0, self.LISTING):
+            self.assertTrue(index.exists("/BMC/fdr/a.tar"))
+
+
+class DataCacheTesting(unittest.TestCase):
+
+    """Tests of the shared data cache"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = retrieve_data.DataCache(
+            os.path.join(self.tmp_dir.name, "cache"), max_size=100
+        )
+        self.output_dir = os.path.join(self.tmp_dir.name, "output")
+        os.makedirs(self.output_dir)
+
+    def make_file(self, file_name, contents):
+        path = os.path.join(self.tmp_dir.name, file_name)
+        with open(path, "w") as data_file:
+            data_file.write(contents)
+        return path
+
+    def object_path(self, key):
+        with open(self.cache._index_path(key), "r") as index_file:
+            return self.cache._object_path(json.load(index_file)["checksum"])
+
+    def test_store_fetch(self):
+        path = self.make_file("gfs.t00z.atmf000.nc", "atmf000")
+        self.cache.store("url:7:etag", path)
+        self.assertTrue(self.cache.fetch("url:7:etag", self.output_dir, "atmf000.nc"))
+
+        fetched = os.path.join(self.output_dir, "atmf000.nc")
+        with open(fetched, "r") as data_file:
+            self.assertEqual(data_file.read(), "atmf000")
+        self.assertTrue(os.path.samefile(fetched, self.object_path("url:7:etag")))
+        # The retrieved file was copied into the cache, not linked
+        self.assertFalse(os.path.samefile(path, fetched))
+        self.assertFalse(self.cache.fetch("other", self.output_dir, "other.nc"))
+
+    def test_stale_index(self):
+        path = self.make_file("atmf000.nc", "atmf000")
+        self.cache.store("atmf000", path)
+        # Another task evicts the object after the index entry was read
+        os.remove(self.object_path("atmf000"))
+        self.assertFalse(self.cache.fetch("atmf000", self.output_dir, "atmf000.nc"))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "atmf000.nc")))
+
+    def test_evict_lru(self):
+        # Three 48 byte objects, of which only two fit in max_size
+        for age, name in enumerate(["newest", "middle", "oldest"]):
+            self.cache.store(name, self.make_file(name, name * 8))
+            mtime = 1_000_000 - 100 * age
+            os.utime(self.object_path(name), (mtime, mtime))
+
+        # Using the oldest object makes it the most recently used
+        self.assertTrue(self.cache.fetch("oldest", self.output_dir, "oldest"))
+        self.cache.evict()
+
+        self.assertFalse(self.cache.fetch("middle", self.output_dir, "middle"))
+        self.assertFalse(os.path.exists(self.cache._index_path("middle")))
+        for name in ["newest", "oldest"]:
+            self.assertTrue(self.cache.fetch(name, self.output_dir, name))
+
+        # Nothing more is evicted once the cache fits
+        self.cache.evict()
+        self.assertTrue(self.cache.fetch("newest", self.output_dir, "newest"))
+
+    def test_place_copy_fallback(self):
+        path = self.make_file("atmf000.nc", "atmf000")
+        self.cache.store("atmf000", path)
+        fetched = os.path.join(self.output_dir, "atmf000.nc")
+
+        for err in [errno.EXDEV, errno.EPERM]:
+            with self.subTest(errno=errno.errorcode[err]):
+                if os.path.exists(fetched):
+                    os.remove(fetched)
+                with mock.patch("os.link", side_effect=OSError(err, os.strerror(err))):
+                    self.assertTrue(
+                        self.cache.fetch("atmf000", self.output_dir, "atmf000.nc")
+                    )
+                with open(fetched, "r") as data_file:
+                    self.assertEqual(data_file.read(), "atmf000")
+                self.assertFalse(
+                    os.path.samefile(fetched, self.object_path("atmf000"))
+                )
+
+        # Any other error is not hidden by copying
+        with mock.patch("os.link", side_effect=OSError(errno.EIO, "I/O error")):
+            with self.assertRaises(OSError):
+                self.cache.fetch("atmf000", self.output_dir, "other.nc")
+
+
+class HostThrottleTesting(unittest.TestCase):
+
+    """Tests of the per-host download throttling"""
+
+    URL = "https://noaa-gfs-bdp-pds.s3.amazonaws.com/gfs.20221018/00/atmf000.nc"
+
+    def test_max_per_host(self):
+        throttle = retrieve_data.HostThrottle(max_per_host=2)
+        with ExitStack() as stack:
+            for _ in range(2):
+                stack.enter_context(throttle.slot(self.URL))
+
+            # A third transfer from the same host waits for a free slot
+            started = []
+
+            def transfer():
+                with throttle.slot(self.URL):
+                    started.append(self.URL)
+
+            waiting = threading.Thread(target=transfer)
+            waiting.start()
+            waiting.join(timeout=0.2)
+            self.assertEqual(started, [])
+
+            # Other hosts are not held up
+            with throttle.slot("https://nomads.ncep.noaa.gov/gfs.t00z.pgrb2.0p25.f000"):
+                pass
+
+        waiting.join(timeout=5)
+        self.assertEqual(started, [self.URL])
+
+    def test_backoff(self):
+        throttle = retrieve_data.HostThrottle(max_delay=5.0)
+        host = throttle.host(self.URL)
+
+        delays = []
+        for _ in range(5):
+            throttle.record(self.URL, success=False)
+            delays.append(throttle._delays[host])
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 5.0, 5.0])
+
+        # The next transfer waits out the delay
+        with mock.patch("time.sleep") as sleep:
+            with throttle.slot(self.URL):
+                pass
+        self.assertEqual(sleep.call_count, 1)
+        self.assertAlmostEqual(sleep.call_args[0][0], 5.0, delta=1.0)
+
+        delays = []
+        for _ in range(4):
+            throttle.record(self.URL, success=True)
+            delays.append(throttle._delays[host])
+        self.assertEqual(delays, [2.5, 1.25, 0.625, 0.0])
+
+        # A healthy host is not slowed down at all
+        with mock.patch("time.sleep") as sleep:
+            with throttle.slot(self.URL):
+                pass
+        sleep.assert_not_called()
+
+
+class RetrievalManifestTesting(unittest.TestCase):
+
+    """Tests of the retrieval manifest"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.output_dir = self.tmp_dir.name
+        self.path = os.path.join(self.output_dir, "atmf000.nc")
+        self.write("atmf000")
+        self.source = "https://noaa-gfs-bdp-pds.s3.amazonaws.com/atmf000.nc"
+        retrieve_data.RetrievalManifest("manifest.json").record(
+            self.source, self.output_dir, "atmf000.nc", started=0.0, elapsed=1.0
+        )
+
+    def write(self, contents):
+        with open(self.path, "w") as data_file:
+            data_file.write(contents)
+
+    def verified(self, source=None):
+        # A new manifest reads the one saved by record() from disk
+        manifest = retrieve_data.RetrievalManifest("manifest.json")
+        return manifest.verified(source or self.source, self.output_dir, "atmf000.nc")
+
+    def test_verified(self):
+        self.assertTrue(self.verified())
+        self.assertFalse(self.verified(source="/scratch/atmf000.nc"))
+
+    def test_size_changed(self):
+        self.write("atmf000 truncated")
+        self.assertFalse(self.verified())
+
+    def test_checksum_changed(self):
+        self.write("atmf001")
+        self.assertFalse(self.verified())
+
+    def test_missing(self):
+        os.remove(self.path)
+        self.assertFalse(self.verified())